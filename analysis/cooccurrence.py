@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+DEFAULT_MIN_FACETS_PER_BOARDGAME = 2
+
+
+def compute_cooccurrence(incidence_matrix, min_facets_per_boardgame=DEFAULT_MIN_FACETS_PER_BOARDGAME):
+    """
+    Computes the co-occurrence matrix ``C = X^T X`` of the board game x facet matrix ``X``, i.e., ``C[i, j]`` is
+    the number of board games that are linked to both the category (mechanic, etc.) ``i`` and ``j`` and the
+    diagonal ``C[i, i]`` is the number of board games of ``i``.
+
+    :param incidence_matrix: the ``IncidenceMatrix`` (see ``analysis.incidence``) of the facet
+    :param min_facets_per_boardgame: only count the board games that are linked to at least this many categories
+    (mechanics, etc.), by default the board games that can not form an edge are left out of the diagonal as well
+    :return: a symmetric ``scipy.sparse.csr_matrix`` whose rows and columns are the ``facet_ids``
+    """
+    matrix = incidence_matrix.matrix
+    rows = np.flatnonzero(incidence_matrix.get_row_sums() >= min_facets_per_boardgame)
+    matrix = matrix[rows].astype(np.int64)
+    return (matrix.T @ matrix).tocsr()
+
+
+def create_cooccurrence_edges(incidence_matrix, min_facets_per_boardgame=DEFAULT_MIN_FACETS_PER_BOARDGAME):
+    """
+    Creates the weighted edges between all categories (mechanics, etc.) that share at least one board game.
+
+    The weight of the edge between ``c_0`` and ``c_1`` is the overlap from the perspective of ``c_0``, i.e.,
+    (number of games with ``c_0`` and ``c_1``) / (number of games with ``c_0``) * 100, plus the overlap from the
+    perspective of ``c_1``, so the maximum is 200. The number of games of a category is the diagonal of
+    ``compute_cooccurrence``.
+
+    :param incidence_matrix: the ``IncidenceMatrix`` (see ``analysis.incidence``) of the facet
+    :return: a ``DataFrame`` with the columns ``Source``, ``Target`` (the facet ids, ``Source < Target``) and
+    ``Weight`` ordered by ``Source`` and ``Target``
+    """
+    cooccurrence = compute_cooccurrence(incidence_matrix, min_facets_per_boardgame)
+    counts = cooccurrence.diagonal()
+    upper = sparse.triu(cooccurrence, k=1).tocoo()
+    order = np.lexsort((upper.col, upper.row))
+    sources, targets, overlaps = upper.row[order], upper.col[order], upper.data[order]
+    weights = overlaps / counts[sources] * 100 + overlaps / counts[targets] * 100
+    facet_ids = np.asarray(incidence_matrix.facet_ids)
+    return pd.DataFrame({"Source": facet_ids[sources], "Target": facet_ids[targets], "Weight": weights})
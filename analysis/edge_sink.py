@@ -0,0 +1,206 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# A binary edge file is a ``.npy`` file of these records, i.e., 24 bytes per edge
+EDGE_DTYPE = np.dtype([("source", "<i8"), ("target", "<i8"), ("weight", "<f8")])
+DEFAULT_CHUNK_SIZE = 2 * 1024 * 1024  # number of edges that are read at once by select_edges
+
+
+class EdgeSink:
+    """
+    Writes edges to a binary edge file (see ``EDGE_DTYPE``) as soon as they are added, so they are never all in
+    memory at once. The file can be memory-mapped with ``load_edges``.
+
+    The edges are written to a temporary file that replaces ``filename`` when the sink is closed, it is removed if
+    the sink is left because of an exception.
+
+    :param filename: the ``.npy`` file
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.num_edges = 0
+        self._temp_filename = filename + ".tmp"
+        self._file = open(self._temp_filename, "wb")
+        self._write_header()
+
+    def add(self, sources, targets, weights):
+        records = np.empty(len(weights), dtype=EDGE_DTYPE)
+        records["source"] = sources
+        records["target"] = targets
+        records["weight"] = weights
+        self._file.write(records.tobytes())
+        self.num_edges += len(records)
+
+    def add_df(self, edges_df, source_column="Source", target_column="Target", weight_column="Weight"):
+        self.add(edges_df[source_column].values, edges_df[target_column].values, edges_df[weight_column].values)
+
+    def close(self):
+        self._file.seek(0)
+        self._write_header()  # the header has room for any number of edges, so it is overwritten in place
+        self._file.close()
+        os.replace(self._temp_filename, self.filename)
+
+    def _write_header(self):
+        np.lib.format.write_array_header_1_0(self._file, {"descr": np.lib.format.dtype_to_descr(EDGE_DTYPE),
+                                                          "fortran_order": False, "shape": (self.num_edges,)})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self._temp_filename)
+
+
+def write_edge_file(edges_dfs, filename):
+    """
+    Writes the ``DataFrame``s of edges (e.g., of ``analysis.parallel.iter_parallel_similarity_edges``) to a
+    binary edge file one after the other.
+
+    :return: the number of edges
+    """
+    with EdgeSink(filename) as sink:
+        for edges_df in edges_dfs:
+            sink.add_df(edges_df)
+    return sink.num_edges
+
+
+def load_edges(filename):
+    """
+    :return: the memory-mapped records (see ``EDGE_DTYPE``) of the binary edge file
+    """
+    return np.load(filename, mmap_mode="r")
+
+
+def count_degrees(edges, node_ids=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Counts the edges of every node, one chunk of edges at a time. The nodes have to be non-negative integers.
+
+    :param edges: the records of a binary edge file
+    :param node_ids: only count the edges of these nodes (all if ``None``)
+    :return: an array with the number of edges of every node (indexed by the node)
+    """
+    degrees = np.zeros(0, dtype=np.int64)
+    for start in range(0, len(edges), chunk_size):
+        chunk = edges[start:start + chunk_size]
+        nodes = np.concatenate([chunk["source"], chunk["target"]])
+        if node_ids is not None:
+            nodes = nodes[np.isin(nodes, node_ids)]
+        counts = np.bincount(nodes)
+        if len(counts) > len(degrees):
+            degrees = np.append(degrees, np.zeros(len(counts) - len(degrees), dtype=np.int64))
+        degrees[:len(counts)] += counts
+    return degrees
+
+
+def select_edges(edges, keep_percentage, node_ids=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Selects the same edges as ``analysis.pruning.get_kept_edges`` (including how ties are broken) without having
+    all edges in memory at once.
+
+    The number of edges every node keeps is known after counting the edges of every node (see
+    ``count_degrees``). The edges are then read one chunk at a time and merged into the edges every node has kept
+    so far, of which only the best ones up to the number of edges the node keeps remain. Once a node keeps as many
+    edges as it may, the edges that are worse than its worst one are skipped right away. So the memory is bounded
+    by the size of a chunk plus the number of kept edges (including the ones that are always kept), whatever the
+    number of edges is.
+
+    :param edges: the records of a binary edge file, e.g., of ``load_edges``
+    :param keep_percentage: e.g., ``0.2`` keeps the 20% most important edges of every node
+    :param node_ids: only these nodes choose edges to keep (all if ``None``), edges between two other nodes are
+    always kept
+    :return: the sorted positions of the kept edges
+    """
+    num_edges = len(edges)
+    if node_ids is not None:
+        node_ids = np.asarray(node_ids)
+    keep_counts = (count_degrees(edges, node_ids, chunk_size) * keep_percentage).astype(np.int64)
+    is_full = np.zeros(len(keep_counts), dtype=bool)
+    worst_weights = np.zeros(len(keep_counts), dtype=np.float64)
+    worst_keys = np.zeros(len(keep_counts), dtype=np.int64)
+
+    # Every (node, edge) that is kept so far ordered by the node, then by the weight (descending, NaN last) and
+    # then by the key, which is the position of the edge if the node is its source and num_edges + the position if
+    # it is the target, i.e., the order of get_kept_edges
+    kept = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int64))
+    always_kept = []
+    for start in range(0, num_edges, chunk_size):
+        chunk = edges[start:start + chunk_size]
+        positions = np.arange(start, start + len(chunk), dtype=np.int64)
+        is_voting = [None, None]
+        if node_ids is not None:
+            is_voting = [np.isin(chunk["source"], node_ids), np.isin(chunk["target"], node_ids)]
+            always_kept.append(positions[~is_voting[0] & ~is_voting[1]])
+        candidates = []
+        for role, column in enumerate(["source", "target"]):
+            nodes, weights, keys = chunk[column].astype(np.int64), chunk["weight"].astype(np.float64), \
+                positions + role * num_edges
+            if is_voting[role] is not None:
+                nodes, weights, keys = nodes[is_voting[role]], weights[is_voting[role]], keys[is_voting[role]]
+            # NaN weights are never skipped, they are only worse than the worst edge if it has a weight
+            is_skipped = (keep_counts[nodes] == 0) | (is_full[nodes] & (
+                (weights < worst_weights[nodes]) | ((weights == worst_weights[nodes]) & (keys > worst_keys[nodes]))))
+            candidates.append((nodes[~is_skipped], weights[~is_skipped], keys[~is_skipped]))
+        nodes, weights, keys = [np.concatenate(columns) for columns in zip(*candidates)]
+        # The candidates are ordered by the key, two stable sorts order them like the kept edges
+        order = np.argsort(-weights, kind="stable")
+        order = order[np.argsort(nodes[order], kind="stable")]
+        nodes, weights, keys = nodes[order], weights[order], keys[order]
+
+        insert_positions = _get_insert_positions(kept, nodes, weights, keys)
+        nodes, weights, keys = [np.insert(kept_column, insert_positions, column)
+                                for kept_column, column in zip(kept, (nodes, weights, keys))]
+        group_starts = np.flatnonzero(np.concatenate([[True], nodes[1:] != nodes[:-1]]))
+        ranks = np.arange(len(nodes)) - np.repeat(group_starts, np.diff(np.append(group_starts, len(nodes))))
+        is_worst = ranks == keep_counts[nodes] - 1
+        is_full[nodes[is_worst]] = True
+        worst_weights[nodes[is_worst]] = weights[is_worst]
+        worst_keys[nodes[is_worst]] = keys[is_worst]
+        is_kept = ranks < keep_counts[nodes]
+        kept = (nodes[is_kept], weights[is_kept], keys[is_kept])
+    return np.unique(np.concatenate([kept[2] % max(1, num_edges)] + always_kept))
+
+
+def _get_insert_positions(kept, nodes, weights, keys):
+    """
+    Finds the position of every (node, weight, key) in the sorted kept edges (see ``select_edges``) with a binary
+    search within the kept edges of the node, all of them at once.
+    """
+    kept_nodes, kept_weights, kept_keys = kept
+    lows = np.searchsorted(kept_nodes, nodes, side="left")
+    highs = np.searchsorted(kept_nodes, nodes, side="right")
+    for _ in range(int(np.max(highs - lows, initial=0)).bit_length()):
+        is_searching = lows < highs
+        middles = (lows + highs) // 2
+        valid_middles = np.minimum(middles, len(kept_nodes) - 1)
+        is_before = _is_before(kept_weights[valid_middles], kept_keys[valid_middles], weights, keys)
+        lows = np.where(is_searching & is_before, middles + 1, lows)
+        highs = np.where(is_searching & ~is_before, middles, highs)
+    return lows
+
+
+def _is_before(weights, keys, other_weights, other_keys):
+    """
+    :return: ``True`` where (weight, key) comes first when sorted by the weight (descending, NaN last) and the key
+    """
+    is_nan, is_other_nan = np.isnan(weights), np.isnan(other_weights)
+    is_tie = (weights == other_weights) | (is_nan & is_other_nan)
+    return (weights > other_weights) | (~is_nan & is_other_nan) | (is_tie & (keys < other_keys))
+
+
+def prune_edge_file(filename, keep_percentage, node_ids=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Returns the edges of the binary edge file that are kept by ``select_edges`` (in the same order) as a
+    ``DataFrame`` with the columns ``Source``, ``Target`` and ``Weight``, i.e., the same edges as
+    ``analysis.pruning.prune_edges`` of the whole file.
+    """
+    edges = load_edges(filename)
+    kept_edges = edges[select_edges(edges, keep_percentage, node_ids=node_ids, chunk_size=chunk_size)]
+    return pd.DataFrame({"Source": kept_edges["source"], "Target": kept_edges["target"],
+                         "Weight": kept_edges["weight"]})
@@ -0,0 +1,193 @@
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select, func
+
+from data_collection.database.tables import BoardGame, Category, CategoryToBoardGame, Mechanic, \
+    MechanicToBoardGame, Family, FamilyToBoardGame, Designer, DesignerToBoardGame, Artist, ArtistToBoardGame, \
+    Publisher, PublisherToBoardGame
+
+# facet: (dimension table, link table, column of the link table)
+FACETS = {
+    "categories": (Category, CategoryToBoardGame, "category_id"),
+    "mechanics": (Mechanic, MechanicToBoardGame, "mechanic_id"),
+    "families": (Family, FamilyToBoardGame, "family_id"),
+    "designers": (Designer, DesignerToBoardGame, "designer_id"),
+    "artists": (Artist, ArtistToBoardGame, "artist_id"),
+    "publishers": (Publisher, PublisherToBoardGame, "publisher_id"),
+}
+DEFAULT_CACHE_DIRECTORY = os.path.join("data", "incidence")
+
+
+class IncidenceMatrix:
+    """
+    The sparse board game x facet (e.g., categories) matrix, where ``matrix[i, j] == 1`` if the board game of
+    row ``i`` is linked to the facet of column ``j``.
+
+    The rows are all board games ordered by their id and the columns are all entries of the facet table ordered by
+    their id, so the rows of the matrices of different facets line up.
+
+    :param facet: the name of the facet, see ``FACETS``
+    :param matrix: a ``scipy.sparse.csr_matrix``
+    :param boardgame_ids: the id (in the database) of the board game of every row
+    :param facet_ids: the id (in the database) of the category, mechanic, etc. of every column
+    """
+
+    def __init__(self, facet, matrix, boardgame_ids, facet_ids):
+        self.facet = facet
+        self.matrix = matrix
+        self.boardgame_ids = boardgame_ids
+        self.facet_ids = facet_ids
+        self._csc = None
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def csc(self):
+        """
+        The matrix in CSC format (cached), for fast access to the board games of a facet.
+        """
+        if self._csc is None:
+            self._csc = self.matrix.tocsc()
+        return self._csc
+
+    def get_row_indices(self, boardgame_ids):
+        return _get_indices(self.boardgame_ids, boardgame_ids, "board game")
+
+    def get_column_indices(self, facet_ids):
+        return _get_indices(self.facet_ids, facet_ids, self.facet)
+
+    def get_facet_ids(self, boardgame_id):
+        """
+        Returns the ids of the categories, mechanics, etc. of the board game.
+        """
+        row_index = self.get_row_indices([boardgame_id])[0]
+        return self.facet_ids[self.matrix.indices[self.matrix.indptr[row_index]:self.matrix.indptr[row_index + 1]]]
+
+    def get_boardgame_ids(self, facet_id):
+        """
+        Returns the ids of the board games that are linked to the category, mechanic, etc.
+        """
+        column_index = self.get_column_indices([facet_id])[0]
+        return self.boardgame_ids[self.csc.indices[self.csc.indptr[column_index]:self.csc.indptr[column_index + 1]]]
+
+    def get_row_sums(self):
+        """
+        Returns the number of categories, mechanics, etc. of every board game.
+        """
+        return np.diff(self.matrix.indptr)
+
+    def get_column_sums(self):
+        """
+        Returns the number of board games of every category, mechanic, etc.
+        """
+        return np.diff(self.csc.indptr)
+
+
+def _get_indices(sorted_ids, ids, name):
+    ids = np.asarray(ids)
+    indices = np.searchsorted(sorted_ids, ids)
+    found = (indices < len(sorted_ids)) & (sorted_ids[np.minimum(indices, len(sorted_ids) - 1)] == ids)
+    if not found.all():
+        raise KeyError("Unknown {0} ids: {1}".format(name, ids[~found][:10].tolist()))
+    return indices
+
+
+def build_incidence_matrix(engine, facet):
+    """
+    Builds the ``IncidenceMatrix`` of the facet (e.g., ``"categories"``, see ``FACETS``) with three queries.
+    """
+    model, link_model, link_column = FACETS[facet]
+    boardgames = BoardGame.__table__
+    table = model.__table__
+    link_table = link_model.__table__
+    with engine.connect() as connection:
+        boardgame_ids = np.array(connection.execute(select(boardgames.c.id).order_by(boardgames.c.id)).scalars()
+                                 .all(), dtype=np.int64)
+        facet_ids = np.array(connection.execute(select(table.c.id).order_by(table.c.id)).scalars().all(),
+                             dtype=np.int64)
+        links = np.array(connection.execute(select(link_table.c.boardgame_id, link_table.c[link_column])).all(),
+                         dtype=np.int64).reshape(-1, 2)
+    rows = np.searchsorted(boardgame_ids, links[:, 0])
+    columns = np.searchsorted(facet_ids, links[:, 1])
+    matrix = sparse.csr_matrix((np.ones(len(links), dtype=np.int32), (rows, columns)),
+                               shape=(len(boardgame_ids), len(facet_ids)))
+    matrix.sum_duplicates()
+    return IncidenceMatrix(facet, matrix, boardgame_ids, facet_ids)
+
+
+def get_fingerprint(engine, facet):
+    """
+    Returns a summary of the tables the ``IncidenceMatrix`` of the facet is built from. It changes whenever a
+    board game, a category (mechanic, etc.) or a link is added or removed.
+    """
+    model, link_model, link_column = FACETS[facet]
+    boardgames = BoardGame.__table__
+    table = model.__table__
+    link_table = link_model.__table__
+    with engine.connect() as connection:
+        fingerprint = {
+            "boardgames": list(connection.execute(select(
+                func.count(), func.max(boardgames.c.id), func.total(boardgames.c.id))).one()),
+            table.name: list(connection.execute(select(
+                func.count(), func.max(table.c.id), func.total(table.c.id))).one()),
+            link_table.name: list(connection.execute(select(
+                func.count(), func.max(link_table.c.id), func.total(link_table.c.id),
+                func.total(link_table.c.boardgame_id), func.total(link_table.c[link_column]))).one()),
+        }
+    return json.dumps(fingerprint, sort_keys=True)
+
+
+def save_incidence_matrix(incidence_matrix, path, fingerprint=""):
+    temp_path = path + ".tmp.npz"
+    matrix = incidence_matrix.matrix
+    np.savez(temp_path, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+             shape=np.array(matrix.shape), boardgame_ids=incidence_matrix.boardgame_ids,
+             facet_ids=incidence_matrix.facet_ids, facet=np.array(incidence_matrix.facet),
+             fingerprint=np.array(fingerprint))
+    os.replace(temp_path, path)
+
+
+def load_incidence_matrix(path):
+    """
+    :return: a tuple of the ``IncidenceMatrix`` and the fingerprint it was saved with
+    """
+    with np.load(path) as data:
+        matrix = sparse.csr_matrix((data["data"], data["indices"], data["indptr"]), shape=tuple(data["shape"]))
+        incidence_matrix = IncidenceMatrix(str(data["facet"]), matrix, data["boardgame_ids"], data["facet_ids"])
+        return incidence_matrix, str(data["fingerprint"])
+
+
+def get_incidence_matrix(engine, facet, cache_directory=DEFAULT_CACHE_DIRECTORY):
+    """
+    Returns the ``IncidenceMatrix`` of the facet from the cache or builds (and caches) it if the database
+    changed since it was cached.
+
+    :param cache_directory: the directory of the cached matrices, ``None`` disables the cache
+    """
+    if cache_directory is None:
+        return build_incidence_matrix(engine, facet)
+    fingerprint = get_fingerprint(engine, facet)
+    path = os.path.join(cache_directory, "{0}.npz".format(facet))
+    if os.path.exists(path):
+        incidence_matrix, cached_fingerprint = load_incidence_matrix(path)
+        if cached_fingerprint == fingerprint:
+            return incidence_matrix
+    incidence_matrix = build_incidence_matrix(engine, facet)
+    if not os.path.exists(cache_directory):
+        os.makedirs(cache_directory)
+    save_incidence_matrix(incidence_matrix, path, fingerprint)
+    return incidence_matrix
+
+
+def get_incidence_matrices(engine, facets=None, cache_directory=DEFAULT_CACHE_DIRECTORY):
+    """
+    Returns a dictionary that maps the facets (all of ``FACETS`` by default) to their ``IncidenceMatrix``.
+    """
+    if facets is None:
+        facets = list(FACETS.keys())
+    return {facet: get_incidence_matrix(engine, facet, cache_directory) for facet in facets}
@@ -0,0 +1,212 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sqlalchemy import select
+
+from data_collection.database.tables import BoardGame
+from analysis.incidence import get_incidence_matrix, DEFAULT_CACHE_DIRECTORY
+from analysis.similarity import combine_incidence_matrices
+
+DEFAULT_FACETS = ("categories", "mechanics", "families")
+DEFAULT_NUM_PERMUTATIONS = 128
+# 32 bands of 4 rows: two board games with a Jaccard similarity of 0.5 share a band with a probability of 87%
+DEFAULT_ROWS_PER_BAND = 4
+DEFAULT_PATH = os.path.join("data", "similarity", "minhash.npz")
+PRIME = (1 << 31) - 1  # the hash functions are (a * x + b) mod PRIME
+EMPTY = PRIME  # the signature of a board game without any category (mechanic, etc.), larger than every hash
+MAX_HASHES_PER_CHUNK = 16 * 1024 * 1024  # bounds the memory used while computing the signatures
+
+
+class MinHashIndex:
+    """
+    An approximate nearest neighbour index over the sets of categories, mechanics and families of the board
+    games, the similarity of two board games is the Jaccard similarity of their sets.
+
+    Every board game gets a MinHash signature of ``num_permutations`` values. The signature is split into bands
+    of ``rows_per_band`` values and board games that agree on all values of a band end up in the same bucket.
+    Only the board games that share a bucket with the queried one are compared, so a query does not depend on
+    the number of board games. More rows per band make the buckets smaller (faster, fewer false positives) and
+    more bands make it more likely that similar board games share a bucket (higher recall).
+
+    :param bgg_ids: the bgg id of every row
+    :param matrix: the board game x (category, mechanic, ...) ``scipy.sparse.csr_matrix`` of the sets
+    :param signatures: the N x ``num_permutations`` MinHash signatures
+    :param rows_per_band: the number of values of the signature per band
+    :param band_keys: the ``num_bands`` x N sorted hashes of the bands
+    :param band_rows: the row of every hash of ``band_keys``
+    """
+
+    def __init__(self, bgg_ids, matrix, signatures, rows_per_band, band_keys, band_rows):
+        self.bgg_ids = bgg_ids
+        self.matrix = matrix
+        self.signatures = signatures
+        self.rows_per_band = rows_per_band
+        self.band_keys = band_keys
+        self.band_rows = band_rows
+        self._bgg_id_order = np.argsort(bgg_ids)
+        self._sizes = np.diff(matrix.indptr)
+
+    @property
+    def num_bands(self):
+        return len(self.band_keys)
+
+    @classmethod
+    def build(cls, matrix, bgg_ids, num_permutations=DEFAULT_NUM_PERMUTATIONS, rows_per_band=DEFAULT_ROWS_PER_BAND,
+              seed=0):
+        """
+        Computes the signatures and the buckets of the sets of ``matrix``.
+
+        :param matrix: the board game x (category, mechanic, ...) matrix, e.g., of ``combine_incidence_matrices``
+        :param bgg_ids: the bgg id of every row
+        :param num_permutations: the length of the signatures, has to be a multiple of ``rows_per_band``
+        """
+        if num_permutations % rows_per_band != 0:
+            raise ValueError("num_permutations={0} is not a multiple of rows_per_band={1}".format(
+                num_permutations, rows_per_band))
+        matrix = sparse.csr_matrix(matrix)
+        matrix.sum_duplicates()
+        signatures = compute_signatures(matrix, num_permutations, seed)
+        band_keys, band_rows = _compute_band_keys(signatures, rows_per_band)
+        return cls(np.asarray(bgg_ids, dtype=np.int64), matrix, signatures, rows_per_band, band_keys, band_rows)
+
+    def save(self, path):
+        temp_path = path + ".tmp.npz"
+        np.savez(temp_path, bgg_ids=self.bgg_ids, indices=self.matrix.indices, indptr=self.matrix.indptr,
+                 shape=np.array(self.matrix.shape), signatures=self.signatures,
+                 rows_per_band=np.array(self.rows_per_band), band_keys=self.band_keys, band_rows=self.band_rows)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            matrix = sparse.csr_matrix((np.ones(len(data["indices"]), dtype=np.int32), data["indices"],
+                                        data["indptr"]), shape=tuple(data["shape"]))
+            return cls(data["bgg_ids"], matrix, data["signatures"], int(data["rows_per_band"]), data["band_keys"],
+                       data["band_rows"])
+
+    def get_row_index(self, bgg_id):
+        position = np.searchsorted(self.bgg_ids, bgg_id, sorter=self._bgg_id_order)
+        if position >= len(self.bgg_ids) or self.bgg_ids[self._bgg_id_order[position]] != bgg_id:
+            raise KeyError("Unknown bgg id: {0}".format(bgg_id))
+        return self._bgg_id_order[position]
+
+    def get_candidates(self, row_index, min_shared_bands=1):
+        """
+        Returns the rows that share at least ``min_shared_bands`` buckets with the row (without the row itself).
+        """
+        if self._sizes[row_index] == 0:
+            return np.array([], dtype=np.int64)
+        query_keys = _hash_bands(self.signatures[row_index:row_index + 1], self.rows_per_band)[:, 0]
+        candidates = []
+        for band_index, key in enumerate(query_keys):
+            keys = self.band_keys[band_index]
+            start, stop = np.searchsorted(keys, key, side="left"), np.searchsorted(keys, key, side="right")
+            candidates.append(self.band_rows[band_index, start:stop])
+        candidates, counts = np.unique(np.concatenate(candidates), return_counts=True)
+        candidates = candidates[(counts >= min_shared_bands) & (candidates != row_index)]
+        return candidates.astype(np.int64)
+
+    def get_similarities(self, row_index, min_shared_bands=1, exact=True):
+        """
+        Returns the candidates of the row (see ``get_candidates``) and their similarity to the row.
+
+        :param exact: if ``True``, the exact Jaccard similarity is computed, otherwise it is estimated from the
+        signatures
+        :return: a tuple of the rows of the candidates and their similarities
+        """
+        candidates = self.get_candidates(row_index, min_shared_bands)
+        if exact:
+            query = np.zeros(self.matrix.shape[1], dtype=np.int32)
+            query[self.matrix.indices[self.matrix.indptr[row_index]:self.matrix.indptr[row_index + 1]]] = 1
+            intersections = self.matrix[candidates] @ query
+            similarities = intersections / (self._sizes[candidates] + self._sizes[row_index] - intersections)
+        else:
+            similarities = (self.signatures[candidates] == self.signatures[row_index]).mean(axis=1)
+        return candidates, similarities
+
+    def top_k(self, bgg_id, k=10, min_shared_bands=1, exact=True):
+        """
+        Returns the (approximately) ``k`` most similar board games.
+
+        :param min_shared_bands: only compare the board games that share at least this many buckets with the
+        board game, higher values are faster but miss more similar board games
+        :param exact: see ``get_similarities``
+        :return: a ``DataFrame`` with the columns ``bgg_id`` and ``similarity`` ordered by the similarity
+        (descending) and the bgg id
+        """
+        candidates, similarities = self.get_similarities(self.get_row_index(bgg_id), min_shared_bands, exact)
+        candidate_bgg_ids = self.bgg_ids[candidates]
+        order = np.lexsort((candidate_bgg_ids, -similarities))[:k]
+        return pd.DataFrame({"bgg_id": candidate_bgg_ids[order], "similarity": similarities[order]})
+
+
+def compute_signatures(matrix, num_permutations=DEFAULT_NUM_PERMUTATIONS, seed=0):
+    """
+    Computes the MinHash signature of every row of the sparse matrix, i.e., the minimum of every hash function
+    over the columns of the row. The signature of an empty row is ``EMPTY``.
+
+    :return: an N x ``num_permutations`` ``uint32`` array
+    """
+    random_state = np.random.RandomState(seed)
+    a = random_state.randint(1, PRIME, size=num_permutations).astype(np.int64)
+    b = random_state.randint(0, PRIME, size=num_permutations).astype(np.int64)
+    num_rows = matrix.shape[0]
+    signatures = np.full((num_rows, num_permutations), EMPTY, dtype=np.uint32)
+    sizes = np.diff(matrix.indptr)
+    rows_per_chunk = max(1, int(MAX_HASHES_PER_CHUNK // (num_permutations * max(1.0, sizes.mean()))))
+    for start in range(0, num_rows, rows_per_chunk):
+        stop = min(start + rows_per_chunk, num_rows)
+        rows = np.arange(start, stop)[sizes[start:stop] > 0]
+        if len(rows) == 0:
+            continue
+        columns = matrix.indices[matrix.indptr[rows[0]]:matrix.indptr[rows[-1] + 1]].astype(np.int64)
+        hashes = (a[:, None] * columns[None, :] + b[:, None]) % PRIME
+        # The rows are consecutive (empty rows have no columns), so every segment is the columns of one row
+        segment_starts = matrix.indptr[rows] - matrix.indptr[rows[0]]
+        signatures[rows] = np.minimum.reduceat(hashes, segment_starts, axis=1).T
+    return signatures
+
+
+def _hash_bands(signatures, rows_per_band):
+    """
+    Hashes the values of every band of every signature into a single ``uint64``.
+
+    :return: a ``num_bands`` x N array
+    """
+    num_bands = signatures.shape[1] // rows_per_band
+    keys = np.zeros((num_bands, len(signatures)), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset in range(rows_per_band):
+            keys = keys * np.uint64(1000003) ^ signatures[:, offset::rows_per_band][:, :num_bands].T.astype(np.uint64)
+    return keys
+
+
+def _compute_band_keys(signatures, rows_per_band):
+    """
+    :return: a tuple of the ``num_bands`` x N sorted keys of the bands (see ``_hash_bands``) and the row of every
+    key, rows with an empty signature are left out
+    """
+    keys = _hash_bands(signatures, rows_per_band)
+    rows = np.flatnonzero(signatures[:, 0] != EMPTY)
+    keys = keys[:, rows]
+    order = np.argsort(keys, axis=1, kind="stable")
+    return np.take_along_axis(keys, order, axis=1), rows[order]
+
+
+def build_minhash_index(engine, facets=DEFAULT_FACETS, incidence_directory=DEFAULT_CACHE_DIRECTORY, **kwargs):
+    """
+    Builds the ``MinHashIndex`` of the board games of the database over the given facets (see ``MinHashIndex``
+    for ``**kwargs``).
+
+    :param incidence_directory: the directory of the cached incidence matrices (see
+    ``analysis.incidence.get_incidence_matrix``), ``None`` always builds them from the database
+    """
+    incidence_matrices = [get_incidence_matrix(engine, facet, cache_directory=incidence_directory)
+                          for facet in facets]
+    matrix, boardgame_ids = combine_incidence_matrices(incidence_matrices)
+    boardgames = BoardGame.__table__
+    with engine.connect() as connection:
+        bgg_ids = dict(connection.execute(select(boardgames.c.id, boardgames.c.bgg_id)).all())
+    return MinHashIndex.build(matrix, [bgg_ids[boardgame_id] for boardgame_id in boardgame_ids.tolist()], **kwargs)
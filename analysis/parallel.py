@@ -0,0 +1,128 @@
+import os
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from analysis.similarity import combine_incidence_matrices, compute_block_edges, DEFAULT_THRESHOLD, \
+    DEFAULT_BLOCK_SIZE
+
+CHUNKS_PER_PROCESS = 4  # more chunks than processes, so a process that finishes early picks up the next one
+
+_worker_arrays = None  # the SharedArrays a worker is attached to, see _init_worker
+_worker_matrix = None
+
+
+class SharedArrays:
+    """
+    Numpy arrays in shared memory. The creating process copies the arrays into shared memory once, other
+    processes attach to them by their ``spec`` without copying.
+
+    :param memories: a dictionary that maps the name of every array to its ``SharedMemory``
+    :param spec: a dictionary that maps the name of every array to the name of its shared memory, its shape and
+    its dtype
+    :param is_owner: if ``True``, the shared memory is removed by ``close``
+    """
+
+    def __init__(self, memories, spec, is_owner):
+        self.memories = memories
+        self.spec = spec
+        self.is_owner = is_owner
+        self.arrays = {name: np.ndarray(shape, dtype=dtype, buffer=memories[name].buf)
+                       for name, (_, shape, dtype) in spec.items()}
+
+    @classmethod
+    def create(cls, arrays):
+        memories = {}
+        spec = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            memory = SharedMemory(create=True, size=max(1, array.nbytes))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[...] = array
+            memories[name] = memory
+            spec[name] = (memory.name, array.shape, array.dtype.str)
+        return cls(memories, spec, is_owner=True)
+
+    @classmethod
+    def attach(cls, spec):
+        return cls({name: SharedMemory(name=memory_name) for name, (memory_name, _, _) in spec.items()}, spec,
+                   is_owner=False)
+
+    def close(self):
+        self.arrays = {}  # the views have to be released before the memory can be closed
+        for memory in self.memories.values():
+            memory.close()
+            if self.is_owner:
+                memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def get_balanced_chunks(num_rows, num_chunks):
+    """
+    Splits the rows into ``num_chunks`` consecutive chunks with about the same number of pairs ``(i, j)`` with
+    ``i < j``, i.e., the first chunks have more rows than the last ones because row ``i`` is only paired with the
+    later rows.
+
+    :return: a list of ``(start, stop)`` tuples
+    """
+    if num_rows == 0:
+        return []
+    num_chunks = max(1, min(num_chunks, num_rows))
+    pairs = np.cumsum(np.arange(num_rows, 0, -1, dtype=np.float64))  # the pairs of the rows 0 to i
+    boundaries = np.searchsorted(pairs, pairs[-1] * np.arange(1, num_chunks) / num_chunks) + 1
+    boundaries = np.unique(np.concatenate([[0], boundaries, [num_rows]]).astype(np.int64))
+    return list(zip(boundaries[:-1].tolist(), boundaries[1:].tolist()))
+
+
+def _init_worker(spec, shape):
+    global _worker_arrays, _worker_matrix
+    _worker_arrays = SharedArrays.attach(spec)
+    arrays = _worker_arrays.arrays
+    _worker_matrix = sparse.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape=shape,
+                                       copy=False)
+
+
+def _compute_chunk_edges(task):
+    start, stop, threshold = task
+    return compute_block_edges(_worker_matrix, start, stop, threshold)
+
+
+def iter_parallel_similarity_edges(incidence_matrices, threshold=DEFAULT_THRESHOLD, block_size=DEFAULT_BLOCK_SIZE,
+                                   num_processes=None):
+    """
+    Computes the same edges as ``analysis.similarity.iter_similarity_edges`` with several processes.
+
+    The combined matrix is put into shared memory once and every process attaches to it without copying. The
+    rows are split into chunks with the same number of pairs (see ``get_balanced_chunks``), the first chunk has
+    at most about ``block_size`` rows, so a chunk needs about the memory of the first block of
+    ``iter_similarity_edges``. The processes take the next chunk whenever they are done with one.
+
+    :param num_processes: the number of processes, defaults to the number of CPUs
+    :return: a generator of ``DataFrame``s with the columns ``Source``, ``Target`` and ``Weight``, one per chunk
+    in the order of the rows, i.e., the edges are in the same order as the ones of ``iter_similarity_edges``
+    """
+    if threshold <= 0:
+        raise ValueError("The threshold has to be positive, but is {0}".format(threshold))
+    if num_processes is None:
+        num_processes = os.cpu_count() or 1
+    matrix, boardgame_ids = combine_incidence_matrices(incidence_matrices)
+    num_rows = matrix.shape[0]
+    num_pairs = num_rows * (num_rows + 1) / 2
+    first_block_pairs = max(1, min(block_size, num_rows) * num_rows)
+    num_chunks = max(int(np.ceil(num_pairs / first_block_pairs)), num_processes * CHUNKS_PER_PROCESS)
+    tasks = [(start, stop, threshold) for start, stop in get_balanced_chunks(num_rows, num_chunks)]
+
+    with SharedArrays.create({"data": matrix.data, "indices": matrix.indices, "indptr": matrix.indptr}) as shared:
+        with Pool(num_processes, initializer=_init_worker, initargs=(shared.spec, matrix.shape)) as pool:
+            # imap instead of imap_unordered keeps the order of the edges (which decides the ties when they are
+            # pruned), the processes still take the chunks in the order in which they become free
+            for sources, targets, weights in pool.imap(_compute_chunk_edges, tasks):
+                yield pd.DataFrame({"Source": boardgame_ids[sources], "Target": boardgame_ids[targets],
+                                    "Weight": weights})
@@ -0,0 +1,64 @@
+import numpy as np
+
+
+def get_kept_edges(sources, targets, weights, keep_percentage, node_ids=None):
+    """
+    Decides which edges to keep such that every node keeps (at least) the ``keep_percentage`` of its edges with
+    the highest weights. An edge is kept if one of its two nodes keeps it, i.e., the edges are only removed if
+    they are not important to either node.
+
+    A node with ``n`` edges keeps the first ``int(n * keep_percentage)`` of them when they are sorted by their
+    weight (descending). Ties are broken by the order of the edges: first the edges the node is the source of,
+    then the edges it is the target of, each in the given order.
+
+    Every edge is looked at twice (once per node) within a single sort, so this scales to tens of millions of
+    edges.
+
+    :param sources: the source of every edge
+    :param targets: the target of every edge
+    :param weights: the weight of every edge
+    :param keep_percentage: e.g., ``0.2`` keeps the 20% most important edges of every node
+    :param node_ids: only these nodes choose edges to keep (all if ``None``), edges between two other nodes are
+    always kept
+    :return: a boolean array that is ``True`` for every edge that is kept
+    """
+    sources = np.asarray(sources)
+    targets = np.asarray(targets)
+    weights = np.asarray(weights, dtype=np.float64)
+    num_edges = len(weights)
+    # Every edge once from the perspective of its source and once from the perspective of its target
+    nodes = np.concatenate([sources, targets])
+    edge_indices = np.concatenate([np.arange(num_edges), np.arange(num_edges)])
+    if node_ids is not None:
+        is_voting = np.isin(nodes, np.asarray(node_ids))
+        nodes = nodes[is_voting]
+        edge_indices = edge_indices[is_voting]
+    node_weights = weights[edge_indices]
+
+    # Sorted by the node, then by the weight (descending, NaN last) and then by the position. Two stable sorts
+    # are faster than a single ``np.lexsort`` with three keys.
+    order = np.argsort(-node_weights, kind="stable")
+    order = order[np.argsort(nodes[order], kind="stable")]
+    nodes = nodes[order]
+    edge_indices = edge_indices[order]
+    group_starts = np.concatenate([[0], np.flatnonzero(nodes[1:] != nodes[:-1]) + 1])
+    group_sizes = np.diff(np.append(group_starts, len(nodes)))
+    group_indices = np.repeat(np.arange(len(group_starts)), group_sizes)
+    ranks = np.arange(len(nodes)) - group_starts[group_indices]
+    keep_counts = (group_sizes * keep_percentage).astype(np.int64)
+
+    is_kept = np.zeros(num_edges, dtype=bool)
+    is_kept[edge_indices[ranks < keep_counts[group_indices]]] = True
+    is_voted_on = np.zeros(num_edges, dtype=bool)
+    is_voted_on[edge_indices] = True
+    return is_kept | ~is_voted_on
+
+
+def prune_edges(edges_df, keep_percentage, node_ids=None, source_column="Source", target_column="Target",
+                weight_column="Weight"):
+    """
+    Returns the edges of the ``DataFrame`` that are kept by ``get_kept_edges`` (in the same order).
+    """
+    is_kept = get_kept_edges(edges_df[source_column].values, edges_df[target_column].values,
+                             edges_df[weight_column].values, keep_percentage, node_ids=node_ids)
+    return edges_df[is_kept]
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from sqlalchemy import select
+
+from data_collection.database.tables import BoardGame, RatingsBreakdown
+
+RATINGS = np.arange(1, 11)
+RATINGS_COLUMNS = ["num_{0}".format(rating) for rating in RATINGS]
+# The geek rating of BGG is (roughly) a Bayesian average that adds some dummy votes of 5.5 to every game
+DEFAULT_PRIOR_MEAN = 5.5
+DEFAULT_PRIOR_VOTES = 100
+DEFAULT_PERCENTILES = (25, 50, 75)
+DEFAULT_CONFIDENCE = 0.95
+
+
+class RatingsHistograms:
+    """
+    The ratings breakdown of all board games as a single N x 10 integer array, where ``histograms[i, r - 1]`` is
+    the number of votes of rating ``r`` for the board game ``boardgame_ids[i]``.
+
+    The rows are all board games ordered by their id (board games without a breakdown have a row of zeros), so
+    they line up with the rows of an ``IncidenceMatrix``.
+    """
+
+    def __init__(self, boardgame_ids, histograms):
+        self.boardgame_ids = boardgame_ids
+        self.histograms = histograms
+
+    @classmethod
+    def load(cls, engine):
+        """
+        Loads the histograms from the database with two queries.
+        """
+        boardgames = BoardGame.__table__
+        table = RatingsBreakdown.__table__
+        with engine.connect() as connection:
+            boardgame_ids = np.array(connection.execute(select(boardgames.c.id).order_by(boardgames.c.id))
+                                     .scalars().all(), dtype=np.int64)
+            rows = np.array(connection.execute(select(table.c.boardgame_id,
+                                                      *[table.c[column] for column in RATINGS_COLUMNS])).all(),
+                            dtype=np.int64).reshape(-1, len(RATINGS) + 1)
+        return cls._from_rows(boardgame_ids, rows[:, 0], rows[:, 1:])
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        Loads the histograms from a ``Snapshot`` (see ``analysis.snapshot``).
+        """
+        table = snapshot.table(RatingsBreakdown.__tablename__)
+        counts = np.column_stack([table.column(column) for column in RATINGS_COLUMNS])
+        return cls._from_rows(np.asarray(snapshot.table(BoardGame.__tablename__).column("id")),
+                              table.column("boardgame_id"), counts)
+
+    @classmethod
+    def _from_rows(cls, boardgame_ids, row_boardgame_ids, counts):
+        histograms = np.zeros((len(boardgame_ids), len(RATINGS)), dtype=np.int64)
+        histograms[np.searchsorted(boardgame_ids, row_boardgame_ids)] = counts
+        return cls(boardgame_ids, histograms)
+
+    def __len__(self):
+        return len(self.boardgame_ids)
+
+
+def compute_statistics(histograms, index=None, percentiles=DEFAULT_PERCENTILES, prior_mean=DEFAULT_PRIOR_MEAN,
+                       prior_votes=DEFAULT_PRIOR_VOTES, confidence=DEFAULT_CONFIDENCE):
+    """
+    Computes the statistics of every row of an M x 10 array of ratings histograms at once.
+
+    The percentiles are the lowest rating that at least the given percentage of the votes is less or equal to.
+    The Bayesian average adds ``prior_votes`` votes of ``prior_mean``. The confidence interval of the mean is based
+    on the normal approximation. Rows without votes have ``NaN`` statistics.
+
+    :param index: the index of the returned ``DataFrame``, e.g., the board game ids
+    :return: a ``DataFrame`` with the columns ``num_ratings``, ``mean``, ``variance``, ``std``, ``median``,
+    ``p<percentile>`` for every percentile, ``bayes_avg``, ``ci_low`` and ``ci_high``
+    """
+    histograms = np.asarray(histograms, dtype=np.float64)
+    num_ratings = histograms.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rating_sum = histograms @ RATINGS
+        mean = rating_sum / num_ratings
+        variance = np.maximum(histograms @ (RATINGS ** 2) / num_ratings - mean ** 2, 0.0)
+        std = np.sqrt(variance)
+        margin = stats.norm.ppf(0.5 + confidence / 2) * std / np.sqrt(num_ratings)
+        bayes_avg = (rating_sum + prior_votes * prior_mean) / (num_ratings + prior_votes)
+
+    cumulative = np.cumsum(histograms, axis=1)
+    has_ratings = num_ratings > 0
+
+    def get_percentile(percentile):
+        indices = (cumulative < (percentile / 100.0 * num_ratings)[:, None]).sum(axis=1)
+        return np.where(has_ratings, RATINGS[np.minimum(indices, len(RATINGS) - 1)], np.nan)
+
+    result = pd.DataFrame({"num_ratings": num_ratings.astype(np.int64), "mean": mean, "variance": variance,
+                           "std": std, "median": get_percentile(50)}, index=index)
+    for percentile in percentiles:
+        result["p{0}".format(percentile)] = get_percentile(percentile)
+    result["bayes_avg"] = bayes_avg
+    result["ci_low"] = mean - margin
+    result["ci_high"] = mean + margin
+    return result
+
+
+def get_boardgame_statistics(ratings, **kwargs):
+    """
+    Returns the statistics (see ``compute_statistics``) of every board game indexed by the board game id.
+
+    :param ratings: the ``RatingsHistograms``
+    """
+    return compute_statistics(ratings.histograms, index=pd.Index(ratings.boardgame_ids, name="boardgame_id"),
+                              **kwargs)
+
+
+def get_facet_statistics(ratings, incidence_matrix, **kwargs):
+    """
+    Returns the statistics of the pooled votes of all board games of every category (mechanic, etc.) indexed by
+    the facet id, i.e., board games with more votes have more influence.
+
+    Additionally, ``num_boardgames`` is the number of board games of the facet and ``avg_boardgame_mean`` the
+    unweighted average of the means of its board games that have votes.
+
+    :param ratings: the ``RatingsHistograms``
+    :param incidence_matrix: the ``IncidenceMatrix`` (see ``analysis.incidence``) of the facet
+    """
+    if not np.array_equal(ratings.boardgame_ids, incidence_matrix.boardgame_ids):
+        raise ValueError("The ratings and the incidence matrix do not contain the same board games")
+    transposed = incidence_matrix.csc.T.tocsr().astype(np.int64)
+    result = compute_statistics(transposed @ ratings.histograms,
+                                index=pd.Index(incidence_matrix.facet_ids, name="facet_id"), **kwargs)
+    num_ratings = ratings.histograms.sum(axis=1)
+    has_ratings = (num_ratings > 0).astype(np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        boardgame_means = np.where(num_ratings > 0, (ratings.histograms @ RATINGS) / num_ratings, 0.0)
+        result.insert(0, "num_boardgames", incidence_matrix.get_column_sums())
+        result["avg_boardgame_mean"] = (transposed @ boardgame_means) / (transposed @ has_ratings)
+    return result
+
+
+def get_group_statistics(ratings, boardgame_ids, **kwargs):
+    """
+    Compares the pooled votes of the given board games (e.g., all board games on Kickstarter) to the pooled
+    votes of all other board games.
+
+    :return: a ``DataFrame`` (see ``compute_statistics``) with the rows ``"group"`` and ``"others"``
+    """
+    in_group = np.isin(ratings.boardgame_ids, np.asarray(boardgame_ids))
+    histograms = np.vstack([ratings.histograms[in_group].sum(axis=0), ratings.histograms[~in_group].sum(axis=0)])
+    result = compute_statistics(histograms, index=["group", "others"], **kwargs)
+    result.insert(0, "num_boardgames", [int(in_group.sum()), int((~in_group).sum())])
+    return result
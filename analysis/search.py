@@ -0,0 +1,87 @@
+import re
+
+import pandas as pd
+from sqlalchemy import text
+
+from analysis.incidence import FACETS
+
+# The weights of the columns of ``boardgames_fts`` for bm25, a match in the name counts more than one in the
+# (much longer) description
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+DEFAULT_LIMIT = 20
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(query, prefix=True):
+    """
+    Turns the text a user typed into an FTS5 query that matches the board games containing every word, e.g.,
+    ``"dungeon coop"`` becomes ``'"dungeon"* "coop"*'``. Every word is quoted, so the user can not break the
+    query with the FTS5 syntax (e.g., ``-``, ``:`` or ``"``).
+
+    :param prefix: if ``True``, every word also matches the words that start with it
+    """
+    words = WORD_PATTERN.findall(query)
+    if not words:
+        raise ValueError("The query {0!r} does not contain any word".format(query))
+    return " ".join('"{0}"{1}'.format(word, "*" if prefix else "") for word in words)
+
+
+def search_boardgames(engine, query, limit=DEFAULT_LIMIT, prefix=True, min_year=None, max_year=None, facets=None):
+    """
+    Searches the names and descriptions of the board games with the full-text search index (see migration 2 of
+    ``data_collection.database.storage``), the best matches according to bm25 come first and ties are broken by
+    the number of ratings.
+
+    :param engine: the database engine
+    :param query: the words to search for, see ``build_match_query``
+    :param limit: the maximum number of results, ``None`` for all
+    :param min_year: only return board games that were published in or after this year
+    :param max_year: only return board games that were published in or before this year
+    :param facets: a dictionary that maps facets (see ``analysis.incidence.FACETS``) to lists of names, only board
+    games that are linked to all of them are returned, e.g., ``{"mechanics": ["Co-operative Play"]}``
+    :return: a ``DataFrame`` with the columns ``boardgame_id``, ``bgg_id``, ``name``, ``year_published``,
+    ``num_ratings``, ``avg_rating`` and ``score`` (higher is better)
+    """
+    conditions = ["boardgames_fts MATCH :query"]
+    parameters = {"query": build_match_query(query, prefix=prefix), "name_weight": NAME_WEIGHT,
+                  "description_weight": DESCRIPTION_WEIGHT}
+    if min_year is not None:
+        conditions.append("b.year_published >= :min_year")
+        parameters["min_year"] = int(min_year)
+    if max_year is not None:
+        conditions.append("b.year_published <= :max_year")
+        parameters["max_year"] = int(max_year)
+    for facet, names in (facets or {}).items():
+        if facet not in FACETS:
+            raise KeyError("Unknown facet {0}, expected one of {1}".format(facet, list(FACETS.keys())))
+        model, link_model, link_column = FACETS[facet]
+        for name in names:
+            parameter = "facet_{0}".format(len(parameters))
+            conditions.append("b.id IN (SELECT l.boardgame_id FROM {0} l INNER JOIN {1} f ON f.id = l.{2} "
+                              "WHERE f.name = :{3})".format(link_model.__tablename__, model.__tablename__,
+                                                            link_column, parameter))
+            parameters[parameter] = name
+
+    sql = "SELECT b.id AS boardgame_id, b.bgg_id AS bgg_id, b.name AS name, b.year_published AS year_published, " \
+          "b.num_ratings AS num_ratings, b.avg_rating AS avg_rating, " \
+          "-bm25(boardgames_fts, :name_weight, :description_weight) AS score " \
+          "FROM boardgames_fts INNER JOIN boardgames b ON b.id = boardgames_fts.rowid " \
+          "WHERE {0} ORDER BY score DESC, b.num_ratings DESC".format(" AND ".join(conditions))
+    if limit is not None:
+        sql += " LIMIT :limit"
+        parameters["limit"] = int(limit)
+    with engine.connect() as connection:
+        return pd.read_sql(text(sql), connection, params=parameters)
+
+
+def find_boardgame(engine, query, **kwargs):
+    """
+    Returns the best match of ``search_boardgames`` as a ``Series`` (e.g., to pick the seed board game of the
+    similarity graph) or ``None`` if nothing matches.
+    """
+    result = search_boardgames(engine, query, limit=1, **kwargs)
+    if len(result) == 0:
+        return None
+    return result.iloc[0]
@@ -0,0 +1,215 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+from sqlalchemy import select
+
+from data_collection.database.tables import BoardGame
+
+METADATA_COLUMNS = ["year_published", "avg_weight", "min_players", "max_players", "num_ratings", "avg_rating"]
+DEFAULT_K = 10
+MAX_K = 100
+LATENCY_WINDOW = 10000  # the statistics are computed over the latest requests
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+class UnknownBoardGameException(Exception):
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
+
+class LatencyStats:
+    """
+    Keeps the durations of the latest ``window`` requests of every endpoint in a ring buffer, safe to use from
+    several threads.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._durations = {}
+        self._counts = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, duration, failed=False):
+        with self._lock:
+            if endpoint not in self._durations:
+                self._durations[endpoint] = np.zeros(self.window, dtype=np.float64)
+                self._counts[endpoint] = 0
+                self._errors[endpoint] = 0
+            self._durations[endpoint][self._counts[endpoint] % self.window] = duration
+            self._counts[endpoint] += 1
+            self._errors[endpoint] += int(failed)
+
+    def get_summary(self):
+        """
+        :return: a dictionary that maps every endpoint to the number of requests and errors and the mean, the
+        percentiles and the maximum of the latest durations in milliseconds
+        """
+        with self._lock:
+            summary = {}
+            for endpoint, durations in self._durations.items():
+                durations = durations[:min(self._counts[endpoint], self.window)] * 1000
+                endpoint_summary = {"count": self._counts[endpoint], "errors": self._errors[endpoint],
+                                    "mean_ms": float(durations.mean()), "max_ms": float(durations.max())}
+                for percentile, value in zip(LATENCY_PERCENTILES, np.percentile(durations, LATENCY_PERCENTILES)):
+                    endpoint_summary["p{0}_ms".format(percentile)] = float(value)
+                summary[endpoint] = endpoint_summary
+            return summary
+
+
+class SimilarGamesService:
+    """
+    Answers "which board games are similar to this one" from a ``MinHashIndex`` (see ``analysis.minhash``) and
+    the metadata of the board games, which are both loaded once and kept in arrays that line up with the rows
+    of the index.
+
+    :param index: the ``MinHashIndex``
+    :param metadata: a dictionary of the columns ``name`` (a list) and ``METADATA_COLUMNS`` (arrays, missing
+    values are ``NaN``) with one value per row of the index, see ``load_metadata``
+    """
+
+    def __init__(self, index, metadata):
+        self.index = index
+        self.metadata = metadata
+        self.latency_stats = LatencyStats()
+
+    def similar(self, bgg_id, k=DEFAULT_K, min_year=None, max_year=None, min_weight=None, max_weight=None,
+                player_count=None):
+        """
+        Returns the ``k`` most similar board games that match all of the given filters.
+
+        :param player_count: only return board games that can be played with this many players
+        :return: a list of dictionaries with the ``bgg_id``, ``name``, ``similarity`` and ``METADATA_COLUMNS``
+        :raises UnknownBoardGameException: if the board game is not in the index
+        """
+        try:
+            row_index = self.index.get_row_index(bgg_id)
+        except KeyError:
+            raise UnknownBoardGameException("Unknown bgg id: {0}".format(bgg_id))
+        candidates, similarities = self.index.get_similarities(row_index)
+        is_match = np.ones(len(candidates), dtype=bool)
+        for column, minimum, maximum in [("year_published", min_year, max_year),
+                                         ("avg_weight", min_weight, max_weight)]:
+            values = self.metadata[column][candidates]
+            if minimum is not None:
+                is_match &= values >= minimum
+            if maximum is not None:
+                is_match &= values <= maximum
+        if player_count is not None:
+            is_match &= (self.metadata["min_players"][candidates] <= player_count) & \
+                        (self.metadata["max_players"][candidates] >= player_count)
+        candidates, similarities = candidates[is_match], similarities[is_match]
+        bgg_ids = self.index.bgg_ids[candidates]
+        order = np.lexsort((bgg_ids, -similarities))[:k]
+
+        results = []
+        for row_index, similarity in zip(candidates[order].tolist(), similarities[order].tolist()):
+            result = {"bgg_id": int(self.index.bgg_ids[row_index]), "name": self.metadata["name"][row_index],
+                      "similarity": similarity}
+            for column in METADATA_COLUMNS:
+                value = float(self.metadata[column][row_index])
+                result[column] = value if value == value else None
+            results.append(result)
+        return results
+
+
+def load_metadata(engine, bgg_ids):
+    """
+    Loads the name and ``METADATA_COLUMNS`` of the board games with a single query.
+
+    :param bgg_ids: the bgg ids of the rows, e.g., of a ``MinHashIndex``
+    :return: see ``SimilarGamesService``, board games that are not in the database have no name and ``NaN``s
+    """
+    boardgames = BoardGame.__table__
+    with engine.connect() as connection:
+        rows = connection.execute(select(boardgames.c.bgg_id, boardgames.c.name,
+                                         *[boardgames.c[column] for column in METADATA_COLUMNS])).all()
+    positions = {bgg_id: position for position, bgg_id in enumerate(np.asarray(bgg_ids).tolist())}
+    metadata = {"name": [None] * len(positions)}
+    metadata.update({column: np.full(len(positions), np.nan) for column in METADATA_COLUMNS})
+    for row in rows:
+        position = positions.get(row.bgg_id)
+        if position is None:
+            continue
+        metadata["name"][position] = row.name
+        for column in METADATA_COLUMNS:
+            value = row._mapping[column]
+            metadata[column][position] = value if value is not None else np.nan
+    return metadata
+
+
+class SimilarGamesRequestHandler(BaseHTTPRequestHandler):
+    """
+    ``GET /similar?bgg_id=<id>[&k=10][&min_year=...][&max_year=...][&min_weight=...][&max_weight=...][&players=...]``
+    and ``GET /stats``, the answers are JSON. The connections are kept alive, so a client does not pay for a new
+    connection per request.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # otherwise the small answers of a kept alive connection wait for a delayed ACK
+    service = None  # set by create_server
+
+    def do_GET(self):
+        start_time = time.perf_counter()
+        url = urlparse(self.path)
+        status, body = 404, {"error": "Unknown path {0}".format(url.path)}
+        try:
+            try:
+                if url.path == "/similar":
+                    status, body = 200, self._similar(parse_qs(url.query))
+                elif url.path == "/stats":
+                    status, body = 200, self.service.latency_stats.get_summary()
+            except UnknownBoardGameException as e:
+                status, body = 404, {"error": str(e)}
+            except ValueError as e:
+                status, body = 400, {"error": str(e)}
+            except Exception as e:
+                print("ERROR: Failed to answer {0} ({1!r})".format(self.path, e))
+                status, body = 500, {"error": "Internal error"}
+            self._send_json(status, body)
+        finally:
+            self.service.latency_stats.record(url.path, time.perf_counter() - start_time, failed=status != 200)
+
+    def _similar(self, query):
+        def get(name, convert):
+            if name not in query:
+                return None
+            try:
+                return convert(query[name][0])
+            except ValueError:
+                raise ValueError("Invalid value of {0}: {1}".format(name, query[name][0]))
+
+        bgg_id = get("bgg_id", int)
+        if bgg_id is None:
+            raise ValueError("Missing bgg_id")
+        k = get("k", int)
+        if k is not None and k < 1:
+            raise ValueError("k has to be at least 1, but is {0}".format(k))
+        k = min(k, MAX_K) if k is not None else DEFAULT_K
+        return {"bgg_id": bgg_id, "similar": self.service.similar(
+            bgg_id, k=k, min_year=get("min_year", int), max_year=get("max_year", int),
+            min_weight=get("min_weight", float), max_weight=get("max_weight", float),
+            player_count=get("players", int))}
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # every request is counted in the latency statistics instead
+
+
+def create_server(service, host="127.0.0.1", port=8000):
+    """
+    Returns a ``ThreadingHTTPServer`` (one thread per connection) that answers the requests with the service,
+    start it with ``serve_forever()``.
+    """
+    handler = type("BoundSimilarGamesRequestHandler", (SimilarGamesRequestHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
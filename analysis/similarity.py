@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+DEFAULT_THRESHOLD = 75  # the minimum weight of an edge, the maximum weight is 200
+DEFAULT_BLOCK_SIZE = 1000  # number of board games (rows) per block, bounds the memory of a single block
+
+
+def combine_incidence_matrices(incidence_matrices):
+    """
+    Puts the columns of the ``IncidenceMatrix`` of several facets (e.g., categories and mechanics) side by side,
+    so a row contains every category and mechanic of a board game.
+
+    :return: a tuple of the combined ``scipy.sparse.csr_matrix`` and the board game ids of its rows
+    """
+    boardgame_ids = incidence_matrices[0].boardgame_ids
+    for incidence_matrix in incidence_matrices[1:]:
+        if not np.array_equal(incidence_matrix.boardgame_ids, boardgame_ids):
+            raise ValueError("The incidence matrices do not contain the same board games")
+    matrix = sparse.hstack([incidence_matrix.matrix for incidence_matrix in incidence_matrices], format="csr")
+    return matrix.astype(np.int32), np.asarray(boardgame_ids)
+
+
+def compute_block_edges(matrix, start, stop, threshold=DEFAULT_THRESHOLD):
+    """
+    Computes the edges between the board games of the rows ``start`` to ``stop`` (exclusive) and every board game
+    of a later row with a single sparse product ``X[start:stop] X[start:]^T``.
+
+    The weight of the edge between ``g_0`` and ``g_1`` is the overlap from the perspective of ``g_0``, i.e.,
+    (number of shared categories and mechanics) / (number of categories and mechanics of ``g_0``) * 100, plus the
+    overlap from the perspective of ``g_1``.
+
+    :param matrix: the combined matrix of ``combine_incidence_matrices``
+    :return: a tuple of the row indices of the sources, the row indices of the targets (``source < target``) and
+    the weights of the edges with a weight of at least ``threshold``, ordered by source and target
+    """
+    sizes = np.diff(matrix.indptr)
+    overlaps = (matrix[start:stop] @ matrix[start:].T).tocoo()
+    sources = overlaps.row.astype(np.int64) + start
+    targets = overlaps.col.astype(np.int64) + start
+    is_upper = targets > sources
+    sources, targets, overlaps = sources[is_upper], targets[is_upper], overlaps.data[is_upper].astype(np.int64)
+    weights = overlaps / sizes[sources] * 100 + overlaps / sizes[targets] * 100
+    is_edge = weights >= threshold
+    sources, targets, weights = sources[is_edge], targets[is_edge], weights[is_edge]
+    order = np.lexsort((targets, sources))
+    return sources[order], targets[order], weights[order]
+
+
+def iter_similarity_edges(incidence_matrices, threshold=DEFAULT_THRESHOLD, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Computes the edges between all pairs of board games that share enough categories (mechanics, etc.) block by
+    block, so only the overlaps of ``block_size`` board games are in memory at once (see
+    ``compute_block_edges``).
+
+    Only pairs that share at least one category or mechanic are computed, which is why ``threshold`` has to be
+    positive.
+
+    :param incidence_matrices: the ``IncidenceMatrix`` of every facet (see ``analysis.incidence``), e.g., of the
+    categories and the mechanics
+    :return: a generator of ``DataFrame``s with the columns ``Source``, ``Target`` (the board game ids,
+    ``Source < Target``) and ``Weight``, one per block
+    """
+    if threshold <= 0:
+        raise ValueError("The threshold has to be positive, but is {0}".format(threshold))
+    matrix, boardgame_ids = combine_incidence_matrices(incidence_matrices)
+    for start in range(0, matrix.shape[0], block_size):
+        sources, targets, weights = compute_block_edges(matrix, start, min(start + block_size, matrix.shape[0]),
+                                                        threshold)
+        yield pd.DataFrame({"Source": boardgame_ids[sources], "Target": boardgame_ids[targets], "Weight": weights})
+
+
+def compute_similarity_edges(incidence_matrices, threshold=DEFAULT_THRESHOLD, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Returns all edges of ``iter_similarity_edges`` as a single ``DataFrame``.
+    """
+    return pd.concat(list(iter_similarity_edges(incidence_matrices, threshold, block_size)), ignore_index=True)
+
+
+def write_similarity_edges(incidence_matrices, filename, threshold=DEFAULT_THRESHOLD, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Writes the edges of ``iter_similarity_edges`` to a ``.csv`` file (separated by ``;``) as soon as a block is
+    done, so they are never all in memory at once.
+
+    :return: the number of edges
+    """
+    return write_edges(iter_similarity_edges(incidence_matrices, threshold, block_size), filename)
+
+
+def write_edges(edges_dfs, filename):
+    """
+    Writes the ``DataFrame``s of edges (e.g., of ``iter_similarity_edges``) to a single ``.csv`` file (separated
+    by ``;``) one after the other.
+
+    :return: the number of edges
+    """
+    num_edges = 0
+    with open(filename, "w", encoding="utf-8", newline="") as file:
+        file.write("Source;Target;Weight\n")
+        for edges_df in edges_dfs:
+            edges_df.to_csv(file, sep=";", index=False, header=False)
+            num_edges += len(edges_df)
+    return num_edges
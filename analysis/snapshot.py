@@ -0,0 +1,215 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Integer, Float, String
+
+from data_collection.database.tables import BoardGame, Category, CategoryToBoardGame, Mechanic, \
+    MechanicToBoardGame, Family, FamilyToBoardGame, Designer, DesignerToBoardGame, Artist, ArtistToBoardGame, \
+    Publisher, PublisherToBoardGame, PlayerCountToBoardGame, RankType, BoardGameRanking, RatingsBreakdown
+
+# The tables that are exported, i.e., everything except the crawl journal
+SNAPSHOT_MODELS = [BoardGame, Category, CategoryToBoardGame, Mechanic, MechanicToBoardGame, Family, FamilyToBoardGame,
+                   Designer, DesignerToBoardGame, Artist, ArtistToBoardGame, Publisher, PublisherToBoardGame,
+                   PlayerCountToBoardGame, RankType, BoardGameRanking, RatingsBreakdown]
+MANIFEST_FILENAME = "manifest.json"
+FETCH_SIZE = 10000
+
+INTEGER = "integer"
+FLOAT = "float"
+STRING = "string"
+
+
+def export_snapshot(engine, directory, models=None):
+    """
+    Exports the tables of the database into ``directory`` with one ``.npy`` file per column, so they can be
+    memory-mapped by ``Snapshot``.
+
+    Integers are stored as ``int64`` and floats as ``float64``, strings as the concatenated UTF-8 bytes
+    (``<column>.data.npy``) and the offsets of every value (``<column>.offsets.npy``). Columns that contain
+    ``NULL``s have an additional ``<column>.null.npy``. The rows are ordered by their ``id``.
+
+    The snapshot is written to a temporary directory first and replaces ``directory`` at the end, so a
+    snapshot is never read while it is being written.
+
+    :param engine: the database engine
+    :param directory: the directory of the snapshot, e.g., ``"data/snapshot/data_2018-05-10"``
+    :param models: the models of the tables to export, defaults to ``SNAPSHOT_MODELS``
+    :return: the manifest of the snapshot
+    """
+    if models is None:
+        models = SNAPSHOT_MODELS
+    temp_directory = directory.rstrip("/\\") + ".tmp"
+    if os.path.exists(temp_directory):
+        shutil.rmtree(temp_directory)
+    os.makedirs(temp_directory)
+
+    manifest = {"created": time.time(), "source": str(engine.url), "tables": {}}
+    with engine.connect() as connection:
+        for model in models:
+            table = model.__table__
+            columns = {column.name: _get_kind(column) for column in table.columns}
+            values = {name: [] for name in columns}
+            result = connection.execute(table.select().order_by(table.c.id))
+            while True:
+                rows = result.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                for name in columns:
+                    values[name] += [row._mapping[name] for row in rows]
+
+            table_directory = os.path.join(temp_directory, table.name)
+            os.makedirs(table_directory)
+            for name, kind in columns.items():
+                _write_column(table_directory, name, kind, values[name])
+            manifest["tables"][table.name] = {"num_rows": len(values["id"]), "columns": columns}
+
+    with open(os.path.join(temp_directory, MANIFEST_FILENAME), "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.replace(temp_directory, directory)
+    return manifest
+
+
+def _get_kind(column):
+    if isinstance(column.type, Integer):
+        return INTEGER
+    if isinstance(column.type, Float):
+        return FLOAT
+    if isinstance(column.type, String):
+        return STRING
+    raise ValueError("Unsupported type {0} of column {1}".format(column.type, column.name))
+
+
+def _write_column(table_directory, name, kind, values):
+    is_null = np.array([value is None for value in values], dtype=bool)
+    if is_null.any():
+        np.save(os.path.join(table_directory, name + ".null.npy"), is_null)
+    if kind == STRING:
+        encoded = [value.encode("utf-8") if value is not None else b"" for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        np.save(os.path.join(table_directory, name + ".data.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        np.save(os.path.join(table_directory, name + ".offsets.npy"), offsets)
+    else:
+        dtype = np.int64 if kind == INTEGER else np.float64
+        np.save(os.path.join(table_directory, name + ".npy"),
+                np.array([value if value is not None else 0 for value in values], dtype=dtype))
+
+
+class StringColumn:
+    """
+    A memory-mapped column of strings, the values are only decoded when they are accessed.
+    """
+
+    def __init__(self, data, offsets, is_null=None):
+        self.data = data
+        self.offsets = offsets
+        self.is_null = is_null
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if self.is_null is not None and self.is_null[index]:
+            return None
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]]).decode("utf-8")
+
+    def to_list(self):
+        data = bytes(self.data)
+        strings = [data[start:end].decode("utf-8") for start, end in zip(self.offsets[:-1], self.offsets[1:])]
+        if self.is_null is not None:
+            strings = [None if is_null else string for string, is_null in zip(strings, self.is_null)]
+        return strings
+
+
+class SnapshotTable:
+    """
+    A table of a ``Snapshot``. ``column`` returns the values of a column as a read-only memory-mapped array,
+    so the pages are only read when they are used and they are shared by all processes that use the snapshot.
+    """
+
+    def __init__(self, directory, name, num_rows, columns):
+        self.directory = directory
+        self.name = name
+        self.num_rows = num_rows
+        self.columns = columns
+        self._loaded = {}
+
+    def __len__(self):
+        return self.num_rows
+
+    def column(self, name):
+        """
+        Returns the column as a memory-mapped ``numpy`` array or as a ``StringColumn``. ``NULL``s are stored as
+        ``0`` (see ``is_null``).
+        """
+        if name not in self.columns:
+            raise KeyError("The table {0} has no column {1}".format(self.name, name))
+        if name not in self._loaded:
+            if self.columns[name] == STRING:
+                self._loaded[name] = StringColumn(self._load(name + ".data.npy"), self._load(name + ".offsets.npy"),
+                                                  self.is_null(name))
+            else:
+                self._loaded[name] = self._load(name + ".npy")
+        return self._loaded[name]
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def is_null(self, name):
+        """
+        Returns a boolean array that is ``True`` where the column is ``NULL`` or ``None`` if there are none.
+        """
+        path = os.path.join(self.directory, name + ".null.npy")
+        return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+    def to_dataframe(self, columns=None):
+        """
+        Returns the table (or the given columns) as a ``DataFrame`` with the same dtypes as ``pd.read_sql``,
+        i.e., integer columns with ``NULL``s become floats with ``NaN``.
+        """
+        if columns is None:
+            columns = list(self.columns.keys())
+        data = {}
+        for name in columns:
+            values = self.column(name)
+            if self.columns[name] == STRING:
+                data[name] = values.to_list()
+                continue
+            is_null = self.is_null(name)
+            if is_null is not None:
+                values = np.where(is_null, np.nan, values)
+            data[name] = values
+        return pd.DataFrame(data, columns=columns)
+
+    def _load(self, filename):
+        return np.load(os.path.join(self.directory, filename), mmap_mode="r")
+
+
+class Snapshot:
+    """
+    Loads a snapshot that was written by ``export_snapshot``. Nothing but the manifest is read until a column is
+    accessed.
+
+    :param directory: the directory of the snapshot
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILENAME), encoding="utf-8") as manifest_file:
+            self.manifest = json.load(manifest_file)
+        self.tables = {name: SnapshotTable(os.path.join(directory, name), name, info["num_rows"], info["columns"])
+                       for name, info in self.manifest["tables"].items()}
+
+    def table(self, name):
+        if name not in self.tables:
+            raise KeyError("The snapshot has no table {0}".format(name))
+        return self.tables[name]
+
+    def __getitem__(self, name):
+        return self.table(name)
@@ -0,0 +1,22 @@
+import os
+import time
+
+from analysis.minhash import build_minhash_index
+from data_collection.database.storage import create_tuned_engine
+
+if __name__ == "__main__":
+    DATABASE_NAME = "data_2018-05-10.db"
+    INDEX_PATH = "data/similarity/minhash.npz"
+    FACETS = ["categories", "mechanics", "families"]
+    NUM_PERMUTATIONS = 128
+    ROWS_PER_BAND = 4  # fewer rows per band find more similar board games (higher recall) but are slower
+
+    engine = create_tuned_engine("sqlite:///data/database/{0}".format(DATABASE_NAME))
+    start_time = time.time()
+    index = build_minhash_index(engine, facets=FACETS, num_permutations=NUM_PERMUTATIONS,
+                                rows_per_band=ROWS_PER_BAND)
+    if not os.path.exists(os.path.dirname(INDEX_PATH)):
+        os.makedirs(os.path.dirname(INDEX_PATH))
+    index.save(INDEX_PATH)
+    print("Indexed {0} board games with {1} bands in {2:.1f} seconds".format(len(index.bgg_ids), index.num_bands,
+                                                                            time.time() - start_time))
@@ -0,0 +1,15 @@
+import time
+
+from analysis.snapshot import export_snapshot
+from data_collection.database.storage import create_tuned_engine
+
+if __name__ == "__main__":
+    DATABASE_NAME = "data_2018-05-10.db"
+    SNAPSHOT_DIRECTORY = "data/snapshot/data_2018-05-10"
+
+    engine = create_tuned_engine("sqlite:///data/database/{0}".format(DATABASE_NAME))
+    start_time = time.time()
+    manifest = export_snapshot(engine, SNAPSHOT_DIRECTORY)
+    for name, info in manifest["tables"].items():
+        print("{0}: {1} rows".format(name, info["num_rows"]))
+    print("Exported the snapshot to {0} in {1:.1f} seconds".format(SNAPSHOT_DIRECTORY, time.time() - start_time))
@@ -1,3 +1,8 @@
 class DownloadFailedException(Exception):
     def __init__(self, *args, **kwargs):
-        Exception.__init__(self, *args, **kwargs)
\ No newline at end of file
+        Exception.__init__(self, *args, **kwargs)
+
+
+class CacheMissException(Exception):
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
@@ -1,30 +1,151 @@
-import requests
+import datetime
+import random
+import threading
 import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from data_collection.common.exceptions import DownloadFailedException, CacheMissException
+
+RETRY_DELAY_IN_SECONDS = 5  # base delay of the exponential backoff after a retryable status code
+RETRY_DELAY_AFTER_DISCONNECT_IN_SECONDS = 30  # base delay of the exponential backoff after a connection error
+MAX_RETRY_DELAY_IN_SECONDS = 300
+MAX_RETRIES = 10
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+REQUEST_TIMEOUT_IN_SECONDS = 60
+CONNECTION_POOL_SIZE = 16  # should be at least the number of concurrent requests
 
-from data_collection.common.exceptions import DownloadFailedException
+_session = None
+_session_lock = threading.Lock()
+_default_cache = None
 
-RETRY_DELAY_IN_SECONDS = 5
-RETRY_DELAY_AFTER_DISCONNECT_IN_SECONDS = 30
+
+def get_session():
+    """
+    Returns the ``requests.Session`` that is shared by all ``PageRequest`` instances (and threads).
+    The session keeps the connections alive and asks for compressed responses.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=CONNECTION_POOL_SIZE, pool_maxsize=CONNECTION_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+            _session = session
+        return _session
+
+
+def set_default_cache(cache):
+    """
+    Sets the ``ResponseCache`` that is used by every ``PageRequest`` that is not given a cache explicitly.
+    Use ``None`` to disable caching.
+    """
+    global _default_cache
+    _default_cache = cache
 
 
 class PageRequest:
 
+    def __init__(self, rate_limiter=None, max_retries=MAX_RETRIES, cache=None):
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.cache = cache if cache is not None else _default_cache
+        # Statistics of the requests sent by this instance, e.g., used to adapt the batch size
+        self.num_requests = 0  # sent to the API (retries included), responses of the cache are not counted
+        self.num_throttled = 0
+        self.num_errors = 0
+        self.last_response_size = 0
+        self.rate_limit_wait_in_seconds = 0.0
+
     def request(self, url, **kwargs):
-        try:
-            result = requests.get(url)
-        except:
-            print("ERROR: Failed to download url={0}. Retrying in {1} seconds...".format(url, RETRY_DELAY_AFTER_DISCONNECT_IN_SECONDS))
-            time.sleep(RETRY_DELAY_AFTER_DISCONNECT_IN_SECONDS)
-            return self.request(url, **kwargs)
-        if result.status_code == 429:
-            print("WARNING: Too many requests (code=429)! Retrying in {0} seconds... For more information see below.".format(RETRY_DELAY_IN_SECONDS))
-            print("(" + self._get_default_message(result.status_code, **kwargs) + ")")
-            time.sleep(RETRY_DELAY_IN_SECONDS)
-            return self.request(url, **kwargs)
-        elif result.status_code != 200:
-            raise DownloadFailedException(self._get_default_message(result.status_code, **kwargs))
+        if self.cache is not None:
+            cached_result = self.cache.get(url)
+            if cached_result is not None:
+                self.last_response_size = len(cached_result.text)
+                return cached_result
+            if self.cache.replay_only:
+                raise CacheMissException("No cached response in replay-only mode for url={0}".format(url))
+
+        result = self._download(url, **kwargs)
+        self.last_response_size = len(result.text)
+        if self.cache is not None:
+            self.cache.put(url, result.text)
         return result
 
+    def _download(self, url, **kwargs):
+        retries = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limit_wait_in_seconds += self.rate_limiter.acquire()
+            self.num_requests += 1
+            try:
+                result = get_session().get(url, timeout=REQUEST_TIMEOUT_IN_SECONDS)
+            except requests.RequestException as e:
+                self.num_errors += 1
+                delay = self._get_backoff_delay(RETRY_DELAY_AFTER_DISCONNECT_IN_SECONDS, retries)
+                self._check_retries_left(retries, "error={0}".format(e), **kwargs)
+                print("ERROR: Failed to download url={0}. Retrying in {1:.1f} seconds...".format(url, delay))
+            else:
+                if result.status_code == 200:
+                    return result
+                if result.status_code not in RETRY_STATUS_CODES:
+                    raise DownloadFailedException(self._get_default_message(result.status_code, **kwargs))
+                if result.status_code == 429:
+                    self.num_throttled += 1
+                else:
+                    self.num_errors += 1
+                self._check_retries_left(retries, self._get_default_message(result.status_code, **kwargs))
+                delay = self._get_retry_after(result)
+                if delay is None:
+                    delay = self._get_backoff_delay(RETRY_DELAY_IN_SECONDS, retries)
+                if result.status_code == 429:
+                    print("WARNING: Too many requests (code=429)! Retrying in {0:.1f} seconds... "
+                          "For more information see below.".format(delay))
+                else:
+                    print("WARNING: Server error (code={0})! Retrying in {1:.1f} seconds... "
+                          "For more information see below.".format(result.status_code, delay))
+                print("(" + self._get_default_message(result.status_code, **kwargs) + ")")
+            time.sleep(delay)
+            retries += 1
+
+    def _check_retries_left(self, retries, message, **kwargs):
+        if retries >= self.max_retries:
+            for key, value in kwargs.items():
+                message += ", {0}={1}".format(key, value)
+            raise DownloadFailedException("Giving up after {0} retries ({1})".format(retries, message))
+
+    def _get_backoff_delay(self, base_delay, retries):
+        """
+        Exponential backoff with jitter: the delay doubles with every retry (up to ``MAX_RETRY_DELAY_IN_SECONDS``)
+        and a random half of it is added so that concurrent requests do not retry at the same time.
+        """
+        delay = min(MAX_RETRY_DELAY_IN_SECONDS, base_delay * 2 ** retries)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _get_retry_after(self, result):
+        """
+        Returns the number of seconds specified by the ``Retry-After`` header (either in seconds or
+        as an HTTP date) or ``None`` if there is no (valid) header.
+        """
+        retry_after = result.headers.get("Retry-After")
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            retry_date = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        if retry_date is None:
+            return None
+        return max(0.0, (retry_date - datetime.datetime.now(retry_date.tzinfo)).total_seconds())
+
     def _get_default_message(self, status_code, **kwargs):
         message = "status_code={0}".format(status_code)
         for key, value in kwargs.items():
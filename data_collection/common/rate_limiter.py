@@ -0,0 +1,50 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket that limits how many requests are sent per second.
+
+    One bucket can be shared by any number of threads (and ``PageRequest`` instances), so all requests that
+    go through it share the same budget. ``capacity`` controls how many requests may be sent in a burst
+    after the bucket was idle for a while.
+
+    :param requests_per_second: the sustained number of requests allowed per second
+    :param capacity: the maximum number of tokens that can be accumulated (defaults to ``requests_per_second``)
+
+    ``num_acquired`` counts the tokens that were acquired so far, i.e., the number of requests that were sent.
+    """
+
+    def __init__(self, requests_per_second, capacity=None):
+        if requests_per_second <= 0:
+            raise ValueError("requests_per_second has to be positive, got {0}".format(requests_per_second))
+        self.rate = float(requests_per_second)
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self.num_acquired = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until ``tokens`` tokens are available and consumes them.
+
+        :return: the number of seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    self.num_acquired += tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
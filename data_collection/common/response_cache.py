@@ -0,0 +1,142 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlparse
+
+DAY_IN_SECONDS = 24 * 60 * 60
+
+# Maps the beginning of the path of an url to the number of seconds a response stays valid
+DEFAULT_TTL_BY_ENDPOINT = {
+    "/xmlapi2/thing": 7 * DAY_IN_SECONDS,
+    "/xmlapi2/plays": 7 * DAY_IN_SECONDS,
+    "/api/collectionstatsgraph": 7 * DAY_IN_SECONDS,
+    "/search/boardgame": 1 * DAY_IN_SECONDS,
+}
+DEFAULT_TTL = 1 * DAY_IN_SECONDS
+DEFAULT_MAX_SIZE_IN_BYTES = 2 * 1024 ** 3
+
+# Mimics the parts of ``requests.Response`` that are used by the ``PageRequest`` subclasses
+CachedResponse = namedtuple("CachedResponse", ["url", "status_code", "text"])
+
+
+class ResponseCache:
+    """
+    A persistent on-disk cache for the responses of ``PageRequest``.
+
+    Every response body is stored gzip-compressed in its own file whose name is the SHA-256 hash of the url.
+    An SQLite index next to the files keeps track of when an entry was created and last accessed, so that
+    expired entries are not returned (see ``ttl_by_endpoint``) and the least recently used entries are
+    evicted as soon as the cache grows beyond ``max_size_in_bytes``.
+
+    If ``replay_only`` is set, ``PageRequest`` never touches the network and expired entries are returned
+    as well, which allows to replay a previous crawl offline.
+
+    :param directory: the directory where the cache is stored
+    :param ttl_by_endpoint: maps the beginning of an url path to the time to live of its responses in seconds
+    :param default_ttl: the time to live in seconds for urls that do not match any entry of ``ttl_by_endpoint``
+    :param max_size_in_bytes: the maximum total size of the compressed bodies
+    :param replay_only: if ``True`` no requests are sent and expired entries are still returned
+    """
+
+    def __init__(self, directory=os.path.join("data", "cache"), ttl_by_endpoint=None, default_ttl=DEFAULT_TTL,
+                 max_size_in_bytes=DEFAULT_MAX_SIZE_IN_BYTES, replay_only=False):
+        self.directory = directory
+        self.ttl_by_endpoint = ttl_by_endpoint if ttl_by_endpoint is not None else DEFAULT_TTL_BY_ENDPOINT
+        self.default_ttl = default_ttl
+        self.max_size_in_bytes = max_size_in_bytes
+        self.replay_only = replay_only
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, url TEXT NOT NULL, "
+                                 "created REAL NOT NULL, last_access REAL NOT NULL, size INTEGER NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self._connection.commit()
+        self._total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, url):
+        """
+        Returns the cached ``CachedResponse`` for ``url`` or ``None`` if there is no valid entry.
+        """
+        key = self._get_key(url)
+        with self._lock:
+            row = self._connection.execute("SELECT created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or (not self.replay_only and time.time() - row[0] > self._get_ttl(url)):
+                self.misses += 1
+                return None
+            try:
+                with open(self._get_path(key), "rb") as file:
+                    text = gzip.decompress(file.read()).decode("utf-8")
+            except (OSError, EOFError):  # the file was removed or is corrupt
+                self._delete(key)
+                self._connection.commit()
+                self.misses += 1
+                return None
+            self._connection.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._connection.commit()
+            self.hits += 1
+        return CachedResponse(url=url, status_code=200, text=text)
+
+    def put(self, url, text):
+        key = self._get_key(url)
+        body = gzip.compress(text.encode("utf-8"))
+        path = self._get_path(key)
+        with self._lock:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            temporary_path = path + ".tmp"
+            with open(temporary_path, "wb") as file:
+                file.write(body)
+            os.replace(temporary_path, path)
+
+            self._delete_from_index(key)
+            now = time.time()
+            self._connection.execute("INSERT INTO entries (key, url, created, last_access, size) "
+                                     "VALUES (?, ?, ?, ?, ?)", (key, url, now, now, len(body)))
+            self._total_size += len(body)
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        while self._total_size > self.max_size_in_bytes:
+            rows = self._connection.execute("SELECT key FROM entries ORDER BY last_access LIMIT 100").fetchall()
+            if not rows:
+                break
+            for row in rows:
+                self._delete(row[0])
+                if self._total_size <= self.max_size_in_bytes:
+                    break
+
+    def _delete(self, key):
+        self._delete_from_index(key)
+        try:
+            os.remove(self._get_path(key))
+        except OSError:
+            pass
+
+    def _delete_from_index(self, key):
+        row = self._connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._total_size -= row[0]
+
+    def _get_ttl(self, url):
+        path = urlparse(url).path
+        for endpoint, ttl in self.ttl_by_endpoint.items():
+            if path.startswith(endpoint):
+                return ttl
+        return self.default_ttl
+
+    def _get_key(self, url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".gz")
@@ -0,0 +1,173 @@
+import json
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from data_collection.database.tables import YearFacetAggregate, Category, CategoryToBoardGame, Mechanic, \
+    MechanicToBoardGame, Family, FamilyToBoardGame, Designer, DesignerToBoardGame, Artist, ArtistToBoardGame, \
+    Publisher, PublisherToBoardGame
+
+ALL_FACET = "all"
+# (dimension table, link table, column of the link table), the facet is the name of the dimension table
+AGGREGATED_FACETS = [
+    (Category, CategoryToBoardGame, "category_id"),
+    (Mechanic, MechanicToBoardGame, "mechanic_id"),
+    (Family, FamilyToBoardGame, "family_id"),
+    (Designer, DesignerToBoardGame, "designer_id"),
+    (Artist, ArtistToBoardGame, "artist_id"),
+    (Publisher, PublisherToBoardGame, "publisher_id"),
+]
+# column of the aggregate table: the contribution of the board games ``b``
+AGGREGATES = [
+    ("num_boardgames", "COUNT(*)"),
+    ("sum_num_ratings", "SUM(b.num_ratings)"),
+    ("sum_avg_rating", "SUM(b.avg_rating)"),
+    ("sum_weighted_avg_rating", "SUM(b.avg_rating * b.num_ratings)"),
+    ("sum_num_weights", "SUM(b.num_weights)"),
+    ("sum_avg_weight", "SUM(b.avg_weight)"),
+    ("sum_weighted_avg_weight", "SUM(b.avg_weight * b.num_weights)"),
+    ("sum_total_plays", "SUM(b.total_plays)"),
+]
+
+
+def _get_contribution_statements(where_clause):
+    """
+    Returns one ``INSERT ... SELECT ... GROUP BY`` statement for the row of ``ALL_FACET`` and one per facet that
+    adds ``:sign`` times the contribution of the board games that match ``where_clause`` to the aggregates.
+    """
+    table_name = YearFacetAggregate.__tablename__
+    columns = ", ".join(column for column, _ in AGGREGATES)
+    values = ", ".join(":sign * {0}".format(expression) for _, expression in AGGREGATES)
+    on_conflict = "ON CONFLICT (year_published, facet, facet_id) DO UPDATE SET {0}".format(
+        ", ".join("{0} = {0} + excluded.{0}".format(column) for column, _ in AGGREGATES))
+    statements = [
+        "INSERT INTO {0} (year_published, facet, facet_id, {1}) "
+        "SELECT b.year_published, '{2}', 0, {3} FROM boardgames b WHERE {4} "
+        "GROUP BY b.year_published {5}".format(table_name, columns, ALL_FACET, values, where_clause, on_conflict)]
+    for model, link_model, link_column in AGGREGATED_FACETS:
+        statements.append(
+            "INSERT INTO {0} (year_published, facet, facet_id, {1}) "
+            "SELECT b.year_published, '{2}', l.{3}, {4} FROM boardgames b "
+            "INNER JOIN {5} l ON l.boardgame_id = b.id WHERE {6} "
+            "GROUP BY b.year_published, l.{3} {7}".format(table_name, columns, model.__tablename__, link_column,
+                                                         values, link_model.__tablename__, where_clause,
+                                                         on_conflict))
+    return statements
+
+
+def add_contributions(connection, boardgame_ids, sign=1):
+    """
+    Adds the statistics of the given board games (and their links) to the aggregates with a single set-based
+    statement per facet. Has to be called within the transaction that stored the board games.
+
+    :param boardgame_ids: the ids (in the database) of the board games
+    :param sign: ``-1`` subtracts them instead, see ``subtract_contributions``
+    """
+    boardgame_ids = [int(boardgame_id) for boardgame_id in boardgame_ids]
+    if not boardgame_ids:
+        return
+    parameters = {"sign": sign, "boardgame_ids": json.dumps(boardgame_ids)}
+    for statement in _get_contribution_statements("b.id IN (SELECT value FROM json_each(:boardgame_ids))"):
+        connection.execute(text(statement), parameters)
+    if sign < 0:
+        connection.execute(text("DELETE FROM {0} WHERE num_boardgames <= 0".format(
+            YearFacetAggregate.__tablename__)))
+
+
+def subtract_contributions(connection, boardgame_ids):
+    """
+    Subtracts the statistics of the given board games from the aggregates, e.g., before they are refreshed (and
+    added again afterwards).
+    """
+    add_contributions(connection, boardgame_ids, sign=-1)
+
+
+def get_rebuild_statements():
+    """
+    Returns the SQL statements that compute all aggregates from scratch.
+    """
+    return ["DELETE FROM {0}".format(YearFacetAggregate.__tablename__)] + \
+        [statement.replace(":sign", "1") for statement in _get_contribution_statements("1")]
+
+
+def rebuild_aggregates(engine):
+    """
+    Recomputes all aggregates from scratch, e.g., to get rid of the rounding errors that adding and subtracting
+    floats accumulates over many refreshes.
+    """
+    with engine.begin() as connection:
+        for statement in get_rebuild_statements():
+            connection.execute(text(statement))
+
+
+def get_year_aggregates(engine, facet=ALL_FACET, facet_bgg_id=None):
+    """
+    Returns the aggregates per year, e.g., the number of board games published per year or (with
+    ``facet="families", facet_bgg_id=8374``) the number of board games on Kickstarter per year.
+
+    :param facet: ``ALL_FACET`` or the name of a facet, e.g., ``"categories"``
+    :param facet_bgg_id: only return the rows of this category (mechanic, etc.), if ``None`` there is one row per
+    year and category (mechanic, etc.)
+    :return: a ``DataFrame`` with the columns ``year_published``, ``facet_id`` and the columns of ``AGGREGATES``
+    as well as the means (see ``_add_means``)
+    """
+    sql = "SELECT a.* FROM {0} a".format(YearFacetAggregate.__tablename__)
+    parameters = {"facet": facet}
+    if facet_bgg_id is not None:
+        sql += " INNER JOIN {0} f ON f.id = a.facet_id AND f.bgg_id = :facet_bgg_id".format(_get_table_name(facet))
+        parameters["facet_bgg_id"] = int(facet_bgg_id)
+    sql += " WHERE a.facet = :facet ORDER BY a.year_published, a.facet_id"
+    with engine.connect() as connection:
+        aggregates_df = pd.read_sql(text(sql), connection, params=parameters)
+    return _add_means(aggregates_df.drop(columns=["id", "facet"]))
+
+
+def get_facet_aggregates(engine, facet, min_year=None, max_year=None):
+    """
+    Returns the aggregates of every category (mechanic, etc.) that has board games, summed over the years, e.g.,
+    to compare the categories before and after 2015.
+
+    :param facet: the name of a facet, e.g., ``"categories"``
+    :param min_year: only sum the board games that were published in or after this year
+    :param max_year: only sum the board games that were published in or before this year
+    :return: a ``DataFrame`` indexed by the id of the category (mechanic, etc.) with the columns ``bgg_id``,
+    ``name``, the columns of ``AGGREGATES`` and the means (see ``_add_means``)
+    """
+    conditions = ["a.facet = :facet"]
+    parameters = {"facet": facet}
+    if min_year is not None:
+        conditions.append("a.year_published >= :min_year")
+        parameters["min_year"] = int(min_year)
+    if max_year is not None:
+        conditions.append("a.year_published <= :max_year")
+        parameters["max_year"] = int(max_year)
+    sql = "SELECT a.facet_id AS id, f.bgg_id AS bgg_id, f.name AS name, {0} FROM {1} a " \
+          "INNER JOIN {2} f ON f.id = a.facet_id WHERE {3} GROUP BY a.facet_id ORDER BY a.facet_id".format(
+              ", ".join("SUM(a.{0}) AS {0}".format(column) for column, _ in AGGREGATES),
+              YearFacetAggregate.__tablename__, _get_table_name(facet), " AND ".join(conditions))
+    with engine.connect() as connection:
+        aggregates_df = pd.read_sql(text(sql), connection, params=parameters)
+    return _add_means(aggregates_df.set_index("id"))
+
+
+def _get_table_name(facet):
+    table_names = [model.__tablename__ for model, _, _ in AGGREGATED_FACETS]
+    if facet not in table_names:
+        raise KeyError("Unknown facet {0}, expected one of {1}".format(facet, table_names))
+    return facet
+
+
+def _add_means(aggregates_df):
+    """
+    Adds the columns ``avg_rating`` and ``avg_weight`` (the means of the board games) and ``weighted_avg_rating``
+    and ``weighted_avg_weight`` (weighted by the number of votes).
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        aggregates_df["avg_rating"] = aggregates_df["sum_avg_rating"] / aggregates_df["num_boardgames"]
+        aggregates_df["avg_weight"] = aggregates_df["sum_avg_weight"] / aggregates_df["num_boardgames"]
+        aggregates_df["weighted_avg_rating"] = aggregates_df["sum_weighted_avg_rating"] / \
+            aggregates_df["sum_num_ratings"]
+        aggregates_df["weighted_avg_weight"] = aggregates_df["sum_weighted_avg_weight"] / \
+            aggregates_df["sum_num_weights"]
+    return aggregates_df
@@ -0,0 +1,203 @@
+import numpy as np
+
+from data_collection.database.tables import BoardGame, Category, CategoryToBoardGame, Mechanic, \
+    MechanicToBoardGame, Family, FamilyToBoardGame, Designer, DesignerToBoardGame, Artist, ArtistToBoardGame, \
+    Publisher, PublisherToBoardGame, PlayerCountToBoardGame, RankType, BoardGameRanking, RatingsBreakdown
+from data_collection.database.utils import DimensionCache, select_ids_by_bgg_id
+from data_collection.database.aggregates import add_contributions
+from data_collection.fetch_data.concurrent_download import DownloadedBoardGame
+
+# (attribute of the BoardGameContainer, dimension table, link table, column of the link table)
+LINKED_DIMENSIONS = [
+    ("category_list", Category, CategoryToBoardGame, "category_id"),
+    ("mechanic_list", Mechanic, MechanicToBoardGame, "mechanic_id"),
+    ("family_list", Family, FamilyToBoardGame, "family_id"),
+    ("designer_list", Designer, DesignerToBoardGame, "designer_id"),
+    ("artist_list", Artist, ArtistToBoardGame, "artist_id"),
+    ("publisher_list", Publisher, PublisherToBoardGame, "publisher_id"),
+]
+
+
+class BulkWriter:
+    """
+    Stores whole batches of downloaded board games at once.
+
+    Instead of adding one ORM object per row, every table is written with a single executemany ``INSERT``
+    and the ids of the categories, mechanics, etc. are resolved in memory by a ``DimensionCache``, all within a
+    single transaction per batch. The aggregates (see ``data_collection.database.aggregates``) are updated within
+    the same transaction. If the transaction fails, the board games of the batch are written one by one,
+    so a single broken board game does not cost the whole batch.
+
+    :param session: the session whose connection and transaction is used
+    :param dimension_cache: the ``DimensionCache`` to use, if ``None`` one is loaded from the database
+    """
+
+    def __init__(self, session, dimension_cache=None):
+        self.session = session
+        self.dimension_cache = dimension_cache if dimension_cache is not None else DimensionCache.load(session)
+
+    def write(self, downloaded_list, url_dict):
+        """
+        Stores the board games along with all of their relations and commits.
+
+        :param downloaded_list: a list of ``DownloadedBoardGame``
+        :param url_dict: maps the board game ids to the url on BGG
+        :return: a tuple of the set of successfully stored board game ids and the set of failed ones
+        """
+        if len(downloaded_list) == 0:
+            return set(), set()
+        try:
+            self._write(self.session.connection(), downloaded_list, url_dict)
+            self.session.commit()
+            self.dimension_cache.commit()
+            return {downloaded.boardgame.bgg_id for downloaded in downloaded_list}, set()
+        except Exception as e:
+            self.session.rollback()
+            self.dimension_cache.rollback()
+            if len(downloaded_list) == 1:
+                print("ERROR: Failed to store game_id={0} ({1})".format(downloaded_list[0].boardgame.bgg_id, e))
+                return set(), {downloaded_list[0].boardgame.bgg_id}
+
+        succeeded, failed = set(), set()
+        for downloaded in downloaded_list:
+            this_succeeded, this_failed = self.write([downloaded], url_dict)
+            succeeded |= this_succeeded
+            failed |= this_failed
+        return succeeded, failed
+
+    def write_batch(self, batch, total_plays_list, ratings_breakdown_list, url_dict):
+        """
+        Same as ``write`` but for a columnar ``BoardGameBatch`` (see ``data_collection.fetch_data.columnar``).
+
+        :param total_plays_list: the total plays of every board game of the batch (in the same order)
+        :param ratings_breakdown_list: the ratings breakdown of every board game of the batch (in the same order)
+        :return: a tuple of the set of successfully stored board game ids and the set of failed ones
+        """
+        if len(batch) == 0:
+            return set(), set()
+        try:
+            self._write_batch(self.session.connection(), batch, total_plays_list, ratings_breakdown_list, url_dict)
+            self.session.commit()
+            self.dimension_cache.commit()
+            return set(batch.bgg_ids.tolist()), set()
+        except Exception as e:
+            self.session.rollback()
+            self.dimension_cache.rollback()
+            print("ERROR: Failed to store the batch {0} ({1}), storing its board games one by one".format(
+                batch.bgg_ids.tolist(), e))
+        # Stores the board games one by one
+        return self.write([DownloadedBoardGame(boardgame=boardgame, total_plays=total_plays,
+                                               ratings_breakdown=ratings_breakdown)
+                           for boardgame, total_plays, ratings_breakdown in zip(
+                               batch.to_containers(), total_plays_list, ratings_breakdown_list)], url_dict)
+
+    def _write_batch(self, connection, batch, total_plays_list, ratings_breakdown_list, url_dict):
+        columns = {column: values if isinstance(values, list) else values.tolist()
+                   for column, values in batch.columns.items()}
+        bgg_ids = columns["bgg_id"]
+        boardgame_rows = []
+        for index, bgg_id in enumerate(bgg_ids):
+            row = {column: values[index] for column, values in columns.items()}
+            row["url"] = url_dict[bgg_id]
+            row["total_plays"] = total_plays_list[index]
+            boardgame_rows.append(row)
+        connection.execute(BoardGame.__table__.insert(), boardgame_rows)
+        boardgame_id_dict = select_ids_by_bgg_id(connection, BoardGame, bgg_ids)
+        boardgame_ids = np.array([boardgame_id_dict[bgg_id] for bgg_id in bgg_ids], dtype=np.int64)
+
+        for list_name, model, link_model, link_column in LINKED_DIMENSIONS:
+            links = batch.links[list_name]
+            if len(links["bgg_id"]) == 0:
+                continue
+            linked_bgg_ids = np.unique(links["bgg_id"]).tolist()
+            names = batch.names[list_name]
+            dimension_ids = self.dimension_cache.resolve_names(
+                connection, model, {bgg_id: names[bgg_id] for bgg_id in linked_bgg_ids})
+            pairs = set(zip(boardgame_ids[links["game_index"]].tolist(),
+                            [dimension_ids[bgg_id] for bgg_id in links["bgg_id"].tolist()]))
+            connection.execute(link_model.__table__.insert(),
+                               [{link_column: linked_id, "boardgame_id": boardgame_id}
+                                for boardgame_id, linked_id in pairs])
+
+        rankings = batch.rankings
+        if len(rankings["bgg_id"]) > 0:
+            names = batch.names["ranking_list"]
+            ranktype_ids = self.dimension_cache.resolve_names(
+                connection, RankType, {bgg_id: names[bgg_id] for bgg_id in np.unique(rankings["bgg_id"]).tolist()})
+            connection.execute(BoardGameRanking.__table__.insert(), [
+                dict(boardgame_id=boardgame_id, ranktype_id=ranktype_ids[bgg_id],
+                     rank=int(rank) if rank == rank else None, geek_rating=geek_rating if geek_rating == geek_rating
+                     else None)
+                for boardgame_id, bgg_id, rank, geek_rating in zip(
+                    boardgame_ids[rankings["game_index"]].tolist(), rankings["bgg_id"].tolist(),
+                    rankings["rank"].tolist(), rankings["geek_rating"].tolist())])
+
+        player_counts = batch.player_counts
+        if len(player_counts["player_count"]) > 0:
+            connection.execute(PlayerCountToBoardGame.__table__.insert(), [
+                dict(boardgame_id=boardgame_id, player_count=player_count, num_best=num_best,
+                     num_recommended=num_recommended, num_not_recommended=num_not_recommended)
+                for boardgame_id, player_count, num_best, num_recommended, num_not_recommended in zip(
+                    boardgame_ids[player_counts["game_index"]].tolist(), player_counts["player_count"],
+                    player_counts["num_best"].tolist(), player_counts["num_recommended"].tolist(),
+                    player_counts["num_not_recommended"].tolist())])
+
+        ratings_rows = []
+        for boardgame_id, ratings_breakdown in zip(boardgame_ids.tolist(), ratings_breakdown_list):
+            ratings_row = {"num_{0}".format(rating): ratings_breakdown[rating] for rating in range(1, 11)}
+            ratings_row["boardgame_id"] = boardgame_id
+            ratings_rows.append(ratings_row)
+        connection.execute(RatingsBreakdown.__table__.insert(), ratings_rows)
+        add_contributions(connection, boardgame_ids.tolist())
+
+    def _write(self, connection, downloaded_list, url_dict):
+        boardgame_rows = []
+        for downloaded in downloaded_list:
+            bg = downloaded.boardgame
+            boardgame_rows.append(dict(
+                bgg_id=bg.bgg_id, url=url_dict[bg.bgg_id], thumbnail_url=bg.thumbnail_url, image_url=bg.image_url,
+                name=bg.name, description=bg.description, year_published=bg.year_published,
+                min_players=bg.min_players, max_players=bg.max_players, playtime=bg.playtime,
+                min_playtime=bg.min_playtime, max_playtime=bg.max_playtime, min_age=bg.min_age,
+                num_ratings=bg.num_ratings, avg_rating=bg.avg_rating, num_owning=bg.num_owning,
+                num_trading=bg.num_trading, num_wanting=bg.num_wanting, num_wishing=bg.num_wishing,
+                num_weights=bg.num_weights, avg_weight=bg.avg_weight, total_plays=downloaded.total_plays))
+        connection.execute(BoardGame.__table__.insert(), boardgame_rows)
+        boardgame_ids = select_ids_by_bgg_id(connection, BoardGame, [row["bgg_id"] for row in boardgame_rows])
+
+        for list_name, model, link_model, link_column in LINKED_DIMENSIONS:
+            containers = [element for downloaded in downloaded_list
+                          for element in getattr(downloaded.boardgame, list_name)]
+            dimension_ids = self.dimension_cache.resolve_ids(connection, model, containers)
+            link_rows = []
+            for downloaded in downloaded_list:
+                boardgame_id = boardgame_ids[downloaded.boardgame.bgg_id]
+                linked_ids = {dimension_ids[element.bgg_id] for element in getattr(downloaded.boardgame, list_name)}
+                link_rows += [{link_column: linked_id, "boardgame_id": boardgame_id} for linked_id in linked_ids]
+            if link_rows:
+                connection.execute(link_model.__table__.insert(), link_rows)
+
+        rankings = [element for downloaded in downloaded_list for element in downloaded.boardgame.ranking_list]
+        ranktype_ids = self.dimension_cache.resolve_ids(connection, RankType, rankings)
+        ranking_rows = [dict(boardgame_id=boardgame_ids[downloaded.boardgame.bgg_id],
+                             ranktype_id=ranktype_ids[element.bgg_id], rank=element.rank,
+                             geek_rating=element.geek_rating)
+                        for downloaded in downloaded_list for element in downloaded.boardgame.ranking_list]
+        if ranking_rows:
+            connection.execute(BoardGameRanking.__table__.insert(), ranking_rows)
+
+        player_count_rows = [dict(boardgame_id=boardgame_ids[downloaded.boardgame.bgg_id],
+                                  player_count=element.player_count, num_best=element.num_best,
+                                  num_recommended=element.num_recommended,
+                                  num_not_recommended=element.num_not_recommended)
+                             for downloaded in downloaded_list for element in downloaded.boardgame.player_count_list]
+        if player_count_rows:
+            connection.execute(PlayerCountToBoardGame.__table__.insert(), player_count_rows)
+
+        ratings_rows = []
+        for downloaded in downloaded_list:
+            ratings_row = {"num_{0}".format(rating): downloaded.ratings_breakdown[rating] for rating in range(1, 11)}
+            ratings_row["boardgame_id"] = boardgame_ids[downloaded.boardgame.bgg_id]
+            ratings_rows.append(ratings_row)
+        connection.execute(RatingsBreakdown.__table__.insert(), ratings_rows)
+        add_contributions(connection, boardgame_ids.values())
@@ -0,0 +1,264 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Column, Integer, String, Float, Sequence, select, func, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.declarative import declarative_base
+
+from data_collection.database.tables import BoardGame, RankType, BoardGameRanking, RatingsBreakdown
+from data_collection.database.refresh import REFRESHED_COLUMNS, RATINGS_COLUMNS
+from data_collection.database.storage import create_tuned_engine
+
+# The history is stored in its own database, so it has its own tables
+HistoryBase = declarative_base()
+
+VANISHED = -np.inf  # marks a value that vanished within get_series
+
+
+class Crawl(HistoryBase):
+    __tablename__ = "crawls"
+
+    id = Column(Integer, Sequence('crawl_id_seq'), primary_key=True)
+    crawl_date = Column(String, unique=True, nullable=False)  # ISO format, e.g., "2018-05-10"
+    source = Column(String)
+    num_changes = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return "<Crawl(crawl_date={0}, num_changes={1})>".format(self.crawl_date, self.num_changes)
+
+
+class HistoryField(HistoryBase):
+    __tablename__ = "history_fields"
+
+    id = Column(Integer, Sequence('history_field_id_seq'), primary_key=True)
+    name = Column(String, unique=True, nullable=False)  # e.g., "num_ratings", "num_10" or "rank:Board Game Rank"
+
+    def __repr__(self):
+        return "<HistoryField(name={0})>".format(self.name)
+
+
+class HistoryValue(HistoryBase):
+    """
+    A value that changed with the crawl (or appeared for the first time), a value of ``None`` means that the
+    field disappeared (e.g., a ranking).
+    """
+    __tablename__ = "history_values"
+
+    bgg_id = Column(Integer, primary_key=True)
+    field_id = Column(Integer, primary_key=True)
+    crawl_id = Column(Integer, primary_key=True)
+    value = Column(Float)
+
+    def __repr__(self):
+        return "<HistoryValue(bgg_id={0}, field={1}, crawl={2})>".format(self.bgg_id, self.field_id, self.crawl_id)
+
+
+class LatestValue(HistoryBase):
+    """
+    The latest known value of every field of every board game, the deltas of a new crawl are computed against it.
+    """
+    __tablename__ = "history_latest"
+
+    bgg_id = Column(Integer, primary_key=True)
+    field_id = Column(Integer, primary_key=True)
+    value = Column(Float)
+
+    def __repr__(self):
+        return "<LatestValue(bgg_id={0}, field={1}, value={2})>".format(self.bgg_id, self.field_id, self.value)
+
+
+class HistoryStore:
+    """
+    A time series of the volatile values of the board games (the statistics of ``BoardGame``, the rankings and the
+    ratings breakdown) that is keyed by ``(bgg_id, crawl_date)``.
+
+    Every crawl only stores the values that changed since the previous crawl, so nightly crawls cost a fraction
+    of a full copy of the database. A crawl only covers the board games it contains, board games that are missing
+    keep their previous values.
+
+    :param database_url: e.g., ``"sqlite:///data/database/history.db"``
+    """
+
+    def __init__(self, database_url):
+        self.engine = create_tuned_engine(database_url)
+        HistoryBase.metadata.create_all(self.engine)
+
+    def record_crawl(self, crawl_engine, crawl_date, source=None):
+        """
+        Reads the volatile values of all board games from a crawl database and records them.
+
+        :param crawl_engine: the engine of the database of the crawl
+        :param crawl_date: a ``datetime.date``, ``datetime.datetime`` or an ISO formatted string
+        :return: the number of values that changed
+        """
+        return self.record_state(read_state(crawl_engine), crawl_date,
+                                 source=source if source is not None else str(crawl_engine.url))
+
+    def record_state(self, state, crawl_date, source=None):
+        """
+        Records the values that changed since the previous crawl.
+
+        :param state: a dictionary that maps ``(bgg_id, field name)`` to the value of the crawl
+        :param crawl_date: has to be later than the date of every recorded crawl
+        :return: the number of values that changed
+        """
+        crawl_date = _to_iso_format(crawl_date)
+        with self.engine.begin() as connection:
+            last_crawl_date = connection.execute(select(func.max(Crawl.__table__.c.crawl_date))).scalar()
+            if last_crawl_date is not None and crawl_date <= last_crawl_date:
+                raise ValueError("The crawl of {0} is not later than the last crawl of {1}".format(
+                    crawl_date, last_crawl_date))
+            field_ids = self._get_field_ids(connection, {field for _, field in state.keys()})
+            state = {(bgg_id, field_ids[field]): value for (bgg_id, field), value in state.items()}
+
+            latest_table = LatestValue.__table__
+            bgg_ids = {bgg_id for bgg_id, _ in state.keys()}
+            latest = {(bgg_id, field_id): value for bgg_id, field_id, value in connection.execute(
+                select(latest_table.c.bgg_id, latest_table.c.field_id, latest_table.c.value))
+                if bgg_id in bgg_ids}
+
+            changes = {key: value for key, value in state.items()
+                       if key not in latest or latest[key] != value}
+            # Fields of the crawled board games that vanished, e.g., a ranking that no longer exists
+            changes.update({key: None for key, value in latest.items() if key not in state and value is not None})
+
+            result = connection.execute(Crawl.__table__.insert().values(crawl_date=crawl_date, source=source,
+                                                                        num_changes=len(changes)))
+            crawl_id = result.inserted_primary_key[0]
+            if changes:
+                connection.execute(HistoryValue.__table__.insert(), [
+                    {"bgg_id": bgg_id, "field_id": field_id, "crawl_id": crawl_id, "value": value}
+                    for (bgg_id, field_id), value in changes.items()])
+                statement = insert(latest_table)
+                statement = statement.on_conflict_do_update(index_elements=["bgg_id", "field_id"],
+                                                            set_={"value": statement.excluded.value})
+                connection.execute(statement, [{"bgg_id": bgg_id, "field_id": field_id, "value": value}
+                                               for (bgg_id, field_id), value in changes.items()])
+        return len(changes)
+
+    def _get_field_ids(self, connection, field_names):
+        table = HistoryField.__table__
+        field_ids = dict(connection.execute(select(table.c.name, table.c.id)).all())
+        missing_field_names = sorted(field_names - set(field_ids.keys()))
+        if missing_field_names:
+            connection.execute(table.insert(), [{"name": name} for name in missing_field_names])
+            field_ids = dict(connection.execute(select(table.c.name, table.c.id)).all())
+        return field_ids
+
+    def get_crawls(self):
+        """
+        Returns a ``DataFrame`` of all recorded crawls.
+        """
+        with self.engine.connect() as connection:
+            return pd.read_sql(select(Crawl.__table__).order_by(Crawl.__table__.c.crawl_date), connection)
+
+    def get_state_as_of(self, date, bgg_ids=None):
+        """
+        Returns the latest values of every board game that were recorded up to (and including) ``date``.
+
+        :param bgg_ids: only return these board games, all if ``None``
+        :return: a ``DataFrame`` indexed by the bgg id with one column per field
+        """
+        sql = "SELECT h.bgg_id AS bgg_id, f.name AS field, h.value AS value, MAX(h.crawl_id) " \
+              "FROM history_values h " \
+              "INNER JOIN history_fields f ON f.id = h.field_id " \
+              "WHERE h.crawl_id IN (SELECT id FROM crawls WHERE crawl_date <= :crawl_date) {0}" \
+              "GROUP BY h.bgg_id, h.field_id"
+        parameters = {"crawl_date": _get_upper_bound(date)}
+        if bgg_ids is not None:
+            bgg_ids = [int(bgg_id) for bgg_id in bgg_ids]
+            sql = sql.format("AND h.bgg_id IN ({0}) ".format(",".join(str(bgg_id) for bgg_id in bgg_ids)))
+        else:
+            sql = sql.format("")
+        with self.engine.connect() as connection:
+            values_df = pd.read_sql(text(sql), connection, params=parameters)
+        values_df = values_df[values_df["value"].notnull()]
+        state_df = values_df.pivot(index="bgg_id", columns="field", values="value")
+        state_df.columns.name = None
+        return state_df
+
+    def get_series(self, bgg_id, fields=None):
+        """
+        Returns the values of a board game for every crawl since it was recorded for the first time, the values
+        of crawls that did not change it are filled in.
+
+        :param fields: only return these fields, all if ``None``
+        :return: a ``DataFrame`` indexed by the crawl date with one column per field
+        """
+        sql = "SELECT c.crawl_date AS crawl_date, f.name AS field, h.value AS value " \
+              "FROM history_values h " \
+              "INNER JOIN history_fields f ON f.id = h.field_id " \
+              "INNER JOIN crawls c ON c.id = h.crawl_id " \
+              "WHERE h.bgg_id = :bgg_id"
+        with self.engine.connect() as connection:
+            values_df = pd.read_sql(text(sql), connection, params={"bgg_id": int(bgg_id)})
+            crawl_dates = connection.execute(select(Crawl.__table__.c.crawl_date)
+                                             .order_by(Crawl.__table__.c.crawl_date)).scalars().all()
+        if fields is not None:
+            values_df = values_df[values_df["field"].isin(fields)]
+        if len(values_df) == 0:
+            return pd.DataFrame(columns=fields if fields is not None else [])
+        # A delta of None (the value vanished) has to be carried forward as well, so it is replaced by a marker
+        values_df = values_df.assign(value=values_df["value"].fillna(VANISHED))
+        series_df = values_df.pivot(index="crawl_date", columns="field", values="value")
+        series_df = series_df.reindex([date for date in crawl_dates if date >= series_df.index.min()])
+        series_df = series_df.ffill().replace(VANISHED, np.nan)
+        series_df.columns.name = None
+        series_df.index.name = "crawl_date"
+        return series_df
+
+
+def read_state(engine):
+    """
+    Reads the volatile values of all board games of a crawl database.
+
+    :return: a dictionary that maps ``(bgg_id, field name)`` to the value, the rankings are named
+    ``"rank:<name of the rank type>"`` and ``"geek_rating:<name of the rank type>"``, e.g.,
+    ``"rank:Board Game Rank"``
+    """
+    boardgames = BoardGame.__table__
+    state = {}
+    with engine.connect() as connection:
+        for row in connection.execute(select(boardgames.c.bgg_id, *[boardgames.c[column]
+                                                                     for column in REFRESHED_COLUMNS])):
+            for column in REFRESHED_COLUMNS:
+                state[(row.bgg_id, column)] = _to_float(row._mapping[column])
+
+        ratings = RatingsBreakdown.__table__
+        query = select(boardgames.c.bgg_id, *[ratings.c[column] for column in RATINGS_COLUMNS]) \
+            .join(ratings, ratings.c.boardgame_id == boardgames.c.id)
+        for row in connection.execute(query):
+            for column in RATINGS_COLUMNS:
+                state[(row.bgg_id, column)] = _to_float(row._mapping[column])
+
+        rankings = BoardGameRanking.__table__
+        ranktypes = RankType.__table__
+        query = select(boardgames.c.bgg_id, ranktypes.c.name, rankings.c.rank, rankings.c.geek_rating) \
+            .join(rankings, rankings.c.boardgame_id == boardgames.c.id) \
+            .join(ranktypes, ranktypes.c.id == rankings.c.ranktype_id)
+        for bgg_id, name, rank, geek_rating in connection.execute(query):
+            state[(bgg_id, "rank:{0}".format(name))] = _to_float(rank)
+            state[(bgg_id, "geek_rating:{0}".format(name))] = _to_float(geek_rating)
+    return state
+
+
+def _to_float(value):
+    return float(value) if value is not None else None
+
+
+def _to_iso_format(date):
+    if isinstance(date, (datetime.date, datetime.datetime)):
+        return date.isoformat()
+    return str(date)
+
+
+def _get_upper_bound(date):
+    """
+    Returns the ISO formatted date, if it is a day without a time it is extended such that it includes the crawls
+    of the whole day (e.g., ``"2018-05-10T12:00:00"``).
+    """
+    iso_date = _to_iso_format(date)
+    if len(iso_date) == len("YYYY-MM-DD"):
+        iso_date += "T~"  # "~" sorts after every digit
+    return iso_date
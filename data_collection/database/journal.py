@@ -0,0 +1,77 @@
+import time
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from data_collection.database.tables import BoardGame, CrawlStatus, CrawlBatch
+
+SUCCESS = 1
+ERROR = 0
+EXISTS = 2  # skipped, because the board game is already stored
+
+MAX_MESSAGE_LENGTH = 500
+
+
+class CrawlJournal:
+    """
+    Keeps track of the crawl in the database: the latest status of every board game id (``crawl_status``) and
+    the timing of every batch (``crawl_batches``).
+
+    It also knows which board games are already stored, so a restarted crawl can skip them before sending
+    a single request (see ``filter_entries``).
+
+    :param session: the session that is used to read and write the journal
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def get_stored_bgg_ids(self):
+        """
+        Returns the set of the bgg ids of all stored board games (a single query).
+        """
+        return set(self.session.execute(select(BoardGame.__table__.c.bgg_id)).scalars())
+
+    def filter_entries(self, entries):
+        """
+        Returns the entries (see ``CSVReader``) whose board game is not stored yet, in the same order.
+        """
+        stored_bgg_ids = self.get_stored_bgg_ids()
+        return [entry for entry in entries if entry.id not in stored_bgg_ids]
+
+    def get_status_dict(self):
+        """
+        Returns a dictionary that maps every journaled bgg id to its latest status.
+        """
+        table = CrawlStatus.__table__
+        return dict(self.session.execute(select(table.c.bgg_id, table.c.status)).all())
+
+    def record_batch(self, status_dict, started, duration, messages=None):
+        """
+        Records the status of every id of a batch and the timing of the batch and commits.
+
+        :param status_dict: maps the bgg ids to ``SUCCESS``, ``ERROR`` or ``EXISTS``
+        :param started: the unix timestamp when the batch was started
+        :param duration: the number of seconds the batch took
+        :param messages: maps bgg ids to a message (e.g., the error), optional
+        """
+        messages = messages if messages is not None else {}
+        now = time.time()
+        rows = [{"bgg_id": bgg_id, "status": status, "attempts": 1, "updated": now,
+                 "message": str(messages[bgg_id])[:MAX_MESSAGE_LENGTH] if bgg_id in messages else None}
+                for bgg_id, status in status_dict.items()]
+        connection = self.session.connection()
+        if rows:
+            statement = insert(CrawlStatus.__table__)
+            statement = statement.on_conflict_do_update(
+                index_elements=["bgg_id"],
+                set_={"status": statement.excluded.status, "message": statement.excluded.message,
+                      "updated": statement.excluded.updated, "attempts": CrawlStatus.__table__.c.attempts + 1})
+            connection.execute(statement, rows)
+
+        statuses = list(status_dict.values())
+        connection.execute(CrawlBatch.__table__.insert(), [{
+            "started": started, "duration": duration, "batch_size": len(statuses),
+            "num_success": statuses.count(SUCCESS), "num_error": statuses.count(ERROR),
+            "num_skipped": statuses.count(EXISTS)}])
+        self.session.commit()
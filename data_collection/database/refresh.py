@@ -0,0 +1,234 @@
+from sqlalchemy import select, update, delete, bindparam, func
+from sqlalchemy.dialects.sqlite import insert
+
+from data_collection.database.tables import BoardGame, BoardGameRanking, RatingsBreakdown, PlayerCountToBoardGame, \
+    RankType, CrawlStatus
+from data_collection.database.bulk_insert import LINKED_DIMENSIONS
+from data_collection.database.utils import DimensionCache, MAX_PARAMETERS_PER_QUERY
+from data_collection.database.aggregates import add_contributions, subtract_contributions
+
+# The columns of the boardgames table that change over time
+REFRESHED_COLUMNS = ["num_ratings", "avg_rating", "num_owning", "num_trading", "num_wanting", "num_wishing",
+                     "num_weights", "avg_weight", "total_plays"]
+RATINGS_COLUMNS = ["num_{0}".format(rating) for rating in range(1, 11)]
+
+BY_STALENESS = "staleness"
+BY_POPULARITY = "popularity"
+
+
+class RefreshWriter:
+    """
+    Updates board games that are already stored with freshly downloaded data.
+
+    Only what actually changed is written: the statistics of ``REFRESHED_COLUMNS``, the rankings, the ratings
+    breakdown, the player counts and the links to categories, mechanics, etc. Rows are updated in place
+    (upserts), links that disappeared are deleted and new ones are inserted, nothing is deleted and
+    re-inserted. Every batch is written within a single transaction.
+
+    :param session: the session whose connection and transaction is used
+    :param dimension_cache: the ``DimensionCache`` to use, if ``None`` one is loaded from the database
+    """
+
+    def __init__(self, session, dimension_cache=None):
+        self.session = session
+        self.dimension_cache = dimension_cache if dimension_cache is not None else DimensionCache.load(session)
+
+    def refresh(self, downloaded_list):
+        """
+        Refreshes the stored board games with the given ``DownloadedBoardGame``s and commits.
+
+        :return: a dictionary that maps the bgg ids to the number of rows that were changed, board games that
+        are not stored are left out
+        """
+        if len(downloaded_list) == 0:
+            return {}
+        try:
+            changes = self._refresh(self.session.connection(), downloaded_list)
+            self.session.commit()
+            self.dimension_cache.commit()
+            return changes
+        except Exception:
+            self.session.rollback()
+            self.dimension_cache.rollback()
+            raise
+
+    def _refresh(self, connection, downloaded_list):
+        table = BoardGame.__table__
+        bgg_ids = [downloaded.boardgame.bgg_id for downloaded in downloaded_list]
+        stored_rows = {}
+        for chunk in _chunks(bgg_ids):
+            query = select(table.c.id, table.c.bgg_id, *[table.c[column] for column in REFRESHED_COLUMNS]) \
+                .where(table.c.bgg_id.in_(chunk))
+            for row in connection.execute(query):
+                stored_rows[row.bgg_id] = row
+        downloaded_list = [downloaded for downloaded in downloaded_list if downloaded.boardgame.bgg_id in stored_rows]
+        boardgame_ids = {bgg_id: row.id for bgg_id, row in stored_rows.items()}
+        changes = {bgg_id: 0 for bgg_id in boardgame_ids}
+        # The aggregates of the board games are replaced by their refreshed ones at the end
+        subtract_contributions(connection, boardgame_ids.values())
+
+        # Statistics of the board games
+        update_rows = []
+        for downloaded in downloaded_list:
+            new_values = self._get_refreshed_values(downloaded)
+            stored_row = stored_rows[downloaded.boardgame.bgg_id]
+            if any(getattr(stored_row, column) != value for column, value in new_values.items()):
+                new_values["b_id"] = stored_row.id
+                update_rows.append(new_values)
+                changes[downloaded.boardgame.bgg_id] += 1
+        if update_rows:
+            statement = update(table).where(table.c.id == bindparam("b_id")) \
+                .values({column: bindparam(column) for column in REFRESHED_COLUMNS})
+            connection.execute(statement, update_rows)
+
+        # Links to categories, mechanics, ...
+        for list_name, model, link_model, link_column in LINKED_DIMENSIONS:
+            containers = [element for downloaded in downloaded_list
+                          for element in getattr(downloaded.boardgame, list_name)]
+            dimension_ids = self.dimension_cache.resolve_ids(connection, model, containers)
+            desired = {}
+            for downloaded in downloaded_list:
+                boardgame_id = boardgame_ids[downloaded.boardgame.bgg_id]
+                for element in getattr(downloaded.boardgame, list_name):
+                    desired[(boardgame_id, dimension_ids[element.bgg_id])] = downloaded.boardgame.bgg_id
+            self._sync_links(connection, link_model.__table__, link_column, boardgame_ids, desired, changes)
+
+        # Rankings
+        rankings = [element for downloaded in downloaded_list for element in downloaded.boardgame.ranking_list]
+        ranktype_ids = self.dimension_cache.resolve_ids(connection, RankType, rankings)
+        desired_rows = {}
+        for downloaded in downloaded_list:
+            boardgame_id = boardgame_ids[downloaded.boardgame.bgg_id]
+            for element in downloaded.boardgame.ranking_list:
+                desired_rows[(boardgame_id, ranktype_ids[element.bgg_id])] = dict(
+                    boardgame_id=boardgame_id, ranktype_id=ranktype_ids[element.bgg_id], rank=element.rank,
+                    geek_rating=element.geek_rating)
+        self._sync_rows(connection, BoardGameRanking.__table__, ["boardgame_id", "ranktype_id"],
+                        ["rank", "geek_rating"], boardgame_ids, desired_rows, changes)
+
+        # Player counts
+        desired_rows = {}
+        for downloaded in downloaded_list:
+            boardgame_id = boardgame_ids[downloaded.boardgame.bgg_id]
+            for element in downloaded.boardgame.player_count_list:
+                desired_rows[(boardgame_id, element.player_count)] = dict(
+                    boardgame_id=boardgame_id, player_count=element.player_count, num_best=element.num_best,
+                    num_recommended=element.num_recommended, num_not_recommended=element.num_not_recommended)
+        self._sync_rows(connection, PlayerCountToBoardGame.__table__, ["boardgame_id", "player_count"],
+                        ["num_best", "num_recommended", "num_not_recommended"], boardgame_ids, desired_rows, changes)
+
+        # Ratings breakdown
+        desired_rows = {}
+        for downloaded in downloaded_list:
+            boardgame_id = boardgame_ids[downloaded.boardgame.bgg_id]
+            ratings_row = {"num_{0}".format(rating): downloaded.ratings_breakdown[rating] for rating in range(1, 11)}
+            ratings_row["boardgame_id"] = boardgame_id
+            desired_rows[(boardgame_id,)] = ratings_row
+        self._sync_rows(connection, RatingsBreakdown.__table__, ["boardgame_id"], RATINGS_COLUMNS, boardgame_ids,
+                        desired_rows, changes)
+        add_contributions(connection, boardgame_ids.values())
+        return changes
+
+    def _get_refreshed_values(self, downloaded):
+        bg = downloaded.boardgame
+        return dict(num_ratings=bg.num_ratings, avg_rating=bg.avg_rating, num_owning=bg.num_owning,
+                    num_trading=bg.num_trading, num_wanting=bg.num_wanting, num_wishing=bg.num_wishing,
+                    num_weights=bg.num_weights, avg_weight=bg.avg_weight, total_plays=downloaded.total_plays)
+
+    def _sync_links(self, connection, table, link_column, boardgame_ids, desired, changes):
+        """
+        Inserts the missing and deletes the vanished ``(boardgame_id, linked id)`` pairs of ``desired``.
+        """
+        bgg_id_by_boardgame_id = {boardgame_id: bgg_id for bgg_id, boardgame_id in boardgame_ids.items()}
+        existing = {}
+        for chunk in _chunks(list(bgg_id_by_boardgame_id.keys())):
+            query = select(table.c.id, table.c.boardgame_id, table.c[link_column]) \
+                .where(table.c.boardgame_id.in_(chunk))
+            for row_id, boardgame_id, linked_id in connection.execute(query):
+                existing[(boardgame_id, linked_id)] = row_id
+
+        insert_rows = [{"boardgame_id": boardgame_id, link_column: linked_id}
+                       for boardgame_id, linked_id in desired.keys() if (boardgame_id, linked_id) not in existing]
+        delete_rows = [{"b_id": row_id} for key, row_id in existing.items() if key not in desired]
+        if insert_rows:
+            connection.execute(table.insert(), insert_rows)
+        if delete_rows:
+            connection.execute(delete(table).where(table.c.id == bindparam("b_id")), delete_rows)
+        for boardgame_id, _ in [key for key in desired.keys() if key not in existing] + \
+                [key for key in existing.keys() if key not in desired]:
+            changes[bgg_id_by_boardgame_id[boardgame_id]] += 1
+
+    def _sync_rows(self, connection, table, key_columns, value_columns, boardgame_ids, desired_rows, changes):
+        """
+        Upserts the rows of ``desired_rows`` (keyed by ``key_columns``) whose values differ from the stored ones
+        and deletes the stored rows of the board games that are no longer desired.
+        """
+        bgg_id_by_boardgame_id = {boardgame_id: bgg_id for bgg_id, boardgame_id in boardgame_ids.items()}
+        existing = {}
+        for chunk in _chunks(list(bgg_id_by_boardgame_id.keys())):
+            query = select(table.c.id, *[table.c[column] for column in key_columns + value_columns]) \
+                .where(table.c.boardgame_id.in_(chunk))
+            for row in connection.execute(query):
+                existing[tuple(row[1:1 + len(key_columns)])] = row
+
+        upsert_rows = []
+        for key, desired_row in desired_rows.items():
+            existing_row = existing.get(key)
+            if existing_row is None or any(getattr(existing_row, column) != desired_row[column]
+                                           for column in value_columns):
+                upsert_rows.append(desired_row)
+                changes[bgg_id_by_boardgame_id[desired_row["boardgame_id"]]] += 1
+        delete_rows = [{"b_id": row.id} for key, row in existing.items() if key not in desired_rows]
+        for key, row in existing.items():
+            if key not in desired_rows:
+                changes[bgg_id_by_boardgame_id[row.boardgame_id]] += 1
+
+        if upsert_rows:
+            statement = insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=key_columns, set_={column: statement.excluded[column] for column in value_columns})
+            connection.execute(statement, upsert_rows)
+        if delete_rows:
+            connection.execute(delete(table).where(table.c.id == bindparam("b_id")), delete_rows)
+
+
+def select_refresh_candidates(session, max_games, order_by=BY_STALENESS):
+    """
+    Returns up to ``max_games`` stored board games that should be refreshed first as a list of
+    ``(bgg_id, url)`` tuples.
+
+    :param order_by: ``BY_STALENESS`` prefers the board games whose journal entry is the oldest (or missing),
+    ``BY_POPULARITY`` prefers the board games with the most ratings
+    """
+    boardgames = BoardGame.__table__
+    crawl_status = CrawlStatus.__table__
+    query = select(boardgames.c.bgg_id, boardgames.c.url)
+    if order_by == BY_STALENESS:
+        query = query.outerjoin(crawl_status, crawl_status.c.bgg_id == boardgames.c.bgg_id) \
+            .order_by(func.coalesce(crawl_status.c.updated, 0), boardgames.c.num_ratings.desc())
+    elif order_by == BY_POPULARITY:
+        query = query.order_by(boardgames.c.num_ratings.desc())
+    else:
+        raise ValueError("Unknown order_by={0}".format(order_by))
+    return [tuple(row) for row in session.execute(query.limit(max_games))]
+
+
+def get_max_games_for_request_budget(request_budget, batch_size):
+    """
+    Returns how many board games can be refreshed with ``request_budget`` requests if every board game needs
+    a request for the plays and one for the ratings and a ``/thing`` request is shared by ``batch_size`` games.
+    Smaller batches need more requests, so ``batch_size`` should not be larger than the batches will be.
+    """
+    return int(request_budget * batch_size // get_requests_per_batch(batch_size))
+
+
+def get_requests_per_batch(batch_size):
+    """
+    Returns the number of requests a batch of ``batch_size`` board games needs without retries.
+    """
+    return 2 * batch_size + 1
+
+
+def _chunks(values):
+    for start_index in range(0, len(values), MAX_PARAMETERS_PER_QUERY):
+        yield values[start_index:start_index + MAX_PARAMETERS_PER_QUERY]
@@ -0,0 +1,140 @@
+from sqlalchemy import create_engine, event, text
+
+from data_collection.database.tables import create_all_tables
+from data_collection.database.aggregates import get_rebuild_statements
+
+# Applied to every new connection, see https://www.sqlite.org/pragma.html
+JOURNAL_MODE = "WAL"  # readers do not block the writer (and vice versa), persistent for the database file
+SYNCHRONOUS = "NORMAL"  # safe in WAL mode, only the last transactions may be lost on a power failure
+MMAP_SIZE_IN_BYTES = 256 * 1024 * 1024
+CACHE_SIZE_IN_KB = 64 * 1024
+TEMP_STORE = "MEMORY"
+
+# The versioned migrations: (version, description, list of SQL statements). The version that was applied last is
+# stored in ``PRAGMA user_version``, so every migration is applied exactly once. Only append to this list!
+MIGRATIONS = [
+    (1, "Covering indexes for the crawl and the analysis", [
+        # Growth over time (part one) and every query that groups or filters by the year
+        "CREATE INDEX IF NOT EXISTS ix_boardgames_year_published ON boardgames (year_published, num_ratings)",
+        # Refreshing the most popular board games first
+        "CREATE INDEX IF NOT EXISTS ix_boardgames_num_ratings ON boardgames (num_ratings)",
+        # The unique constraints of the link tables start with the linked id, so looking up the categories,
+        # mechanics, etc. of a board game (or joining from the board games) scanned the whole table
+        "CREATE INDEX IF NOT EXISTS ix_categories_to_boardgames_boardgame "
+        "ON categories_to_boardgames (boardgame_id, category_id)",
+        "CREATE INDEX IF NOT EXISTS ix_mechanics_to_boardgames_boardgame "
+        "ON mechanics_to_boardgames (boardgame_id, mechanic_id)",
+        "CREATE INDEX IF NOT EXISTS ix_families_to_boardgames_boardgame "
+        "ON families_to_boardgames (boardgame_id, family_id)",
+        "CREATE INDEX IF NOT EXISTS ix_designers_to_boardgames_boardgame "
+        "ON designers_to_boardgames (boardgame_id, designer_id)",
+        "CREATE INDEX IF NOT EXISTS ix_artists_to_boardgames_boardgame "
+        "ON artists_to_boardgames (boardgame_id, artist_id)",
+        "CREATE INDEX IF NOT EXISTS ix_publishers_to_boardgames_boardgame "
+        "ON publishers_to_boardgames (boardgame_id, publisher_id)",
+        "CREATE INDEX IF NOT EXISTS ix_boardgame_rankings_boardgame "
+        "ON boardgame_rankings (boardgame_id, ranktype_id, rank)",
+        "CREATE INDEX IF NOT EXISTS ix_playercounts_to_boardgames_boardgame "
+        "ON playercounts_to_boardgames (boardgame_id, player_count)",
+        # Refreshing the stalest board games first
+        "CREATE INDEX IF NOT EXISTS ix_crawl_status_updated ON crawl_status (updated, bgg_id)",
+    ]),
+    (2, "Full-text search index over the names and descriptions of the board games", [
+        # An external content table, i.e., only the index is stored and the text is read from ``boardgames``.
+        # The prefix indexes make prefix queries (e.g., "coop*") as fast as queries of whole words.
+        "CREATE VIRTUAL TABLE IF NOT EXISTS boardgames_fts USING fts5(name, description, content='boardgames', "
+        "content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        # The triggers keep the index in sync with every insert, delete and update of the downloader. Refreshing
+        # the statistics does not touch the text, so it does not touch the index either.
+        "CREATE TRIGGER IF NOT EXISTS boardgames_fts_insert AFTER INSERT ON boardgames BEGIN "
+        "INSERT INTO boardgames_fts (rowid, name, description) VALUES (new.id, new.name, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS boardgames_fts_delete AFTER DELETE ON boardgames BEGIN "
+        "INSERT INTO boardgames_fts (boardgames_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); END",
+        "CREATE TRIGGER IF NOT EXISTS boardgames_fts_update AFTER UPDATE OF name, description ON boardgames BEGIN "
+        "INSERT INTO boardgames_fts (boardgames_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "INSERT INTO boardgames_fts (rowid, name, description) VALUES (new.id, new.name, new.description); END",
+        # Indexes the board games that were stored before the migration
+        "INSERT INTO boardgames_fts (boardgames_fts) VALUES ('rebuild')",
+    ]),
+    # The writers keep the aggregates up to date, this computes them for the board games stored before
+    (3, "Per year and facet aggregates of the board games", get_rebuild_statements()),
+]
+
+
+def create_tuned_engine(database_url):
+    """
+    Returns an engine for the SQLite database that applies the pragmas of this module (WAL journal, relaxed
+    ``synchronous``, memory mapped I/O and a bigger page cache) to every connection.
+
+    :param database_url: e.g., ``"sqlite:///data/database/data_2018-05-10.db"``
+    """
+    engine = create_engine(database_url)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode={0}".format(JOURNAL_MODE))
+        cursor.execute("PRAGMA synchronous={0}".format(SYNCHRONOUS))
+        cursor.execute("PRAGMA mmap_size={0}".format(MMAP_SIZE_IN_BYTES))
+        cursor.execute("PRAGMA cache_size=-{0}".format(CACHE_SIZE_IN_KB))
+        cursor.execute("PRAGMA temp_store={0}".format(TEMP_STORE))
+        cursor.close()
+
+    return engine
+
+
+def get_schema_version(engine):
+    with engine.connect() as connection:
+        return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def migrate(engine):
+    """
+    Applies every migration of ``MIGRATIONS`` that was not applied yet, each one in its own transaction, and
+    runs ``ANALYZE`` if anything changed.
+
+    :return: the list of the versions that were applied
+    """
+    applied_versions = []
+    current_version = get_schema_version(engine)
+    for version, description, statements in MIGRATIONS:
+        if version <= current_version:
+            continue
+        print("Applying migration {0}: {1}".format(version, description))
+        with engine.begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+            connection.execute(text("PRAGMA user_version={0}".format(int(version))))
+        applied_versions.append(version)
+    if applied_versions:
+        analyze(engine)
+    return applied_versions
+
+
+def analyze(engine):
+    """
+    Updates the statistics the query planner uses to choose between the indexes. Should be run after a lot of
+    rows were added, e.g., at the end of a crawl.
+    """
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+
+
+def rebuild_search_index(engine):
+    """
+    Rebuilds the full-text search index (see migration 2) from the ``boardgames`` table and merges its segments,
+    e.g., if the board games were changed while the triggers did not exist.
+    """
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO boardgames_fts (boardgames_fts) VALUES ('rebuild')"))
+        connection.execute(text("INSERT INTO boardgames_fts (boardgames_fts) VALUES ('optimize')"))
+
+
+def prepare_database(engine):
+    """
+    Creates the missing tables and applies the missing migrations.
+    """
+    create_all_tables(engine)
+    migrate(engine)
@@ -252,3 +252,60 @@ class RatingsBreakdown(Base):
 
     def __repr__(self):
         return "<RatingsBreakdown(boardgame={0})>".format(self.boardgame_id)
+
+
+class CrawlStatus(Base):
+    __tablename__ = "crawl_status"
+
+    id = Column(Integer, Sequence('crawl_status_id_seq'), primary_key=True)
+    bgg_id = Column(Integer, unique=True, nullable=False)
+    status = Column(Integer, nullable=False)  # see data_collection.database.journal
+    message = Column(String)
+    attempts = Column(Integer, nullable=False)
+    updated = Column(Float, nullable=False)  # unix timestamp
+
+    def __repr__(self):
+        return "<CrawlStatus(bgg_id={0}, status={1})>".format(self.bgg_id, self.status)
+
+
+class CrawlBatch(Base):
+    __tablename__ = "crawl_batches"
+
+    id = Column(Integer, Sequence('crawl_batch_id_seq'), primary_key=True)
+    started = Column(Float, nullable=False)  # unix timestamp
+    duration = Column(Float, nullable=False)
+    batch_size = Column(Integer, nullable=False)
+    num_success = Column(Integer, nullable=False)
+    num_error = Column(Integer, nullable=False)
+    num_skipped = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return "<CrawlBatch(started={0}, batch_size={1})>".format(self.started, self.batch_size)
+
+
+class YearFacetAggregate(Base):
+    """
+    The sums of the statistics of all board games per year and category (mechanic, etc.), maintained by
+    ``data_collection.database.aggregates``. The row of facet ``"all"`` (with ``facet_id`` 0) of a year sums up
+    every board game of the year.
+    """
+    __tablename__ = "year_facet_aggregates"
+
+    id = Column(Integer, Sequence('year_facet_aggregate_id_seq'), primary_key=True)
+    year_published = Column(Integer, nullable=False)
+    facet = Column(String, nullable=False)  # "all" or the name of the table, e.g., "categories"
+    facet_id = Column(Integer, nullable=False)  # e.g., the id of the category
+    num_boardgames = Column(Integer, nullable=False)
+    sum_num_ratings = Column(Integer, nullable=False)
+    sum_avg_rating = Column(Float, nullable=False)
+    sum_weighted_avg_rating = Column(Float, nullable=False)  # sum of avg_rating * num_ratings
+    sum_num_weights = Column(Integer, nullable=False)
+    sum_avg_weight = Column(Float, nullable=False)
+    sum_weighted_avg_weight = Column(Float, nullable=False)  # sum of avg_weight * num_weights
+    sum_total_plays = Column(Integer, nullable=False)
+
+    __table_args__ = (UniqueConstraint("year_published", "facet", "facet_id", name="_year_facet_uc"),)
+
+    def __repr__(self):
+        return "<YearFacetAggregate(year={0}, facet={1}, facet_id={2})>".format(self.year_published, self.facet,
+                                                                             self.facet_id)
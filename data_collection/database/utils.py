@@ -1,3 +1,12 @@
+from sqlalchemy import select
+
+from data_collection.database.tables import Category, Mechanic, Family, Designer, Artist, Publisher, RankType
+
+DIMENSION_MODELS = [Category, Mechanic, Family, Designer, Artist, Publisher, RankType]
+
+MAX_PARAMETERS_PER_QUERY = 500  # SQLite limits the number of host parameters of a single statement
+
+
 def get_or_create(session, model, **kwargs):
     instance = session.query(model).filter_by(**kwargs).first()
     if instance:
@@ -7,3 +16,110 @@ def get_or_create(session, model, **kwargs):
         session.add(instance)
         session.flush()
         return instance, True
+
+
+def select_ids_by_bgg_id(connection, model, bgg_ids):
+    """
+    Returns a dictionary that maps the given bgg ids to the ids of ``model`` (missing ones are left out).
+    """
+    table = model.__table__
+    ids = {}
+    for start_index in range(0, len(bgg_ids), MAX_PARAMETERS_PER_QUERY):
+        chunk = bgg_ids[start_index:start_index + MAX_PARAMETERS_PER_QUERY]
+        query = select(table.c.bgg_id, table.c.id).where(table.c.bgg_id.in_(chunk))
+        for bgg_id, row_id in connection.execute(query):
+            ids[bgg_id] = row_id
+    return ids
+
+
+class DimensionCache:
+    """
+    Maps ``(model, bgg_id)`` of the dimension tables (categories, mechanics, ..., rank types) to their ids,
+    so that looking up the id of a category does not need a query.
+
+    The cache is loaded from the database once with ``load`` and kept in sync by ``get_or_create`` and
+    ``resolve_ids``. Ids of rows inserted within a transaction are only kept after ``commit`` was called,
+    ``rollback`` discards them.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._ids = {}
+        self._pending_ids = {}
+
+    @classmethod
+    def load(cls, session, models=None):
+        """
+        Creates a cache that contains every row of the given models (defaults to ``DIMENSION_MODELS``).
+        """
+        cache = cls()
+        for model in models if models is not None else DIMENSION_MODELS:
+            table = model.__table__
+            for bgg_id, row_id in session.execute(select(table.c.bgg_id, table.c.id)):
+                cache._ids[(model, bgg_id)] = row_id
+        return cache
+
+    def get(self, model, bgg_id):
+        """
+        Returns the id of the row of ``model`` with the given ``bgg_id`` or ``None`` if it is not cached.
+        """
+        key = (model, bgg_id)
+        row_id = self._pending_ids.get(key)
+        if row_id is None:
+            row_id = self._ids.get(key)
+        if row_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row_id
+
+    def get_or_create(self, session, model, bgg_id, name):
+        """
+        Same as ``get_or_create`` but only queries the database if the row is not cached.
+
+        :return: a tuple of the id and whether the row was created
+        """
+        row_id = self.get(model, bgg_id)
+        if row_id is not None:
+            return row_id, False
+        instance, created = get_or_create(session, model, bgg_id=bgg_id, name=name)
+        self._pending_ids[(model, bgg_id)] = instance.id
+        return instance.id, created
+
+    def resolve_ids(self, connection, model, containers):
+        """
+        Returns a dictionary that maps the bgg ids of the ``containers`` (anything with ``bgg_id`` and ``name``)
+        to the ids of ``model``. Rows that are not cached are inserted with a single ``INSERT``.
+        """
+        return self.resolve_names(connection, model, {container.bgg_id: container.name for container in containers})
+
+    def resolve_names(self, connection, model, names):
+        """
+        Same as ``resolve_ids`` but for a dictionary that maps the bgg ids to the names.
+        """
+        ids = {}
+        missing_rows = []
+        for bgg_id, name in names.items():
+            row_id = self.get(model, bgg_id)
+            if row_id is None:
+                missing_rows.append({"bgg_id": bgg_id, "name": name})
+            else:
+                ids[bgg_id] = row_id
+        if missing_rows:
+            connection.execute(model.__table__.insert(), missing_rows)
+            inserted_ids = select_ids_by_bgg_id(connection, model, [row["bgg_id"] for row in missing_rows])
+            for bgg_id, row_id in inserted_ids.items():
+                self._pending_ids[(model, bgg_id)] = row_id
+            ids.update(inserted_ids)
+        return ids
+
+    def commit(self):
+        self._ids.update(self._pending_ids)
+        self._pending_ids = {}
+
+    def rollback(self):
+        self._pending_ids = {}
+
+    def __len__(self):
+        return len(self._ids)
@@ -0,0 +1,78 @@
+import os
+import time
+from collections import namedtuple
+
+from data_collection.fetch_ids.file_parsing import CSVWriter
+
+# throughput is the number of board games per second of the /thing request
+BatchRecord = namedtuple("BatchRecord", ["timestamp", "batch_size", "duration", "response_size", "num_throttled",
+                                         "num_errors", "failed", "throughput"])
+
+
+class AdaptiveBatchSizer:
+    """
+    Chooses the number of ids per ``/thing`` request.
+
+    The batch size grows additively as long as the requests stay fast (below ``max_duration_in_seconds``),
+    are not throttled and the responses are not too large. It shrinks multiplicatively after a 429, an error
+    (e.g., a timeout), a failed batch, a slow request or an oversized payload. This way the crawl runs
+    at the largest batch size the API currently tolerates.
+
+    Every batch is recorded in ``history`` and, if ``log_filename`` is given, appended to a ``.csv`` file.
+
+    :param initial_batch_size: the batch size of the first batch
+    :param min_batch_size: the lower bound of the batch size
+    :param max_batch_size: the upper bound of the batch size
+    :param max_duration_in_seconds: batches taking longer than this (retries included) shrink the batch size
+    :param max_response_size: responses larger than this (in characters) shrink the batch size
+    :param increase_step: the number of ids that are added after a good batch
+    :param decrease_factor: the batch size is multiplied with this factor after a bad batch
+    :param log_filename: the name of the ``.csv`` file in ``log_directory`` the batches are recorded in
+    """
+
+    def __init__(self, initial_batch_size=15, min_batch_size=1, max_batch_size=100, max_duration_in_seconds=20,
+                 max_response_size=4 * 1024 ** 2, increase_step=5, decrease_factor=0.5, log_filename=None,
+                 log_directory=os.path.join("data", "logs")):
+        self.batch_size = min(max_batch_size, max(min_batch_size, initial_batch_size))
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_duration_in_seconds = max_duration_in_seconds
+        self.max_response_size = max_response_size
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.log_filename = log_filename
+        self.log_directory = log_directory
+        self.history = []
+
+    def record(self, batch_size, duration, response_size=0, num_throttled=0, num_errors=0, failed=False):
+        """
+        Records the outcome of a batch of ``batch_size`` ids and adapts the batch size accordingly.
+
+        :return: the new batch size
+        """
+        throughput = batch_size / duration if duration > 0 else 0.0
+        batch_record = BatchRecord(timestamp=time.time(), batch_size=batch_size, duration=duration,
+                                   response_size=response_size, num_throttled=num_throttled, num_errors=num_errors,
+                                   failed=failed, throughput=throughput)
+        self.history.append(batch_record)
+        if self.log_filename is not None:
+            CSVWriter(directory=self.log_directory).write(self.log_filename, [list(batch_record)],
+                                                          columns=list(BatchRecord._fields))
+
+        too_slow = duration > self.max_duration_in_seconds
+        too_large = response_size > self.max_response_size
+        if failed or num_throttled > 0 or num_errors > 0 or too_slow or too_large:
+            self.batch_size = max(self.min_batch_size, int(min(self.batch_size, batch_size) * self.decrease_factor))
+        elif batch_size >= self.batch_size:  # only grow if the batch actually used the current size
+            self.batch_size = min(self.max_batch_size, self.batch_size + self.increase_step)
+        return self.batch_size
+
+    def iter_batches(self, id_list):
+        """
+        Yields consecutive batches of ``id_list``, each one with the batch size that is current at that time.
+        """
+        start_index = 0
+        while start_index < len(id_list):
+            end_index = start_index + self.batch_size
+            yield id_list[start_index:end_index]
+            start_index = end_index
@@ -1,6 +1,9 @@
+import io
+import re
 import xml.etree.ElementTree as etree
 from collections import namedtuple
 
+from data_collection.common.exceptions import CacheMissException
 from data_collection.common.page_request import PageRequest
 from data_collection.fetch_data.exceptions import CouldNotFindPlayerCountPollException, \
     IllegalPlayerCountFormatException, CouldNotFindNameException
@@ -17,111 +20,246 @@ BoardGameContainer = namedtuple("BoardGame", ["bgg_id", "thumbnail_url", "image_
                                               "mechanic_list", "family_list", "designer_list", "artist_list",
                                               "publisher_list", "ranking_list", "player_count_list"])
 
+LINK_TYPE_TO_LIST_NAME = {
+    "boardgamecategory": "category_list",
+    "boardgamemechanic": "mechanic_list",
+    "boardgamefamily": "family_list",
+    "boardgamedesigner": "designer_list",
+    "boardgameartist": "artist_list",
+    "boardgamepublisher": "publisher_list",
+}
+ITEM_PATTERN = re.compile(r'<item\s[^>]*?\bid="(\d+)"')
+INTEGER_VALUE_TAGS = {
+    "yearpublished": "year_published",
+    "minplayers": "min_players",
+    "maxplayers": "max_players",
+    "playingtime": "playtime",
+    "minplaytime": "min_playtime",
+    "maxplaytime": "max_playtime",
+    "minage": "min_age",
+}
+
+
+class BoardGameContainerBuilder:
+    """
+    Collects the values of every parsed ``<item>`` into a ``BoardGameContainer``.
+
+    The parser calls ``start_item`` for every ``<item>``, then ``set_value``, ``add_link``, ``add_ranking``, etc.
+    for its children and finally ``end_item``. ``get_result`` returns what was built (here: the list of
+    ``BoardGameContainer``). See ``data_collection.fetch_data.columnar`` for a builder of columnar batches.
+    """
+
+    def __init__(self):
+        self.boardgame_container_list = []
+        self.values = None
+
+    def start_item(self, bgg_id):
+        self.values = {"bgg_id": bgg_id, "thumbnail_url": None, "image_url": None, "name": None,
+                       "player_count_list": None}
+        for list_name in LINK_TYPE_TO_LIST_NAME.values():
+            self.values[list_name] = []
+
+    def get_value(self, name):
+        return self.values.get(name)
+
+    def set_value(self, name, value):
+        self.values[name] = value
+
+    def add_link(self, list_name, bgg_id, name):
+        self.values[list_name].append(SimpleContainer(bgg_id=bgg_id, name=name))
+
+    def start_player_counts(self):
+        self.values["player_count_list"] = []
+
+    def has_player_counts(self):
+        return self.values["player_count_list"] is not None
+
+    def add_player_count(self, player_count, num_best, num_recommended, num_not_recommended):
+        self.values["player_count_list"].append(PlayerCountContainer(
+            player_count=player_count, num_best=num_best, num_recommended=num_recommended,
+            num_not_recommended=num_not_recommended))
+
+    def start_rankings(self):
+        self.values["ranking_list"] = []
+
+    def add_ranking(self, bgg_id, name, rank, geek_rating):
+        self.values["ranking_list"].append(RankingContainer(bgg_id=bgg_id, name=name, rank=rank,
+                                                            geek_rating=geek_rating))
+
+    def end_item(self):
+        if self.values["name"] is None:
+            raise CouldNotFindNameException()
+        if self.values["player_count_list"] is None:
+            raise CouldNotFindPlayerCountPollException()
+        self.boardgame_container_list.append(BoardGameContainer(**self.values))
+
+    def get_result(self):
+        return self.boardgame_container_list
+
+
+def _split_items(text):
+    """
+    :return: a dictionary that maps the id of every ``<item>`` of a ``/thing`` response to its XML
+    """
+    end = text.rfind("</items>")
+    matches = list(ITEM_PATTERN.finditer(text))
+    return {int(match.group(1)): text[match.start():matches[index + 1].start() if index + 1 < len(matches) else end]
+            for index, match in enumerate(matches)}
+
+
+def _get_item_text(text):
+    """
+    :return: the XML of the ``<item>``s of a ``/thing`` response without the surrounding ``<items>``
+    """
+    start = text.find("<item ")
+    return text[start:text.rfind("</items>")] if start >= 0 else ""
+
 
 class BoardGamePageRequest(PageRequest):
 
-    def get_boardgames(self, game_id_list):
+    def get_boardgames(self, game_id_list, builder=None):
+        """
+        Returns the board games as a list of ``BoardGameContainer`` or, if a ``builder`` is given, whatever
+        it builds (e.g., a columnar ``BoardGameBatch`` with a ``BoardGameBatchBuilder``, see
+        ``data_collection.fetch_data.columnar``).
+        """
+        if self.cache is None:
+            result = self.request(self._get_url(game_id_list), sender="BoardGamePageRequest",
+                                  game_id_list=game_id_list)
+            text = result.text
+        else:
+            text = self._request_cached_items(game_id_list)
+        return self._parse_boardgames(io.BytesIO(text.encode("utf-8")), builder)
+
+    def _get_url(self, game_id_list):
         id_list = ""
         for index, item in enumerate(game_id_list):
             if index != len(game_id_list)-1:
                 id_list += str(item)+","
             else:
                 id_list += str(item)
+        return "https://www.boardgamegeek.com/xmlapi2/thing?id={0}&stats=1".format(id_list)
+
+    def _get_not_returned_url(self, game_id):
+        """
+        The cache key of an id that the API did not return, it is never requested.
+        """
+        return self._get_url([game_id]) + "&not_returned=1"
+
+    def _request_cached_items(self, game_id_list):
+        """
+        Returns a ``/thing`` response of the board games that is put together from the cache.
 
-        url = "https://www.boardgamegeek.com/xmlapi2/thing?id={0}&stats=1".format(id_list)
-        result = self.request(url, sender="BoardGamePageRequest", game_id_list=game_id_list)
-        root = etree.fromstring(result.text)
+        Every ``<item>`` is cached on its own (under the url of a request of only its id), because the batches
+        depend on how fast the requests were and would rarely be the same when a crawl is repeated. Only the ids
+        that are not cached are requested.
+
+        Ids that the API did not return are only remembered for replays (see ``_get_not_returned_url``), otherwise
+        they are requested again, e.g., when the crawl retries them.
+        """
+        items = {}
+        for game_id in game_id_list:
+            cached_result = self.cache.get(self._get_url([game_id]))
+            if cached_result is not None:
+                items[game_id] = _get_item_text(cached_result.text)
+            elif self.cache.replay_only and self.cache.get(self._get_not_returned_url(game_id)) is not None:
+                items[game_id] = ""
+        missing_id_list = [game_id for game_id in game_id_list if game_id not in items]
+        response_size = 0
+        if missing_id_list:
+            url = self._get_url(missing_id_list)
+            if self.cache.replay_only:
+                raise CacheMissException("No cached response in replay-only mode for url={0}".format(url))
+            result = self._download(url, sender="BoardGamePageRequest", game_id_list=missing_id_list)
+            response_size = len(result.text)
+            downloaded_items = _split_items(result.text)
+            for game_id in missing_id_list:
+                items[game_id] = downloaded_items.get(game_id, "")
+                if items[game_id]:
+                    self.cache.put(self._get_url([game_id]), "<items>{0}</items>".format(items[game_id]))
+                else:
+                    self.cache.put(self._get_not_returned_url(game_id), "")
+        text = "<items>{0}</items>".format("".join(items[game_id] for game_id in game_id_list))
+        self.last_response_size = response_size if missing_id_list else len(text)
+        return text
+
+    def _parse_boardgames(self, source, builder=None):
+        """
+        Parses the ``/thing`` response in a single pass with ``iterparse``.
+
+        Every direct child of an ``<item>`` is handed to the ``builder`` as soon as it is complete (e.g., a
+        ``<link>`` is added to the links of its type) and is cleared afterwards. Once the ``<item>`` is complete
+        the builder finishes the board game and the item is removed from the tree, so the memory does not grow
+        with the number of items in the response.
+
+        :param builder: a ``BoardGameContainerBuilder`` (the default) or anything with the same methods
+        :return: the result of the builder
+        """
+        if builder is None:
+            builder = BoardGameContainerBuilder()
+        root = None
+        item_root = None
+        depth = 0
+        for event, element in etree.iterparse(source, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 1:
+                    root = element
+                elif depth == 2:
+                    item_root = element
+                    builder.start_item(int(element.get("id")))
+                continue
 
-        boardgame_container_list = []
-        for item_root in root:
-            game_id = int(item_root.get("id"))
             try:
-                thumbnail_url = self._get_or_get_none(item_root.find("thumbnail"))
-                image_url = self._get_or_get_none(item_root.find("image"))
-
-                name = self._get_name(item_root)
-
-                description = item_root.find("description").text or ""
-                year_published = int(item_root.find("yearpublished").get("value"))
-                min_players = int(item_root.find("minplayers").get("value"))
-                max_players = int(item_root.find("maxplayers").get("value"))
-                playtime = int(item_root.find("playingtime").get("value"))
-                min_playtime = int(item_root.find("minplaytime").get("value"))
-                max_playtime = int(item_root.find("maxplaytime").get("value"))
-                min_age = int(item_root.find("minage").get("value"))
-
-                category_list = self._get_simple_list(item_root, type_value="boardgamecategory")
-                mechanic_list = self._get_simple_list(item_root, type_value="boardgamemechanic")
-                family_list = self._get_simple_list(item_root, type_value="boardgamefamily")
-                designer_list = self._get_simple_list(item_root, type_value="boardgamedesigner")
-                artist_list = self._get_simple_list(item_root, type_value="boardgameartist")
-                publisher_list = self._get_simple_list(item_root, type_value="boardgamepublisher")
-
-                player_count_list = self._get_player_count_list(item_root)
-
-                ratings_root = item_root.find("statistics").find("ratings")
-                num_ratings = int(ratings_root.find("usersrated").get("value"))
-                avg_rating = float(ratings_root.find("average").get("value"))
-                num_owning = int(ratings_root.find("owned").get("value"))
-                num_trading = int(ratings_root.find("trading").get("value"))
-                num_wanting = int(ratings_root.find("wanting").get("value"))
-                num_wishing = int(ratings_root.find("wishing").get("value"))
-                num_weights = int(ratings_root.find("numweights").get("value"))
-                avg_weight = float(ratings_root.find("averageweight").get("value"))
-
-                ranking_list = self._get_ranking_list(ratings_root)
-
-                boardgame = BoardGameContainer(bgg_id=game_id, thumbnail_url=thumbnail_url, image_url=image_url, name=name,
-                                               description=description, year_published=year_published, min_players=min_players,
-                                               max_players=max_players, playtime=playtime, min_playtime=min_playtime,
-                                               max_playtime=max_playtime, min_age=min_age, num_ratings=num_ratings,
-                                               avg_rating=avg_rating, num_owning=num_owning, num_trading=num_trading,
-                                               num_wanting=num_wanting, num_wishing=num_wishing, num_weights=num_weights,
-                                               avg_weight=avg_weight, category_list=category_list, mechanic_list=mechanic_list,
-                                               family_list=family_list, designer_list=designer_list, artist_list=artist_list,
-                                               publisher_list=publisher_list, ranking_list=ranking_list,
-                                               player_count_list=player_count_list)
-                boardgame_container_list.append(boardgame)
-            except Exception as e:
-                print("ERROR: Unexpected error for game_id={0}".format(game_id))
+                if depth == 3:
+                    self._handle_item_child(element, builder)
+                    item_root.remove(element)
+                elif depth == 2:
+                    builder.end_item()
+                    root.clear()
+            except Exception:
+                print("ERROR: Unexpected error for game_id={0}".format(builder.get_value("bgg_id")))
                 raise
-        return boardgame_container_list
-
-    def _get_or_get_none(self, node):
-        return node.text if node is not None else None
-
-    def _get_name(self, xml_root):
-        name_nodes = xml_root.findall("name")
-        for name_node in name_nodes:
-            if name_node.get("type") == "primary":
-                name = name_node.get("value")
-                return name
-        raise CouldNotFindNameException()
-
-    def _get_simple_list(self, xml_root, type_value):
-        nodes = xml_root.findall('.//link[@type="{0}"]'.format(type_value))
-        simple_list = []
-        for simple in nodes:
-            simple_bgg_id = int(simple.get("id"))
-            simple_name = simple.get("value")
-            simple_list.append(SimpleContainer(bgg_id=simple_bgg_id, name=simple_name))
-        return simple_list
-
-    def _get_player_count_list(self, xml_root):
-        poll_roots = xml_root.findall("poll")
-        player_count_poll = None
-        for poll in poll_roots:
-            if poll.get("name") == "suggested_numplayers":
-                player_count_poll = poll
-                break
-
-        if player_count_poll is None:
-            raise CouldNotFindPlayerCountPollException()
+            depth -= 1
+        return builder.get_result()
+
+    def _handle_item_child(self, node, builder):
+        tag = node.tag
+        if tag == "link":
+            list_name = LINK_TYPE_TO_LIST_NAME.get(node.get("type"))
+            if list_name is not None:
+                builder.add_link(list_name, int(node.get("id")), node.get("value"))
+        elif tag in INTEGER_VALUE_TAGS:
+            builder.set_value(INTEGER_VALUE_TAGS[tag], int(node.get("value")))
+        elif tag == "name":
+            if node.get("type") == "primary" and builder.get_value("name") is None:
+                builder.set_value("name", node.get("value"))
+        elif tag == "thumbnail":
+            builder.set_value("thumbnail_url", node.text)
+        elif tag == "image":
+            builder.set_value("image_url", node.text)
+        elif tag == "description":
+            builder.set_value("description", node.text or "")
+        elif tag == "poll":
+            if node.get("name") == "suggested_numplayers" and not builder.has_player_counts():
+                self._add_player_counts(node, builder)
+        elif tag == "statistics":
+            ratings_root = node.find("ratings")
+            builder.set_value("num_ratings", int(ratings_root.find("usersrated").get("value")))
+            builder.set_value("avg_rating", float(ratings_root.find("average").get("value")))
+            builder.set_value("num_owning", int(ratings_root.find("owned").get("value")))
+            builder.set_value("num_trading", int(ratings_root.find("trading").get("value")))
+            builder.set_value("num_wanting", int(ratings_root.find("wanting").get("value")))
+            builder.set_value("num_wishing", int(ratings_root.find("wishing").get("value")))
+            builder.set_value("num_weights", int(ratings_root.find("numweights").get("value")))
+            builder.set_value("avg_weight", float(ratings_root.find("averageweight").get("value")))
+            self._add_rankings(ratings_root, builder)
 
+    def _add_player_counts(self, player_count_poll, builder):
+        builder.start_player_counts()
         if player_count_poll.get("totalvotes") == 0:
-            return []
+            return
 
-        player_count_list = []
         for results in player_count_poll.findall("results"):
             player_count = results.get("numplayers")
             num_best = 0
@@ -138,13 +276,10 @@ class BoardGamePageRequest(PageRequest):
                     num_not_recommended = result_votes
                 else:
                     raise IllegalPlayerCountFormatException()
-            player_count_list.append(PlayerCountContainer(player_count=player_count, num_best=num_best,
-                                                          num_recommended=num_recommended,
-                                                          num_not_recommended=num_not_recommended))
-        return player_count_list
+            builder.add_player_count(player_count, num_best, num_recommended, num_not_recommended)
 
-    def _get_ranking_list(self, xml_ratings_root):
-        ranking_list = []
+    def _add_rankings(self, xml_ratings_root, builder):
+        builder.start_rankings()
         for rank in xml_ratings_root.find("ranks"):
             rank_bgg_id = int(rank.get("id"))
             rank_name = rank.get("friendlyname")
@@ -156,9 +291,7 @@ class BoardGamePageRequest(PageRequest):
                 rank_geek_rating = float(rank.get("bayesaverage"))
             except ValueError:
                 rank_geek_rating = None
-            ranking_obj = RankingContainer(bgg_id=rank_bgg_id, name=rank_name, rank=rank_rank, geek_rating=rank_geek_rating)
-            ranking_list.append(ranking_obj)
-        return ranking_list
+            builder.add_ranking(rank_bgg_id, rank_name, rank_rank, rank_geek_rating)
 
 
 if __name__ == "__main__":
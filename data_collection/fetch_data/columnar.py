@@ -0,0 +1,191 @@
+import numpy as np
+
+from data_collection.fetch_data.boardgames import LINK_TYPE_TO_LIST_NAME, BoardGameContainer, SimpleContainer, \
+    RankingContainer, PlayerCountContainer
+from data_collection.fetch_data.exceptions import CouldNotFindNameException, CouldNotFindPlayerCountPollException
+
+INTEGER_COLUMNS = ["bgg_id", "year_published", "min_players", "max_players", "playtime", "min_playtime",
+                   "max_playtime", "min_age", "num_ratings", "num_owning", "num_trading", "num_wanting", "num_wishing",
+                   "num_weights"]
+FLOAT_COLUMNS = ["avg_rating", "avg_weight"]
+STRING_COLUMNS = ["thumbnail_url", "image_url", "name", "description"]
+LINK_LIST_NAMES = list(LINK_TYPE_TO_LIST_NAME.values())
+PLAYER_COUNT_COLUMNS = ["num_best", "num_recommended", "num_not_recommended"]
+
+
+class BoardGameBatch:
+    """
+    The board games of a ``/thing`` response in columns instead of one ``BoardGameContainer`` per board game.
+
+    - ``columns``: maps every scalar field (e.g., ``"num_ratings"``) to an array (a list for strings) with one
+      value per board game
+    - ``links``: maps every list name (e.g., ``"category_list"``) to the parallel arrays ``game_index`` (the
+      index of the board game in the batch) and ``bgg_id`` (the bgg id of the category)
+    - ``names``: maps every list name (and ``"ranking_list"``) to a dictionary of bgg id -> name, every name is
+      only kept once per batch
+    - ``rankings``: the parallel arrays ``game_index``, ``bgg_id``, ``rank`` and ``geek_rating`` (``NaN`` if not
+      ranked)
+    - ``player_counts``: the parallel arrays ``game_index``, ``player_count`` (a list of strings), ``num_best``,
+      ``num_recommended`` and ``num_not_recommended``
+    """
+
+    def __init__(self, columns, links, names, rankings, player_counts):
+        self.columns = columns
+        self.links = links
+        self.names = names
+        self.rankings = rankings
+        self.player_counts = player_counts
+
+    @property
+    def bgg_ids(self):
+        return self.columns["bgg_id"]
+
+    def __len__(self):
+        return len(self.columns["bgg_id"])
+
+    def take(self, game_indices):
+        """
+        Returns a new batch with only the given board games (in the given order).
+        """
+        game_indices = np.asarray(game_indices, dtype=np.int64)
+        new_index = np.full(len(self), -1, dtype=np.int64)
+        new_index[game_indices] = np.arange(len(game_indices))
+
+        def take_rows(table):
+            keep = new_index[table["game_index"]] >= 0
+            rows = {}
+            for column, values in table.items():
+                if isinstance(values, list):
+                    rows[column] = [value for value, is_kept in zip(values, keep) if is_kept]
+                else:
+                    rows[column] = values[keep]
+            rows["game_index"] = new_index[table["game_index"][keep]]
+            return rows
+
+        columns = {column: [values[index] for index in game_indices] if isinstance(values, list)
+                   else values[game_indices] for column, values in self.columns.items()}
+        return BoardGameBatch(columns, {list_name: take_rows(table) for list_name, table in self.links.items()},
+                              self.names, take_rows(self.rankings), take_rows(self.player_counts))
+
+    def to_containers(self):
+        """
+        Returns the board games as a list of ``BoardGameContainer`` (as returned by ``get_boardgames``).
+        """
+        values_list = [{"ranking_list": [], "player_count_list": []} for _ in range(len(self))]
+        for column, values in self.columns.items():
+            values = values if isinstance(values, list) else values.tolist()
+            for game_values, value in zip(values_list, values):
+                game_values[column] = value
+        for list_name, table in self.links.items():
+            for game_values in values_list:
+                game_values[list_name] = []
+            names = self.names[list_name]
+            for game_index, bgg_id in zip(table["game_index"].tolist(), table["bgg_id"].tolist()):
+                values_list[game_index][list_name].append(SimpleContainer(bgg_id=bgg_id, name=names[bgg_id]))
+        names = self.names["ranking_list"]
+        for game_index, bgg_id, rank, geek_rating in zip(self.rankings["game_index"].tolist(),
+                                                         self.rankings["bgg_id"].tolist(),
+                                                         self.rankings["rank"].tolist(),
+                                                         self.rankings["geek_rating"].tolist()):
+            values_list[game_index]["ranking_list"].append(RankingContainer(
+                bgg_id=bgg_id, name=names[bgg_id], rank=int(rank) if rank == rank else None,
+                geek_rating=geek_rating if geek_rating == geek_rating else None))
+        for game_index, player_count, num_best, num_recommended, num_not_recommended in zip(
+                self.player_counts["game_index"].tolist(), self.player_counts["player_count"],
+                *[self.player_counts[column].tolist() for column in PLAYER_COUNT_COLUMNS]):
+            values_list[game_index]["player_count_list"].append(PlayerCountContainer(
+                player_count=player_count, num_best=num_best, num_recommended=num_recommended,
+                num_not_recommended=num_not_recommended))
+        return [BoardGameContainer(**game_values) for game_values in values_list]
+
+
+class BoardGameBatchBuilder:
+    """
+    Builds a ``BoardGameBatch`` while a ``/thing`` response is parsed, use it with
+    ``BoardGamePageRequest.get_boardgames(game_id_list, builder=BoardGameBatchBuilder())``.
+
+    Links, rankings and player counts are appended to flat lists of numbers right away, so no object is
+    allocated per link and the name of a category, designer, etc. is only kept the first time it occurs.
+    """
+
+    def __init__(self):
+        self.columns = {column: [] for column in INTEGER_COLUMNS + FLOAT_COLUMNS + STRING_COLUMNS}
+        self.links = {list_name: ([], []) for list_name in LINK_LIST_NAMES}
+        self.names = {list_name: {} for list_name in LINK_LIST_NAMES + ["ranking_list"]}
+        self.rankings = ([], [], [], [])
+        self.player_counts = ([], [], [], [], [])
+        self.values = None
+        self.game_index = -1
+        self._has_player_counts = False
+
+    def start_item(self, bgg_id):
+        self.game_index += 1
+        self.values = {"bgg_id": bgg_id, "thumbnail_url": None, "image_url": None, "name": None}
+        self._has_player_counts = False
+
+    def get_value(self, name):
+        return self.values.get(name)
+
+    def set_value(self, name, value):
+        self.values[name] = value
+
+    def add_link(self, list_name, bgg_id, name):
+        game_indices, bgg_ids = self.links[list_name]
+        game_indices.append(self.game_index)
+        bgg_ids.append(bgg_id)
+        names = self.names[list_name]
+        if bgg_id not in names:
+            names[bgg_id] = name
+
+    def start_player_counts(self):
+        self._has_player_counts = True
+
+    def has_player_counts(self):
+        return self._has_player_counts
+
+    def add_player_count(self, player_count, num_best, num_recommended, num_not_recommended):
+        for column, value in zip(self.player_counts, (self.game_index, player_count, num_best, num_recommended,
+                                                      num_not_recommended)):
+            column.append(value)
+
+    def start_rankings(self):
+        pass
+
+    def add_ranking(self, bgg_id, name, rank, geek_rating):
+        for column, value in zip(self.rankings, (self.game_index, bgg_id, rank, geek_rating)):
+            column.append(value)
+        names = self.names["ranking_list"]
+        if bgg_id not in names:
+            names[bgg_id] = name
+
+    def end_item(self):
+        if self.values["name"] is None:
+            raise CouldNotFindNameException()
+        if not self._has_player_counts:
+            raise CouldNotFindPlayerCountPollException()
+        for column, values in self.columns.items():
+            values.append(self.values[column])
+
+    def get_result(self):
+        columns = {}
+        for column, values in self.columns.items():
+            if column in INTEGER_COLUMNS:
+                columns[column] = np.array(values, dtype=np.int64)
+            elif column in FLOAT_COLUMNS:
+                columns[column] = np.array(values, dtype=np.float64)
+            else:
+                columns[column] = values
+        links = {list_name: {"game_index": np.array(game_indices, dtype=np.int64),
+                             "bgg_id": np.array(bgg_ids, dtype=np.int64)}
+                 for list_name, (game_indices, bgg_ids) in self.links.items()}
+        game_indices, bgg_ids, ranks, geek_ratings = self.rankings
+        rankings = {"game_index": np.array(game_indices, dtype=np.int64), "bgg_id": np.array(bgg_ids, dtype=np.int64),
+                    "rank": np.array([rank if rank is not None else np.nan for rank in ranks], dtype=np.float64),
+                    "geek_rating": np.array([rating if rating is not None else np.nan for rating in geek_ratings],
+                                            dtype=np.float64)}
+        game_indices, player_counts, num_best, num_recommended, num_not_recommended = self.player_counts
+        player_counts = {"game_index": np.array(game_indices, dtype=np.int64), "player_count": player_counts,
+                         "num_best": np.array(num_best, dtype=np.int64),
+                         "num_recommended": np.array(num_recommended, dtype=np.int64),
+                         "num_not_recommended": np.array(num_not_recommended, dtype=np.int64)}
+        return BoardGameBatch(columns, links, self.names, rankings, player_counts)
@@ -0,0 +1,151 @@
+import asyncio
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from data_collection.common.rate_limiter import TokenBucket
+from data_collection.fetch_data.boardgames import BoardGamePageRequest
+from data_collection.fetch_data.columnar import BoardGameBatchBuilder
+from data_collection.fetch_data.plays import TotalPlaysPageRequest
+from data_collection.fetch_data.ratings import RatingsPageRequest
+
+DownloadedBoardGame = namedtuple("DownloadedBoardGame", ["boardgame", "total_plays", "ratings_breakdown"])
+# The columnar version of a list of DownloadedBoardGame, the lists are in the same order as the BoardGameBatch
+DownloadedBatch = namedtuple("DownloadedBatch", ["batch", "total_plays_list", "ratings_breakdown_list"])
+# Statistics of the /thing request of a batch, the duration includes the retries but not the time spent waiting
+# for the rate limiter. from_cache is True if no request was sent (the cache answered or missed in replay-only mode).
+ThingRequestStats = namedtuple("ThingRequestStats", ["duration", "response_size", "num_throttled", "num_errors",
+                                                     "failed", "from_cache"])
+# downloaded: list of DownloadedBoardGame (a DownloadedBatch in columnar mode), skipped: list of game ids, failed: dict of game id -> exception,
+# started: unix timestamp, duration: seconds until the whole batch (including plays and ratings) was downloaded
+BatchResult = namedtuple("BatchResult", ["game_id_list", "downloaded", "skipped", "failed", "thing_request_stats",
+                                         "started", "duration"])
+
+
+class ConcurrentBoardGameDownloader:
+    """
+    Downloads batches of board games while keeping several ``/thing``, ``/plays`` and ``collectionstatsgraph``
+    requests in flight at once.
+
+    The requests are sent from a thread pool with at most ``max_concurrent_requests`` threads and all of them
+    share a single ``TokenBucket``, so the total number of requests per second never exceeds
+    ``requests_per_second`` (retries included).
+
+    :param requests_per_second: the request budget shared by all endpoints
+    :param max_concurrent_requests: the maximum number of requests in flight
+    :param max_batches_in_flight: the maximum number of ``/thing`` batches that are processed at once
+    :param columnar: if ``True`` the board games of a batch are parsed into a columnar ``BoardGameBatch``
+    (see ``data_collection.fetch_data.columnar``) and reported as a ``DownloadedBatch``
+    """
+
+    def __init__(self, requests_per_second=2.0, max_concurrent_requests=8, max_batches_in_flight=2, columnar=False):
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_batches_in_flight = max_batches_in_flight
+        self.columnar = columnar
+
+    def run(self, batches, handle_batch, should_download=None):
+        """
+        Downloads every batch of ``batches`` and calls ``handle_batch`` with a ``BatchResult`` for each of them.
+
+        ``handle_batch`` and ``should_download`` are always called from the calling thread, so it is safe to use
+        a database session in them. ``batches`` is consumed lazily, a new batch is only requested once there is
+        room for it.
+
+        :param batches: an iterable of lists of board game ids
+        :param handle_batch: called with a ``BatchResult`` as soon as a batch is complete
+        :param should_download: called with a board game id after its ``/thing`` entry was downloaded; if it
+        returns ``False`` the plays and ratings are not downloaded and the id is reported as skipped
+        """
+        if should_download is None:
+            should_download = lambda game_id: True
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrent_requests)
+        try:
+            loop.run_until_complete(self._run(loop, executor, batches, handle_batch, should_download))
+        finally:
+            executor.shutdown(wait=True)
+            loop.close()
+
+    async def _run(self, loop, executor, batches, handle_batch, should_download):
+        pending = set()
+        for game_id_list in batches:
+            if len(pending) >= self.max_batches_in_flight:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    handle_batch(task.result())
+            pending.add(loop.create_task(self._download_batch(loop, executor, game_id_list, should_download)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                handle_batch(task.result())
+
+    async def _download_batch(self, loop, executor, game_id_list, should_download):
+        started = time.time()
+        page_request = BoardGamePageRequest(rate_limiter=self.rate_limiter)
+        start_time = [None]  # set by the worker thread, so the time spent in the queue of the executor is excluded
+
+        def get_boardgames():
+            start_time[0] = time.time()
+            if self.columnar:
+                return page_request.get_boardgames(game_id_list, builder=BoardGameBatchBuilder())
+            return page_request.get_boardgames(game_id_list)
+
+        try:
+            boardgames = await loop.run_in_executor(executor, get_boardgames)
+        except Exception as e:
+            print("ERROR: Failed to download the batch {0} ({1})".format(game_id_list, e))
+            return BatchResult(game_id_list=game_id_list, downloaded=[], skipped=[],
+                               failed={game_id: e for game_id in game_id_list},
+                               thing_request_stats=self._get_stats(page_request, start_time[0], failed=True),
+                               started=started, duration=time.time() - started)
+        thing_request_stats = self._get_stats(page_request, start_time[0], failed=False)
+
+        bgg_ids = boardgames.bgg_ids.tolist() if self.columnar else [bg.bgg_id for bg in boardgames]
+        indices_to_download = []
+        skipped = []
+        for index, bgg_id in enumerate(bgg_ids):
+            if should_download(bgg_id):
+                indices_to_download.append(index)
+            else:
+                skipped.append(bgg_id)
+
+        details = await asyncio.gather(*[self._download_details(loop, executor, bgg_ids[index])
+                                         for index in indices_to_download], return_exceptions=True)
+        downloaded_indices = []
+        failed = {}
+        for index, result in zip(indices_to_download, details):
+            if isinstance(result, Exception):
+                print("ERROR: Failed to download the details for game_id={0} ({1})".format(bgg_ids[index], result))
+                failed[bgg_ids[index]] = result
+            else:
+                downloaded_indices.append(index)
+        details = [result for result in details if not isinstance(result, Exception)]
+        if self.columnar:
+            downloaded = DownloadedBatch(batch=boardgames.take(downloaded_indices),
+                                         total_plays_list=[total_plays for total_plays, _ in details],
+                                         ratings_breakdown_list=[ratings_breakdown for _, ratings_breakdown in details])
+        else:
+            downloaded = [DownloadedBoardGame(boardgame=boardgames[index], total_plays=total_plays,
+                                              ratings_breakdown=ratings_breakdown)
+                          for index, (total_plays, ratings_breakdown) in zip(downloaded_indices, details)]
+        return BatchResult(game_id_list=game_id_list, downloaded=downloaded, skipped=skipped, failed=failed,
+                           thing_request_stats=thing_request_stats, started=started, duration=time.time() - started)
+
+    def _get_stats(self, page_request, start_time, failed):
+        duration = time.time() - start_time - page_request.rate_limit_wait_in_seconds
+        return ThingRequestStats(duration=duration, response_size=page_request.last_response_size,
+                                 num_throttled=page_request.num_throttled, num_errors=page_request.num_errors,
+                                 failed=failed, from_cache=page_request.num_requests == 0)
+
+    async def _download_details(self, loop, executor, bgg_id):
+        """
+        Returns a tuple of the total plays and the ratings breakdown of the board game.
+        """
+        total_plays, ratings_breakdown = await asyncio.gather(
+            loop.run_in_executor(executor, TotalPlaysPageRequest(rate_limiter=self.rate_limiter).get_total_plays,
+                                 bgg_id),
+            loop.run_in_executor(executor, RatingsPageRequest(rate_limiter=self.rate_limiter).get_ratings_breakdown,
+                                 bgg_id)
+        )
+        return total_plays, ratings_breakdown
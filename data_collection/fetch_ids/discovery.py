@@ -0,0 +1,130 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from data_collection.common.exceptions import DownloadFailedException, CacheMissException
+from data_collection.common.rate_limiter import TokenBucket
+from data_collection.fetch_ids.config import MIN_VOTERS, MAX_PAGES
+from data_collection.fetch_ids.exceptions import NoEntriesFoundException, TooManyPagesException
+from data_collection.fetch_ids.search import BoardGameIdsPageRequest
+
+# A search of the advanced search, max_voters is None if there is no upper bound
+SearchRange = namedtuple("SearchRange", ["start_year", "end_year", "min_voters", "max_voters"])
+DiscoveryResult = namedtuple("DiscoveryResult", ["num_requests", "num_ids", "num_duplicates", "num_splits",
+                                                 "failed_ranges"])
+
+_PROBE = "probe"
+_PAGE = "page"
+
+
+def create_search_ranges(start_year, end_year, years_per_range=2, min_voters=MIN_VOTERS):
+    """
+    Returns the ``SearchRange``s that cover ``start_year`` to ``end_year`` with ``years_per_range`` years each.
+    """
+    ranges = []
+    for starting_year in range(start_year, end_year + 1, years_per_range):
+        ending_year = min(starting_year + years_per_range - 1, end_year)
+        ranges.append(SearchRange(start_year=starting_year, end_year=ending_year, min_voters=min_voters,
+                                  max_voters=None))
+    return ranges
+
+
+def split_search_range(search_range):
+    """
+    Splits a search range that has too many results into two disjoint ranges: by year if it covers more than
+    one year, otherwise by the number of voters.
+
+    :raises TooManyPagesException: if the range is a single year and a single number of voters
+    """
+    if search_range.start_year < search_range.end_year:
+        middle_year = (search_range.start_year + search_range.end_year + 1) // 2
+        return [search_range._replace(end_year=middle_year - 1), search_range._replace(start_year=middle_year)]
+    min_voters = search_range.min_voters
+    if search_range.max_voters is None:
+        # Most board games have few voters, so the open upper band is split off at twice the lower bound
+        middle_voters = max(2 * min_voters, min_voters + 1)
+    elif search_range.max_voters > min_voters:
+        middle_voters = (min_voters + search_range.max_voters + 1) // 2
+    else:
+        raise TooManyPagesException("Cannot split {0} any further".format(search_range))
+    return [search_range._replace(max_voters=middle_voters - 1), search_range._replace(min_voters=middle_voters)]
+
+
+class BoardGameIdDiscovery:
+    """
+    Downloads the ids of all board games of several ``SearchRange``s of the advanced search at once.
+
+    Every range is first probed at page ``MAX_PAGES``: if that page has entries the range is too broad for the
+    advanced search and it is split (see ``split_search_range``), otherwise its pages are downloaded one after
+    another until a page is empty. The ranges are processed concurrently by up to ``max_concurrent_requests``
+    threads that share a single ``TokenBucket``. The ids are streamed to the writer as soon as a page arrives.
+
+    :param requests_per_second: the request budget shared by all threads
+    :param max_concurrent_requests: the maximum number of requests in flight
+    """
+
+    def __init__(self, requests_per_second=1.0, max_concurrent_requests=4):
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.max_concurrent_requests = max_concurrent_requests
+
+    def run(self, search_ranges, writer):
+        """
+        Downloads the ids of all ``search_ranges`` and writes them with ``writer`` (e.g., a
+        ``DeduplicatingCSVWriter``). The writer is only used from the calling thread.
+
+        :return: a ``DiscoveryResult``, ranges whose download failed are listed in ``failed_ranges``
+        :raises TooManyPagesException: if a range has too many results and cannot be split any further
+        """
+        num_requests = 0
+        num_ids = 0
+        num_splits = 0
+        failed_ranges = []
+        num_duplicates_before = getattr(writer, "num_duplicates", 0)
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+            tasks = {}  # maps the futures to their (task, search range, page)
+            for search_range in search_ranges:
+                self._submit(executor, tasks, _PROBE, search_range, MAX_PAGES)
+            while tasks:
+                done, _ = wait(tasks.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    task, search_range, page = tasks.pop(future)
+                    num_requests += 1
+                    try:
+                        data = future.result()
+                    except (DownloadFailedException, CacheMissException) as e:
+                        print("ERROR: Failed to download page {0} of {1} ({2})".format(page, search_range, e))
+                        failed_ranges.append(search_range)
+                        continue
+
+                    if task == _PROBE:
+                        if data:
+                            num_splits += 1
+                            for sub_range in split_search_range(search_range):
+                                self._submit(executor, tasks, _PROBE, sub_range, MAX_PAGES)
+                        else:
+                            self._submit(executor, tasks, _PAGE, search_range, 1)
+                    elif data:
+                        num_ids += writer.write(data)
+                        print("\tPage {0} of {1} successful!".format(page, _format_range(search_range)))
+                        # The probe made sure that page MAX_PAGES is empty
+                        if page + 1 < MAX_PAGES:
+                            self._submit(executor, tasks, _PAGE, search_range, page + 1)
+        return DiscoveryResult(num_requests=num_requests, num_ids=num_ids,
+                               num_duplicates=getattr(writer, "num_duplicates", 0) - num_duplicates_before,
+                               num_splits=num_splits, failed_ranges=failed_ranges)
+
+    def _submit(self, executor, tasks, task, search_range, page):
+        tasks[executor.submit(self._get_ids, search_range, page)] = (task, search_range, page)
+
+    def _get_ids(self, search_range, page):
+        try:
+            return BoardGameIdsPageRequest(rate_limiter=self.rate_limiter).get_ids(
+                page, search_range.start_year, search_range.end_year, min_voters=search_range.min_voters,
+                max_voters=search_range.max_voters)
+        except NoEntriesFoundException:
+            return []
+
+
+def _format_range(search_range):
+    voters = "{0}+".format(search_range.min_voters) if search_range.max_voters is None else \
+        "{0}-{1}".format(search_range.min_voters, search_range.max_voters)
+    return "from={0} to={1} voters={2}".format(search_range.start_year, search_range.end_year, voters)
@@ -27,6 +27,62 @@ class CSVWriter:
                 writer.writerow(row)
 
 
+class DeduplicatingCSVWriter:
+    """
+    Streams rows into a single CSV file and drops every row whose id (the first column) was written before.
+
+    The file is opened once and kept open until ``close`` is called. If the file already exists, the ids in it
+    are read first and new rows are appended, so an interrupted discovery can simply be run again.
+
+    :param file_path: the path of the CSV file
+    :param columns: the header of the file, defaults to ``["game_id", "name", "url"]``
+    """
+
+    def __init__(self, file_path, columns=None):
+        if columns is None:
+            columns = ["game_id", "name", "url"]
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.file_path = file_path
+        self.seen_ids = set()
+        self.num_written = 0
+        self.num_duplicates = 0
+        is_new_file = not os.path.exists(file_path)
+        if not is_new_file:
+            self.seen_ids = {str(entry.id) for entry in CSVReader().read(file_path)}
+        self._csvfile = open(file_path, "w" if is_new_file else "a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._csvfile, delimiter=";")
+        if is_new_file:
+            self._writer.writerow(columns)
+
+    def write(self, data):
+        """
+        Writes the rows whose id was not written yet and returns how many rows were written.
+        """
+        num_written = 0
+        for row in data:
+            row_id = str(row[0])
+            if row_id in self.seen_ids:
+                self.num_duplicates += 1
+                continue
+            self.seen_ids.add(row_id)
+            self._writer.writerow(row)
+            num_written += 1
+        self._csvfile.flush()
+        self.num_written += num_written
+        return num_written
+
+    def close(self):
+        self._csvfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 Entry = namedtuple("Entry", ["id", "name", "url"])
 
 
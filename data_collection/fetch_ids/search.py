@@ -0,0 +1,48 @@
+import re
+
+from bs4 import BeautifulSoup
+
+from data_collection.common.page_request import PageRequest
+from data_collection.fetch_ids.config import ROOT_URL, ENTRY_URL_PATTERN_GET_ID, MIN_VOTERS, MAX_PAGES
+from data_collection.fetch_ids.exceptions import NoEntriesFoundException, TooManyPagesException
+
+
+class BoardGameIdsPageRequest(PageRequest):
+
+    def get_ids(self, page, start_year, end_year, min_voters=MIN_VOTERS, max_voters=None):
+        """
+        Returns the board games on the given page of the advanced search as a list of ``[game_id, name, url]``.
+
+        :param max_voters: the maximum number of voters, ``None`` for no upper bound
+        :raises NoEntriesFoundException: if the page has no entries (i.e., the previous page was the last one)
+        :raises TooManyPagesException: if ``page`` exceeds ``MAX_PAGES``
+        """
+        url = ROOT_URL.format(page=page, start_year=start_year, end_year=end_year, min_voters=min_voters,
+                              max_voters=max_voters if max_voters is not None else "")
+        entry_id_regex = re.compile(ENTRY_URL_PATTERN_GET_ID)
+
+        if page == MAX_PAGES + 1:
+            raise TooManyPagesException()
+
+        result = self.request(url, sender="BoardGameIdsPageRequest", page=page, start_year=start_year,
+                              end_year=end_year, min_voters=min_voters, max_voters=max_voters)
+        soup = BeautifulSoup(result.text, "html.parser")
+
+        entries = soup.find_all("tr", id="row_")
+        if len(entries) == 0:
+            raise NoEntriesFoundException()
+
+        data = []
+        for index, entry in enumerate(entries):
+            try:
+                a_tag = entry.find("td", class_="collection_objectname").find("a")
+                name = a_tag.get_text()
+                link = a_tag.get("href")
+                match = entry_id_regex.search(str(link))
+                game_id = match[1]
+                data.append([game_id, name, str(link)])
+            except Exception:
+                print("ERROR: skipped entry no. {0} at page {1} from={2} to={3}".format(index, page, start_year,
+                                                                                       end_year))
+                continue
+        return data
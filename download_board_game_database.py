@@ -1,151 +1,265 @@
+import datetime
 import time
 
-from sqlalchemy import create_engine, exists
+from sqlalchemy import exists
 from sqlalchemy.orm import sessionmaker
 from collections import namedtuple
 
 from data_collection.fetch_data.boardgames import BoardGamePageRequest
 from data_collection.fetch_data.plays import TotalPlaysPageRequest
 from data_collection.fetch_data.ratings import RatingsPageRequest
+from data_collection.fetch_data.concurrent_download import ConcurrentBoardGameDownloader, DownloadedBoardGame, \
+    DownloadedBatch
+from data_collection.fetch_data.batch_sizing import AdaptiveBatchSizer
+from data_collection.common.page_request import set_default_cache
+from data_collection.common.response_cache import ResponseCache
 from data_collection.database.tables import *
-from data_collection.database.utils import get_or_create
+from data_collection.database.bulk_insert import BulkWriter
+from data_collection.database.utils import DimensionCache
+from data_collection.database.storage import create_tuned_engine, prepare_database, analyze
+from data_collection.database.history import HistoryStore
+from data_collection.database.journal import CrawlJournal, SUCCESS, ERROR, EXISTS
+from data_collection.database.refresh import RefreshWriter, select_refresh_candidates, \
+    get_max_games_for_request_budget, get_requests_per_batch, BY_STALENESS
 from data_collection.fetch_ids.file_parsing import CSVReader
 
-SUCCESS = 1
-ERROR = 0
-EXISTS = 2
 
-
-def download_data(game_id_list, url_dict, session):
-    boardgame_list = BoardGamePageRequest().get_boardgames(game_id_list)
+def download_data(game_id_list, url_dict, session, batch_sizer=None, writer=None):
+    page_request = BoardGamePageRequest()
+    start_time = time.time()
+    boardgame_list = page_request.get_boardgames(game_id_list)
+    if batch_sizer is not None and page_request.num_requests > 0:  # the cache says nothing about the API
+        batch_sizer.record(len(game_id_list), time.time() - start_time, response_size=page_request.last_response_size,
+                           num_throttled=page_request.num_throttled, num_errors=page_request.num_errors)
 
     status_dict = {}
+    downloaded_list = []
     for bg in boardgame_list:
         game_id = bg.bgg_id
 
-        if session.query(exists().where(BoardGame.bgg_id == game_id)).scalar():
+        if boardgame_exists(session, game_id):
             status_dict[game_id] = EXISTS
             continue
 
         total_plays = TotalPlaysPageRequest().get_total_plays(game_id)
         ratings_dict = RatingsPageRequest().get_ratings_breakdown(game_id)
 
-        boardgame = BoardGame(bgg_id=game_id, url=url_dict[game_id], thumbnail_url=bg.thumbnail_url,
-                              image_url=bg.image_url, name=bg.name,
-                              description=bg.description, year_published=bg.year_published, min_players=bg.min_players,
-                              max_players=bg.max_players, playtime=bg.playtime, min_playtime=bg.min_playtime,
-                              max_playtime=bg.max_playtime, min_age=bg.min_age, num_ratings=bg.num_ratings,
-                              avg_rating=bg.avg_rating, num_owning=bg.num_owning, num_trading=bg.num_trading,
-                              num_wanting=bg.num_wanting, num_wishing=bg.num_wishing, num_weights=bg.num_weights,
-                              avg_weight=bg.avg_weight, total_plays=total_plays)
-        session.add(boardgame)
-        session.flush()
-
-        category_list = bg.category_list
-        for element in category_list:
-            category, created = get_or_create(session, Category, bgg_id=element.bgg_id, name=element.name)
-            category_to_boardgame = CategoryToBoardGame(category_id=category.id, boardgame_id=boardgame.id)
-            session.add(category_to_boardgame)
-
-        mechanic_list = bg.mechanic_list
-        for element in mechanic_list:
-            mechanic, created = get_or_create(session, Mechanic, bgg_id=element.bgg_id, name=element.name)
-            mechanic_to_boardgame = MechanicToBoardGame(mechanic_id=mechanic.id, boardgame_id=boardgame.id)
-            session.add(mechanic_to_boardgame)
-
-        family_list = bg.family_list
-        for element in family_list:
-            family, created = get_or_create(session, Family, bgg_id=element.bgg_id, name=element.name)
-            family_to_boardgame = FamilyToBoardGame(family_id=family.id, boardgame_id=boardgame.id)
-            session.add(family_to_boardgame)
-
-        designer_list = bg.designer_list
-        for element in designer_list:
-            designer, created = get_or_create(session, Designer, bgg_id=element.bgg_id, name=element.name)
-            designer_to_boardgame = DesignerToBoardGame(designer_id=designer.id, boardgame_id=boardgame.id)
-            session.add(designer_to_boardgame)
-
-        artist_list = bg.artist_list
-        for element in artist_list:
-            artist, created = get_or_create(session, Designer, bgg_id=element.bgg_id, name=element.name)
-            artist_to_boardgame = ArtistToBoardGame(artist_id=artist.id, boardgame_id=boardgame.id)
-            session.add(artist_to_boardgame)
-
-        publisher_list = bg.publisher_list
-        for element in publisher_list:
-            publisher, created = get_or_create(session, Publisher, bgg_id=element.bgg_id, name=element.name)
-            publisher_to_boardgame = PublisherToBoardGame(publisher_id=publisher.id, boardgame_id=boardgame.id)
-            session.add(publisher_to_boardgame)
-
-        player_count_list = bg.player_count_list
-        for element in player_count_list:
-            player_count_to_boardgame = PlayerCountToBoardGame(boardgame_id=boardgame.id, player_count=element.player_count,
-                                                               num_best=element.num_best,
-                                                               num_recommended=element.num_recommended,
-                                                               num_not_recommended=element.num_not_recommended)
-            session.add(player_count_to_boardgame)
-
-        ranking_list = bg.ranking_list
-        for element in ranking_list:
-            ranktype, created = get_or_create(session, RankType, bgg_id=element.bgg_id, name=element.name)
-            boardgame_ranking = BoardGameRanking(boardgame_id=boardgame.id, ranktype_id=ranktype.id, rank=element.rank,
-                                                 geek_rating=element.geek_rating)
-            session.add(boardgame_ranking)
-
-        ratings_breakdown = RatingsBreakdown(boardgame_id=boardgame.id, num_10=ratings_dict[10], num_9=ratings_dict[9],
-                                             num_8=ratings_dict[8], num_7=ratings_dict[7], num_6=ratings_dict[6],
-                                             num_5=ratings_dict[5], num_4=ratings_dict[4], num_3=ratings_dict[3],
-                                             num_2=ratings_dict[2], num_1=ratings_dict[1])
-        session.add(ratings_breakdown)
+        downloaded_list.append(DownloadedBoardGame(boardgame=bg, total_plays=total_plays,
+                                                   ratings_breakdown=ratings_dict))
+        time.sleep(0.5)
+    writer = writer if writer is not None else BulkWriter(session)
+    status_dict.update(store_boardgames(writer, downloaded_list, url_dict))
+    status_dict.update({game_id: ERROR for game_id in game_id_list if game_id not in status_dict})
+    return status_dict
+
+
+def download_data_concurrently(entries, session, batch_sizer, requests_per_second, max_concurrent_requests,
+                               writer=None, journal=None, columnar=False):
+    """
+    Downloads all ``entries`` with a ``ConcurrentBoardGameDownloader``, i.e., several batches and the plays and
+    ratings of their board games are downloaded at once while sharing a budget of ``requests_per_second``.
+    The board games are stored (one transaction per batch) as soon as their batch is complete and the
+    ``batch_sizer`` chooses the size of the next batch based on how the ``/thing`` request of the batch went.
+    Every batch is recorded in the ``journal``. With ``columnar`` the batches are parsed into columnar
+    ``BoardGameBatch``es instead of one ``BoardGameContainer`` per board game.
+    """
+    writer = writer if writer is not None else BulkWriter(session)
+    journal = journal if journal is not None else CrawlJournal(session)
+    stored_bgg_ids = journal.get_stored_bgg_ids()
+    url_dict = {entry.id: entry.url for entry in entries}
+    batches = batch_sizer.iter_batches([entry.id for entry in entries])
+    progress = {"count": 0, "start_time": time.time()}
+
+    def handle_batch(batch_result):
+        record_batch(batch_sizer, batch_result)
+        status_dict = {game_id: EXISTS for game_id in batch_result.skipped}
+        status_dict.update({game_id: ERROR for game_id in batch_result.failed})
+        status_dict.update(store_boardgames(writer, batch_result.downloaded, url_dict))
+        messages = dict(batch_result.failed)
+        for game_id in batch_result.game_id_list:
+            if game_id not in status_dict:
+                status_dict[game_id] = ERROR
+                messages[game_id] = "Not returned by the API"
+        stored_bgg_ids.update(game_id for game_id, status in status_dict.items() if status == SUCCESS)
+        journal.record_batch(status_dict, batch_result.started, batch_result.duration, messages=messages)
+        print_status(status_dict)
+        progress["count"] += len(batch_result.game_id_list)
+        print("Progress: {0}/{1} ({2:.1f} seconds, next batch size {3})".format(
+            progress["count"], len(entries), time.time() - progress["start_time"], batch_sizer.batch_size))
+
+    downloader = ConcurrentBoardGameDownloader(requests_per_second=requests_per_second,
+                                               max_concurrent_requests=max_concurrent_requests, columnar=columnar)
+    downloader.run(batches, handle_batch, should_download=lambda game_id: game_id not in stored_bgg_ids)
 
+
+def refresh_data_concurrently(candidates, session, batch_sizer, requests_per_second, max_concurrent_requests,
+                              refresher=None, journal=None, request_budget=None):
+    """
+    Downloads the board games of ``candidates`` (a list of ``(bgg_id, url)``) again like
+    ``download_data_concurrently`` and updates what changed with a ``RefreshWriter``.
+
+    With a ``request_budget`` no new batch is started once the requests sent so far (retries included, cached
+    responses excluded) and the requests the batches in flight and the next batch may still need would exceed
+    it, the remaining candidates are left for the next run.
+    """
+    refresher = refresher if refresher is not None else RefreshWriter(session)
+    journal = journal if journal is not None else CrawlJournal(session)
+    progress = {"count": 0, "changed": 0, "start_time": time.time(), "reserved_requests": 0}
+    downloader = ConcurrentBoardGameDownloader(requests_per_second=requests_per_second,
+                                               max_concurrent_requests=max_concurrent_requests)
+
+    def iter_batches_within_budget():
+        for game_id_list in batch_sizer.iter_batches([bgg_id for bgg_id, url in candidates]):
+            if request_budget is not None:
+                num_requests = get_requests_per_batch(len(game_id_list))
+                if downloader.rate_limiter.num_acquired + progress["reserved_requests"] + num_requests > \
+                        request_budget:
+                    print("Stopped after {0} requests, the budget of {1} requests is spent".format(
+                        downloader.rate_limiter.num_acquired, request_budget))
+                    return
+                progress["reserved_requests"] += num_requests
+            yield game_id_list
+
+    def handle_batch(batch_result):
+        if request_budget is not None:
+            progress["reserved_requests"] -= get_requests_per_batch(len(batch_result.game_id_list))
+        record_batch(batch_sizer, batch_result)
+        status_dict = {game_id: ERROR for game_id in batch_result.game_id_list}
+        messages = dict(batch_result.failed)
         try:
-            session.commit()
-            status_dict[game_id] = SUCCESS
+            changes = refresher.refresh(batch_result.downloaded)
+            status_dict.update({game_id: SUCCESS for game_id in changes.keys()})
+            progress["changed"] += sum(1 for num_changes in changes.values() if num_changes > 0)
         except Exception as e:
-            session.rollback()
-            status_dict[game_id] = ERROR
-        time.sleep(0.5)
+            print("ERROR: Failed to refresh the batch {0} ({1})".format(batch_result.game_id_list, e))
+            messages.update({downloaded.boardgame.bgg_id: e for downloaded in batch_result.downloaded})
+        journal.record_batch(status_dict, batch_result.started, batch_result.duration, messages=messages)
+        progress["count"] += len(batch_result.game_id_list)
+        print("Refreshed: {0}/{1}, {2} changed ({3:.1f} seconds, next batch size {4})".format(
+            progress["count"], len(candidates), progress["changed"], time.time() - progress["start_time"],
+            batch_sizer.batch_size))
+
+    downloader.run(iter_batches_within_budget(), handle_batch)
+
+
+def record_batch(batch_sizer, batch_result):
+    """
+    Lets the ``batch_sizer`` adapt to how the ``/thing`` request of the batch went. Batches that were answered by
+    the cache are not recorded, they are fast no matter how large they are.
+    """
+    stats = batch_result.thing_request_stats
+    if stats.from_cache:
+        return
+    batch_sizer.record(len(batch_result.game_id_list), stats.duration, response_size=stats.response_size,
+                       num_throttled=stats.num_throttled, num_errors=stats.num_errors, failed=stats.failed)
+
+
+def print_status(status_dict):
+    for key, status in status_dict.items():
+        if status == SUCCESS:
+            print("\tSuccessfully added {:7d} to the database!".format(key))
+        elif status == ERROR:
+            print("\tERROR: Failed to add {:7d} to the database!".format(key))
+        elif status == EXISTS:
+            print("\tSkipped {:7d}, already exists!".format(key))
+        else:
+            print("\tWARNING: Unknown status for {0}!".format(key))
+
+
+def boardgame_exists(session, game_id):
+    return session.query(exists().where(BoardGame.bgg_id == game_id)).scalar()
+
+
+def store_boardgames(writer, downloaded_list, url_dict):
+    """
+    Stores a batch of ``DownloadedBoardGame`` (or a ``DownloadedBatch``) with the ``BulkWriter`` (a single
+    transaction per batch).
+
+    :return: a dictionary that maps the board game ids to ``SUCCESS`` or ``ERROR``
+    """
+    if isinstance(downloaded_list, DownloadedBatch):
+        succeeded, failed = writer.write_batch(downloaded_list.batch, downloaded_list.total_plays_list,
+                                               downloaded_list.ratings_breakdown_list, url_dict)
+    else:
+        succeeded, failed = writer.write(downloaded_list, url_dict)
+    status_dict = {game_id: SUCCESS for game_id in succeeded}
+    status_dict.update({game_id: ERROR for game_id in failed})
     return status_dict
 
 
 if __name__ == "__main__":
     DATABASE_NAME = "test.db"
+    CONCURRENT = True  # if False, every board game is downloaded one after another
+    REQUESTS_PER_SECOND = 2.0  # shared by all endpoints, only used if CONCURRENT
+    MAX_CONCURRENT_REQUESTS = 8  # only used if CONCURRENT
+    COLUMNAR = True  # only used if CONCURRENT, parses every batch into columns instead of one object per board game
+    MAX_BATCH_SIZE = 100  # upper bound of the number of ids per /thing request, the actual size adapts
+    CACHE_DIRECTORY = "data/cache"  # None disables the response cache
+    REPLAY_ONLY = False  # if True, only cached responses are used and the network is never touched
+    REFRESH = False  # if True, the stored board games are refreshed instead of downloading new ones
+    REFRESH_REQUEST_BUDGET = 20000  # only used if REFRESH
+    REFRESH_ORDER = BY_STALENESS  # only used if REFRESH, either BY_STALENESS or BY_POPULARITY
+    REFRESH_MAX_CACHE_AGE_IN_SECONDS = 12 * 60 * 60  # only used if REFRESH, older cached responses are ignored
+    HISTORY_DATABASE_NAME = "history.db"  # the changes of every run are recorded in it, None disables the history
 
     Entry = namedtuple("Entry", ["id", "name", "url"])
 
     entries = CSVReader().read(file_path="data/ids/ids_1990-to-2018_min-20_2018-05-07.csv")
 
-    engine = create_engine("sqlite:///data/database/{0}".format(DATABASE_NAME))
-    create_all_tables(engine)
+    if CACHE_DIRECTORY is not None and REFRESH:
+        set_default_cache(ResponseCache(directory=CACHE_DIRECTORY, replay_only=REPLAY_ONLY, ttl_by_endpoint={},
+                                        default_ttl=REFRESH_MAX_CACHE_AGE_IN_SECONDS))
+    elif CACHE_DIRECTORY is not None:
+        set_default_cache(ResponseCache(directory=CACHE_DIRECTORY, replay_only=REPLAY_ONLY))
+
+    engine = create_tuned_engine("sqlite:///data/database/{0}".format(DATABASE_NAME))
+    prepare_database(engine)
     Session = sessionmaker(bind=engine)
     session = Session()
+    dimension_cache = DimensionCache.load(session)
+    writer = BulkWriter(session, dimension_cache=dimension_cache)
+    print("Loaded {0} categories, mechanics, etc. into the cache".format(len(dimension_cache)))
+
+    if REFRESH:
+        batch_sizer = AdaptiveBatchSizer(max_batch_size=MAX_BATCH_SIZE)
+        # The batches start at the initial batch size and may shrink, the budget is also enforced while refreshing
+        max_games = get_max_games_for_request_budget(REFRESH_REQUEST_BUDGET, batch_sizer.batch_size)
+        candidates = select_refresh_candidates(session, max_games, order_by=REFRESH_ORDER)
+        print("Refreshing {0} board games...".format(len(candidates)))
+        refresh_data_concurrently(candidates, session, batch_sizer, REQUESTS_PER_SECOND, MAX_CONCURRENT_REQUESTS,
+                                  refresher=RefreshWriter(session, dimension_cache=dimension_cache),
+                                  request_budget=REFRESH_REQUEST_BUDGET)
+    else:
+        # Restarting is safe, every board game that is already stored is skipped before any request is sent
+        journal = CrawlJournal(session)
+        entries = journal.filter_entries(entries)
 
-    size = len(entries)
-    progress = 0  # also the start index
-    step_size = 15
-    print("Starting!\n")
-    print("Progress: {0}/{1}".format(progress, size))
-    for start_index in range(progress, len(entries), step_size):
-        start_time = time.time()
-        end_index = start_index + step_size if start_index + step_size <= len(entries) else len(entries)
-        entries_subset = entries[start_index:end_index]
-
-        id_list = [entry.id for entry in entries_subset]
-        url_dict = {entry.id: entry.url for entry in entries_subset}
-
-        status_dict = download_data(id_list, url_dict, session)
-        for key, status in status_dict.items():
-            if status == SUCCESS:
-                print("\tSuccessfully added {:7d} to the database!".format(key))
-            elif status == ERROR:
-                print("\tERROR: Failed to add {:7d} to the database!".format(key))
-            elif status == EXISTS:
-                print("\tSkipped {:7d}, already exists!".format(key))
-            else:
-                print("\tWARNING: Unknown status for {0}!".format(key))
-        print("Step took {0} seconds (size of {1})".format(time.time() - start_time, step_size))
-        progress += (end_index - start_index)
+        size = len(entries)
+        progress = 0
+        batch_sizer = AdaptiveBatchSizer(initial_batch_size=15, max_batch_size=MAX_BATCH_SIZE,
+                                         log_filename="batches_{0}.csv".format(DATABASE_NAME))
+        print("Starting! Skipped the board games that are already stored.\n")
         print("Progress: {0}/{1}".format(progress, size))
+        if CONCURRENT:
+            download_data_concurrently(entries, session, batch_sizer, REQUESTS_PER_SECOND, MAX_CONCURRENT_REQUESTS,
+                                       writer=writer, journal=journal, columnar=COLUMNAR)
+        else:
+            url_dict = {entry.id: entry.url for entry in entries}
+            for id_list in batch_sizer.iter_batches([entry.id for entry in entries]):
+                start_time = time.time()
+                status_dict = download_data(id_list, url_dict, session, batch_sizer=batch_sizer, writer=writer)
+                journal.record_batch(status_dict, start_time, time.time() - start_time)
+                print_status(status_dict)
+                print("Step took {0} seconds (size of {1})".format(time.time() - start_time, len(id_list)))
+                progress += len(id_list)
+                print("Progress: {0}/{1}".format(progress, size))
 
     print("\nDone!")
+    print("Dimension cache: {0} hits, {1} misses".format(dimension_cache.hits, dimension_cache.misses))
     session.close()
+    analyze(engine)
+
+    if HISTORY_DATABASE_NAME is not None:
+        history = HistoryStore("sqlite:///data/database/{0}".format(HISTORY_DATABASE_NAME))
+        num_changes = history.record_crawl(engine, datetime.datetime.now(), source=DATABASE_NAME)
+        print("Recorded {0} changed values in the history".format(num_changes))
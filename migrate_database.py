@@ -0,0 +1,10 @@
+from data_collection.database.storage import create_tuned_engine, prepare_database, get_schema_version, analyze
+
+if __name__ == "__main__":
+    DATABASE_NAME = "data_2018-05-10.db"
+
+    engine = create_tuned_engine("sqlite:///data/database/{0}".format(DATABASE_NAME))
+    print("Schema version before: {0}".format(get_schema_version(engine)))
+    prepare_database(engine)
+    analyze(engine)
+    print("Schema version after: {0}".format(get_schema_version(engine)))
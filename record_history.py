@@ -0,0 +1,15 @@
+from data_collection.database.history import HistoryStore
+from data_collection.database.storage import create_tuned_engine
+
+if __name__ == "__main__":
+    HISTORY_DATABASE_NAME = "history.db"
+    # (database of the crawl, date of the crawl), in chronological order
+    CRAWLS = [
+        ("data_2018-05-10.db", "2018-05-10"),
+    ]
+
+    history = HistoryStore("sqlite:///data/database/{0}".format(HISTORY_DATABASE_NAME))
+    for database_name, crawl_date in CRAWLS:
+        engine = create_tuned_engine("sqlite:///data/database/{0}".format(database_name))
+        num_changes = history.record_crawl(engine, crawl_date, source=database_name)
+        print("{0}: recorded {1} changed values".format(crawl_date, num_changes))
@@ -0,0 +1,26 @@
+import time
+
+from analysis.minhash import MinHashIndex
+from analysis.service import SimilarGamesService, load_metadata, create_server
+from data_collection.database.storage import create_tuned_engine
+
+if __name__ == "__main__":
+    DATABASE_NAME = "data_2018-05-10.db"
+    INDEX_PATH = "data/similarity/minhash.npz"  # see create_similarity_index.py
+    HOST = "127.0.0.1"
+    PORT = 8000
+
+    start_time = time.time()
+    index = MinHashIndex.load(INDEX_PATH)
+    engine = create_tuned_engine("sqlite:///data/database/{0}".format(DATABASE_NAME))
+    service = SimilarGamesService(index, load_metadata(engine, index.bgg_ids))
+    print("Loaded {0} board games in {1:.1f} seconds".format(len(index.bgg_ids), time.time() - start_time))
+
+    server = create_server(service, host=HOST, port=PORT)
+    print("Serving on http://{0}:{1}/similar?bgg_id=<id> (statistics on /stats)".format(HOST, PORT))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()